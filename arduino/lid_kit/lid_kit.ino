@@ -5,7 +5,8 @@
 #include <Wire.h>
 
 #define I2C_ADDRESS 0x69
-#define KEYPAD_REGISTER = 0x23
+// Two byte write {KEYPAD_ACK, seq}: the master has every key up to and including seq, drop them
+#define KEYPAD_ACK 0x23
 
 // Set up keypad
 #define NROWS 4
@@ -20,10 +21,15 @@ byte rows_pins[NROWS] = {5, 7, 12, 13};
 byte cols_pins[NCOLS] = {A0, A1, A2};
 Keypad keypad = Keypad(makeKeymap(keys), rows_pins, cols_pins, NROWS, NCOLS);
 
-// Keypress buffer
-#define BUFLEN 16
+// Keypress ring buffer. Keys stay in it until the master acks them, so a failed read loses nothing.
+// key_seq is the sequence number of the oldest key, it goes up by one for every key acked or dropped.
+#define BUFLEN 64
 char key_buffer[BUFLEN];
-int buffer_count = 0;
+volatile byte buffer_head = 0;
+volatile byte buffer_count = 0;
+volatile byte key_seq = 0;
+// A read frame is {count, seq, keys...}, the Wire buffer holds 32 bytes
+#define MAX_FRAME_KEYS 30
 
 // LED Pins and 8-bit color scaling (which I made up, feel free to tweak)
 #define LEDR 9
@@ -50,20 +56,33 @@ void loop() {
   keypad.getKey();
 }
 
-// On I2C read, return buffered characters, or a single "." for no keypress
+// Drop the n oldest keys
+void drop_keys(byte n) {
+  if (n > buffer_count)
+    n = buffer_count;
+  buffer_head = (buffer_head + n) % BUFLEN;
+  buffer_count -= n;
+  key_seq += n;
+}
+
+// Drop every key up to and including sequence number seq. An ack for keys that were already dropped because the
+// buffer was full falls behind key_seq and drops nothing.
+void ack_keys(byte seq) {
+  byte n = seq - key_seq;
+  if (n < buffer_count)
+    drop_keys(n + 1);
+}
+
+// On I2C read, return a frame of the pending keys: count, sequence number of the first key, keys.
+// The master reads the count byte alone when polling and only as many keys as there are.
 void i2c_request() {
-  Serial.write("KEY: ");
-  if (buffer_count > 0) {
-    Wire.write(key_buffer);
-    Serial.write(key_buffer);
-    // Clear buffer so string termination is automatic
-    while (buffer_count > 0)
-      key_buffer[--buffer_count] = 0;
-  } else {
-    Serial.write(key_buffer);
-    Wire.write(".");
-  }
-  Serial.write("\n\r");
+  byte frame[MAX_FRAME_KEYS + 2];
+  byte count = buffer_count < MAX_FRAME_KEYS ? buffer_count : MAX_FRAME_KEYS;
+  frame[0] = count;
+  frame[1] = key_seq;
+  for (byte i = 0; i < count; i++)
+    frame[i + 2] = key_buffer[(buffer_head + i) % BUFLEN];
+  Wire.write(frame, count + 2);
 }
 
 // On I2C write, receive a value and light the LED
@@ -80,6 +99,12 @@ void i2c_receive(int byte_count) {
     analogWrite(LEDG, led3bit[b & 0x07]);
     b >>= 3;
     analogWrite(LEDR, led3bit[b & 0x07]);
+  } else if (byte_count == 2) {
+    // Register write, only the keypad ack is defined
+    byte reg = Wire.read();
+    byte seq = Wire.read();
+    if (reg == KEYPAD_ACK)
+      ack_keys(seq);
   } else if (byte_count == 3) {
     // If 3 bytes sent, interpret as raw values
     analogWrite(LEDR, 255 - Wire.read());
@@ -92,11 +117,15 @@ void i2c_receive(int byte_count) {
   }
 }
 
-// When a debounced keypress is detected, add it to the buffer
+// When a debounced keypress is detected, add it to the buffer.
+// If the buffer is full the oldest key is dropped, the jump in sequence number tells the master.
 void keypad_event(KeypadEvent key) {
   if (keypad.getState() == PRESSED) {
-    if (buffer_count < BUFLEN) {
-      key_buffer[buffer_count++] = key;
-    }
+    noInterrupts();
+    if (buffer_count == BUFLEN)
+      drop_keys(1);
+    key_buffer[(buffer_head + buffer_count) % BUFLEN] = key;
+    buffer_count++;
+    interrupts();
   }
 }
@@ -1 +1,2 @@
+from Project_Theseus_API.i2c.bus_arbiter import BusArbiter, Priority
 from Project_Theseus_API.i2c.i2c_module import I2CModule
@@ -0,0 +1,171 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from smbus2 import SMBus
+
+from Project_Theseus_API.i2c.bus_arbiter import BusArbiter
+from Project_Theseus_API.i2c.i2c_module import I2CModule
+from Project_Theseus_API.i2c.laser_i2c import LaserControl
+from Project_Theseus_API.i2c.lid_kit import ArduinoI2C, COLOR
+from Project_Theseus_API.i2c.lock_i2c import BoxLock
+from Project_Theseus_API.i2c.receptors_i2c import ReceptorControl
+from Project_Theseus_API.i2c.sevenseg import SevenSeg
+from Project_Theseus_API.i2c.switches_i2c import SwitchesI2C
+
+
+class AsyncBus:
+    """
+    The executor behind the async drivers. Driver calls run one at a time on its thread, and each bus transaction they
+    make is queued on the BusArbiter like any other driver's, so a driver that holds a lock across a transaction can
+    also be used from other threads.
+    """
+
+    def __init__(self, bus):
+        """
+        :param bus: A BusArbiter, or an SMBus to give to a new one
+        """
+        self.arbiter = bus if isinstance(bus, BusArbiter) else BusArbiter(bus)
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='async-bus')
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on the executor thread
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    def close(self):
+        self._executor.shutdown()
+        self.arbiter.close()
+
+
+def _forward(name: str):
+    async def method(self, *args, **kwargs):
+        return await self.run(getattr(self.device, name), *args, **kwargs)
+
+    method.__name__ = name
+    return method
+
+
+def _forward_get(name: str):
+    async def method(self):
+        return await self.run(getattr, self.device, name)
+
+    method.__name__ = name
+    return method
+
+
+def _forward_set(name: str):
+    async def method(self, value):
+        return await self.run(setattr, self.device, name, value)
+
+    method.__name__ = 'set_' + name
+    return method
+
+
+class AsyncI2CModule:
+    """
+    Wraps a driver so each of its calls is awaited instead of blocking the event loop
+    """
+    SYNC = I2CModule
+
+    def __init__(self, bus: AsyncBus, device: I2CModule):
+        """
+        :param bus: The executor the device's calls run on
+        :param device: A driver made with SYNC, use create() to make one without blocking. A driver on a bare bus is
+        moved onto the bus's arbiter.
+        """
+        self.bus = bus
+        self.device = device
+        if device.arbiter is None:
+            device.bind(bus.arbiter)
+
+    @classmethod
+    async def create(cls, bus: AsyncBus, *args, **kwargs):
+        """
+        Construct the SYNC driver on the executor thread, args are passed to its constructor after the bus
+        """
+        device = await bus.run(cls.SYNC, bus.arbiter, *args, **kwargs)
+        return cls(bus, device)
+
+    async def run(self, fn, *args, **kwargs):
+        return await self.bus.run(fn, *args, **kwargs)
+
+    write_byte = _forward('write_byte')
+    write_reg_byte = _forward('write_reg_byte')
+    write_reg_bytes = _forward('write_reg_bytes')
+    read_byte = _forward('read_byte')
+    read_reg_byte = _forward('read_reg_byte')
+    read_reg_bytes = _forward('read_reg_bytes')
+    read_bytes = _forward('read_bytes')
+
+
+class AsyncLaserControl(AsyncI2CModule):
+    SYNC = LaserControl
+
+    @property
+    def state(self) -> int:
+        return self.device.state
+
+    set_state = _forward_set('state')
+    reset = _forward('reset')
+
+    async def set(self, pos, value):
+        await self.run(self.device.__setitem__, pos, value)
+
+
+class AsyncSevenSeg(AsyncI2CModule):
+    SYNC = SevenSeg
+
+    sevenseg = _forward('sevenseg')
+    write_frame = _forward('write_frame')
+    brightness = _forward('brightness')
+    blink_rate = _forward('blink_rate')
+
+
+class AsyncSwitchesI2C(AsyncI2CModule):
+    SYNC = SwitchesI2C
+
+    snapshot = _forward('snapshot')
+    read_switches = _forward('read_switches')
+    poll = _forward('poll')
+
+
+class AsyncArduinoI2C(AsyncI2CModule):
+    SYNC = ArduinoI2C
+
+    @property
+    def color(self) -> COLOR:
+        return self.device.color
+
+    set_color = _forward_set('color')
+    keypad = _forward_get('keypad')
+    read_keys = _forward('read_keys')
+
+
+class AsyncBoxLock(AsyncI2CModule):
+    SYNC = BoxLock
+
+    powered = _forward_get('powered')
+    open = _forward('open')
+    close = _forward('close')
+
+
+class AsyncReceptorControl(AsyncI2CModule):
+    SYNC = ReceptorControl
+
+    read_raw = _forward('read_raw')
+    read = _forward('read')
+    read_int = _forward('read_int')
+    read_bus = _forward('read_bus')
+
+
+if __name__ == '__main__':
+    async def main():
+        bus = AsyncBus(SMBus(1))
+        seven, lasers = await asyncio.gather(AsyncSevenSeg.create(bus), AsyncLaserControl.create(bus))
+        for n in range(0x40):
+            await asyncio.gather(seven.sevenseg(n), lasers.set_state(n))
+            await asyncio.sleep(.1)
+
+    asyncio.run(main())
@@ -0,0 +1,159 @@
+import logging
+from concurrent.futures import Future
+from enum import IntEnum
+from itertools import count
+from queue import PriorityQueue
+from threading import Lock, Thread, current_thread
+from time import perf_counter
+
+from smbus2 import SMBus
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """
+    Transaction priority, lowest value is served first
+    """
+    CRITICAL = 0  # lock solenoid
+    INPUT = 1     # keypad, switches, receptors
+    NORMAL = 2
+    BULK = 3      # laser sweeps, display refreshes
+
+
+class QueueStats:
+    __slots__ = ('depth', 'max_depth', 'count', 'wait_total', 'wait_max')
+
+    def __init__(self):
+        self.depth = 0
+        self.max_depth = 0
+        self.count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def wait_mean(self) -> float:
+        return self.wait_total / self.count if self.count else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'count': self.count,
+            'wait_total': self.wait_total,
+            'wait_mean': self.wait_mean,
+            'wait_max': self.wait_max,
+        }
+
+
+class BusArbiter:
+    """
+    Owns an SMBus in a single worker thread and serves transactions in priority order.
+
+    Drivers built on I2CModule accept an arbiter in place of a bus, every bus call
+    they make is then queued here with the driver's PRIORITY.
+    """
+    _STOP = object()
+
+    def __init__(self, bus: SMBus, name: str = 'i2c-arbiter'):
+        """
+        :param bus: The bus this arbiter takes ownership of
+        :param name: Name of the worker thread
+        """
+        self.bus = bus
+        self._queue = PriorityQueue()
+        self._seq = count()
+        self._stats_lock = Lock()
+        self._stats = {p: QueueStats() for p in Priority}
+        # Set by close(), guarded by _stats_lock so nothing is queued behind the stop
+        self._closed = False
+        self._worker = Thread(target=self._serve, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, priority: Priority, op: str, *args) -> Future:
+        """
+        Queue a bus call
+        :param priority: Where the transaction goes in the queue
+        :param op: Name of the SMBus method to call, or a callable taking the bus
+        :param args: Arguments to the bus method
+        :return: A future resolving to the result of the bus call
+        """
+        future = Future()
+        priority = Priority(priority)
+        with self._stats_lock:
+            if self._closed:
+                raise RuntimeError('Bus arbiter is closed')
+            stats = self._stats[priority]
+            stats.depth += 1
+            stats.max_depth = max(stats.max_depth, stats.depth)
+            self._queue.put((priority, next(self._seq), perf_counter(), future, op, args))
+        return future
+
+    def call(self, priority: Priority, op: str, *args):
+        """
+        Queue a bus call and block until the worker has run it. Errors raised by the bus are re-raised here.
+        """
+        if current_thread() is self._worker:
+            # Already on the bus thread, queueing would deadlock
+            return self._run(op, args)
+        return self.submit(priority, op, *args).result()
+
+    def stats(self) -> dict:
+        """
+        :return: Queue depth and wait time counters for each priority, wait times are in seconds
+        """
+        with self._stats_lock:
+            return {p.name: s.as_dict() for p, s in self._stats.items()}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            for s in self._stats.values():
+                depth = s.depth
+                s.__init__()
+                s.depth = s.max_depth = depth
+
+    def close(self, timeout: float = None):
+        """
+        Stop the worker once the transactions already queued have been served, submit() raises after this
+        """
+        with self._stats_lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put((len(Priority), next(self._seq), perf_counter(), None, self._STOP, ()))
+        self._worker.join(timeout)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def _run(self, op, args):
+        if callable(op):
+            return op(self.bus, *args)
+        return getattr(self.bus, op)(*args)
+
+    def _serve(self):
+        while True:
+            priority, _, queued, future, op, args = self._queue.get()
+            if op is self._STOP:
+                self._fail_queued()
+                return
+            waited = perf_counter() - queued
+            with self._stats_lock:
+                stats = self._stats[priority]
+                stats.depth -= 1
+                stats.count += 1
+                stats.wait_total += waited
+                stats.wait_max = max(stats.wait_max, waited)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._run(op, args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def _fail_queued(self):
+        # Fail anything left behind the stop rather than leave its caller waiting forever
+        while not self._queue.empty():
+            future = self._queue.get_nowait()[3]
+            if future is not None and future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError('Bus arbiter is closed'))
@@ -0,0 +1,184 @@
+import logging
+from math import ceil
+from threading import RLock
+from typing import Callable, List
+
+from Project_Theseus_API.i2c.sevenseg import SevenSeg
+from Project_Theseus_API.i2c.timers import TimerWheel, default_timers
+
+logger = logging.getLogger(__name__)
+
+
+class Countdown:
+    """
+    A MM:SS game clock on a SevenSeg.
+
+    The time left is worked out from a monotonic deadline rather than by counting ticks, so it doesn't drift, and the
+    display is only written when the digits change, once a second. When time runs out the display shows 00:00 and
+    the HT16K33 flashes it by itself.
+    """
+    # HT16K33 blink rate once time is up, 2 is 1 Hz
+    BLINK = 2
+
+    def __init__(self, display: SevenSeg, seconds: float = 0, on_expire: Callable[[], None] = None,
+                 timers: TimerWheel = None, clock: Callable[[], float] = None):
+        """
+        :param display: Where the clock is shown
+        :param seconds: Time on the clock before it is started
+        :param on_expire: Called on the timer thread when time runs out
+        :param timers: Runs the clock, defaults to the shared timer wheel
+        :param clock: Monotonic time in seconds, defaults to the timer wheel's clock
+        """
+        self.display = display
+        self.on_expire = on_expire
+        self.timers = timers if timers is not None else default_timers()
+        self.clock = clock if clock is not None else self.timers.clock
+        self.flashing = False
+        self._remaining = float(seconds)
+        # Set while the clock is running
+        self._deadline = None
+        self._handle = None
+        # Last value written to the display
+        self._shown = None
+        self._dots = None
+        self._lock = RLock()
+
+    @property
+    def running(self) -> bool:
+        return self._deadline is not None
+
+    @property
+    def active(self) -> bool:
+        """
+        True while the countdown is on the display: counting, or flashing after it ran out
+        """
+        return self.running or self.flashing
+
+    @property
+    def remaining(self) -> float:
+        """
+        :return: Seconds left on the clock
+        """
+        deadline = self._deadline
+        if deadline is None:
+            return self._remaining
+        return max(deadline - self.clock(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining <= 0
+
+    @staticmethod
+    def encode(seconds: float) -> int:
+        """
+        :return: Whole seconds left, rounded up, as MM:SS in the display's hex digits
+        """
+        total = max(ceil(seconds), 0)
+        minutes, seconds = min(total // 60, 99), total % 60
+        return (minutes // 10) << 12 | (minutes % 10) << 8 | (seconds // 10) << 4 | seconds % 10
+
+    @property
+    def value(self) -> int:
+        return self.encode(self.remaining)
+
+    @property
+    def dots(self) -> List[bool]:
+        return self._dots
+
+    @dots.setter
+    def dots(self, dots: List[bool]):
+        with self._lock:
+            self._dots = dots
+            if self.active:
+                self._render(force=True)
+
+    def start(self, seconds: float = None):
+        """
+        Start the clock, from seconds if given, else from the time left
+        """
+        with self._lock:
+            if seconds is not None:
+                self.pause()
+                self._remaining = float(seconds)
+            self.resume()
+
+    def resume(self):
+        """
+        Carry on from the time left, does nothing once time has run out, start() sets a new time
+        """
+        with self._lock:
+            if self.running or self.expired:
+                return
+            self._stop_flashing()
+            self._deadline = self.clock() + self._remaining
+            self._shown = None
+        self._tick()
+
+    def pause(self):
+        """
+        Stop the clock and keep the time left, does nothing once time has run out
+        """
+        with self._lock:
+            if self.running:
+                self._remaining = self.remaining
+                self._deadline = None
+                self._cancel()
+
+    def dismiss(self):
+        """
+        Stop flashing the clock once time has run out and leave the display to other writers
+        """
+        with self._lock:
+            self._stop_flashing()
+
+    def add_time(self, seconds: float):
+        """
+        :param seconds: Added to the time left, negative takes time away
+        """
+        with self._lock:
+            if not self.running:
+                self._remaining = max(self._remaining + seconds, 0.0)
+                return
+            self._deadline += seconds
+        self._tick()
+
+    def _tick(self):
+        with self._lock:
+            if not self.running:
+                return
+            remaining = self.remaining
+            if remaining > 0:
+                self._render()
+                # Wake up when the whole seconds shown next go down
+                self._schedule(remaining - (ceil(remaining) - 1))
+                return
+            self._deadline = None
+            self._remaining = 0.0
+            self._cancel()
+            self._render()
+            self.display.blink_rate(self.BLINK)
+            self.flashing = True
+        logger.info('Countdown expired')
+        if self.on_expire:
+            self.on_expire()
+
+    def _schedule(self, delay: float):
+        if self._handle is None:
+            self._handle = self.timers.schedule(delay, self._tick)
+        else:
+            self._handle.reschedule(delay)
+
+    def _cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+
+    def _render(self, force: bool = False):
+        value = self.value
+        if value != self._shown or force:
+            self.display.sevenseg(value, self._dots)
+            self._shown = value
+
+    def _stop_flashing(self):
+        if self.flashing:
+            self.display.blink_rate(0)
+            self.flashing = False
@@ -0,0 +1,314 @@
+import json
+import logging
+import os
+import platform
+from copy import copy
+from functools import partial
+from inspect import getattr_static
+from time import time
+from typing import Callable, Dict, Set
+
+from smbus2 import SMBus, i2c_msg
+
+from Project_Theseus_API.i2c.bus_arbiter import BusArbiter, Priority
+from Project_Theseus_API.i2c.i2c_module import I2CModule
+
+logger = logging.getLogger(__name__)
+
+# Where each device of a box lives when the drivers' defaults are used
+DEFAULT_ADDRESSES = {
+    'arduino': 0x0d,
+    'receptors': 0x21,
+    'lock': 0x39,
+    'lasers': 0x3a,
+    'switches': 0x3b,
+    'display': 0x70,
+}
+
+
+def hardware_id() -> str:
+    """
+    :return: The Raspberry Pi's serial number, or the host name anywhere else
+    """
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('Serial'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.node()
+
+
+def probe(bus: SMBus, address: int) -> bool:
+    """
+    :return: True if a device acknowledges its address, see I2CModule.probe
+    """
+    try:
+        I2CModule(bus, address).probe()
+    except OSError:
+        return False
+    return True
+
+
+def scan(bus: SMBus, addresses: Dict[str, int] = None) -> Dict[str, bool]:
+    """
+    Probe every known address once
+    :param bus: An SMBus, or a BusArbiter that owns one
+    :return: Whether each device is present, by name
+    """
+    addresses = addresses or DEFAULT_ADDRESSES
+    return {name: probe(bus, address) for name, address in addresses.items()}
+
+
+class PresenceCache:
+    """
+    Presence maps on disk, keyed by hardware ID and bus so a warm restart doesn't probe every address. Only devices
+    recorded as present are trusted, discover() probes the absent ones again so a device plugged back in is found.
+    """
+
+    def __init__(self, bus_id: int = 1, path: str = None, max_age: float = 24 * 60 * 60):
+        """
+        :param bus_id: The I2C bus number
+        :param path: JSON file, defaults to ~/.cache/theseus/presence.json
+        :param max_age: Seconds before a cached map is scanned again
+        """
+        self.bus_id = bus_id
+        self.path = path or os.path.join(os.path.expanduser('~'), '.cache', 'theseus', 'presence.json')
+        self.max_age = max_age
+        self.key = '{}:{}'.format(hardware_id(), bus_id)
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, addresses: Dict[str, int]) -> Dict[str, bool]:
+        """
+        :return: The cached map, None if there isn't a fresh one for these addresses
+        """
+        entry = self._read().get(self.key)
+        if not entry or entry.get('addresses') != addresses or time() - entry.get('time', 0) > self.max_age:
+            return None
+        return entry['present']
+
+    def store(self, addresses: Dict[str, int], present: Dict[str, bool]):
+        entries = self._read()
+        entries[self.key] = {'addresses': addresses, 'present': present, 'time': time()}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = '{}.tmp'.format(self.path)
+        with open(tmp, 'w') as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def invalidate(self):
+        entries = self._read()
+        if entries.pop(self.key, None) is not None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'w') as f:
+                json.dump(entries, f, indent=2)
+
+
+def discover(bus: SMBus, addresses: Dict[str, int] = None, cache: PresenceCache = None,
+             rescan: bool = False) -> Dict[str, bool]:
+    """
+    :param bus: An SMBus, or a BusArbiter that owns one
+    :param cache: Use and update this cache, None always scans
+    :param rescan: Scan even if the cache has a map
+    :return: Whether each device is present, by name
+    """
+    addresses = addresses or DEFAULT_ADDRESSES
+    if cache is not None and not rescan:
+        present = cache.load(addresses)
+        if present is not None:
+            found = {name: True for name, there in present.items() if not there and probe(bus, addresses[name])}
+            if found:
+                present = dict(present, **found)
+                cache.store(addresses, present)
+            return present
+    present = scan(bus, addresses)
+    if cache is not None:
+        cache.store(addresses, present)
+    return present
+
+
+class NullDevice:
+    """
+    Stands in for the driver of a device that isn't on the bus. It is falsy, so code that checks for a device skips
+    it, and it answers for the driver without touching the bus: the driver's ABSENT table gives the value of each
+    property or instance attribute and what each method returns, other methods return None and do nothing, and
+    constants, class and static methods are the driver's own. Names the driver doesn't have raise AttributeError.
+    """
+
+    def __init__(self, name: str, address: int, driver: type = None):
+        """
+        :param driver: The driver class of the missing device, None makes every attribute a method that does nothing
+        """
+        self.name = name
+        self.address = address
+        self.driver = driver
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return 'NullDevice({!r}, {})'.format(self.name, hex(self.address))
+
+    def __getattr__(self, item):
+        # Copying and pickling look up special names before __init__ has run
+        if item.startswith('__') or item in ('name', 'address', 'driver'):
+            raise AttributeError(item)
+        driver = self.driver
+        if driver is None:
+            return self._nothing
+        absent = getattr(driver, 'ABSENT', {})
+        try:
+            attr = getattr_static(driver, item)
+        except AttributeError:
+            if item in absent:
+                return copy(absent[item])
+            raise AttributeError('{!r} has no attribute {!r}'.format(self, item)) from None
+        if isinstance(attr, property):
+            return copy(absent.get(item))
+        if isinstance(attr, (staticmethod, classmethod)) or not callable(attr):
+            return getattr(driver, item)
+        result = absent.get(item)
+        return lambda *args, **kwargs: copy(result)
+
+    @staticmethod
+    def _nothing(*args, **kwargs):
+        return None
+
+
+def _driver(factory: Callable) -> type:
+    """
+    :return: The driver class a factory builds, None if it can't be told
+    """
+    factory = getattr(factory, 'func', factory)
+    return factory if isinstance(factory, type) else None
+
+
+class BatchBus:
+    """
+    Collects the writes drivers make while they are set up and sends them all in one i2c_rdwr call
+    """
+    PRIORITY = Priority.NORMAL
+
+    def __init__(self, bus: SMBus):
+        """
+        :param bus: An SMBus, or a BusArbiter that owns one, the batch is then sent through it
+        """
+        if isinstance(bus, BusArbiter):
+            self.arbiter, self.bus = bus, bus.bus
+        else:
+            self.arbiter, self.bus = None, bus
+        # Cleared once the bus turns out not to have i2c_rdwr, wrappers like BusRecorder can claim it without it
+        self.rdwr = hasattr(self.bus, 'i2c_rdwr')
+        # (address, bytes on the wire after the address)
+        self._writes = []
+        # Addresses whose writes failed in any flush
+        self.failed = set()
+
+    def _run(self, op: str, *args):
+        if self.arbiter is not None:
+            return self.arbiter.call(self.PRIORITY, op, *args)
+        return getattr(self.bus, op)(*args)
+
+    def write_byte(self, i2c_addr, value):
+        self._writes.append((i2c_addr, bytes((value,))))
+
+    def write_byte_data(self, i2c_addr, register, value):
+        self._writes.append((i2c_addr, bytes((register, value))))
+
+    def write_i2c_block_data(self, i2c_addr, register, data):
+        self._writes.append((i2c_addr, bytes((register,)) + bytes(data)))
+
+    def __getattr__(self, item):
+        # Reads can't wait, send what is queued so they see the device after its writes
+        self.flush()
+        if not callable(getattr(self.bus, item)):
+            return getattr(self.bus, item)
+        return partial(self._run, item)
+
+    def _send(self, writes):
+        self._run('i2c_rdwr', *[i2c_msg.write(address, data) for address, data in writes])
+
+    def _send_one(self, address: int, data: bytes):
+        if self.rdwr:
+            try:
+                self._send([(address, data)])
+                return
+            except AttributeError:
+                self.rdwr = False
+        if len(data) == 1:
+            self._run('write_byte', address, data[0])
+        elif len(data) == 2:
+            self._run('write_byte_data', address, data[0], data[1])
+        else:
+            self._run('write_i2c_block_data', address, data[0], list(data[1:]))
+
+    def flush(self) -> Set[int]:
+        """
+        Send the queued writes, one at a time if the batch fails or the bus can't batch
+        :return: The addresses whose writes have failed so far
+        """
+        writes, self._writes = self._writes, []
+        if not writes:
+            return self.failed
+        if self.rdwr:
+            try:
+                self._send(writes)
+                return self.failed
+            except OSError:
+                logger.debug('Batched init writes failed, sending them one at a time')
+            except AttributeError:
+                self.rdwr = False
+        for address, data in writes:
+            if address in self.failed:
+                continue
+            try:
+                self._send_one(address, data)
+            except OSError:
+                self.failed.add(address)
+        return self.failed
+
+
+def build_devices(bus: SMBus, factories: Dict[str, Callable[[SMBus, int], I2CModule]],
+                  addresses: Dict[str, int] = None, cache: PresenceCache = None) -> Dict[str, I2CModule]:
+    """
+    Set up the drivers of a box: one probe pass (or a cached presence map), then the init writes of every present
+    device in a single batch
+    :param bus: An SMBus, or a BusArbiter that owns one
+    :param factories: Builds each device's driver from a bus and an address, by name
+    :param addresses: Addresses by name, defaults to DEFAULT_ADDRESSES
+    :param cache: Presence map cache, None scans every time
+    :return: A driver for each factory, NullDevices for the ones that are missing
+    """
+    addresses = dict(DEFAULT_ADDRESSES, **(addresses or {}))
+    addresses = {name: addresses[name] for name in factories}
+    present = discover(bus, addresses, cache)
+
+    batch = BatchBus(bus)
+    devices = {}
+    for name, factory in factories.items():
+        if present.get(name):
+            devices[name] = factory(batch, addresses[name])
+        else:
+            logger.warning('No {} at {}'.format(name, hex(addresses[name])))
+            devices[name] = NullDevice(name, addresses[name], _driver(factory))
+    failed = batch.flush()
+
+    for name, device in devices.items():
+        if not device:
+            continue
+        if device.address in failed:
+            logger.warning('{} at {} did not take its init writes'.format(name, hex(device.address)))
+            devices[name] = NullDevice(name, device.address, type(device))
+            present[name] = False
+        else:
+            device.bind(bus)
+    if failed and cache is not None:
+        cache.store(addresses, present)
+    return devices
@@ -0,0 +1,159 @@
+import logging
+from threading import Lock
+from time import monotonic
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+from smbus2 import SMBus
+
+from Project_Theseus_API.i2c.i2c_module import I2CModule
+
+logger = logging.getLogger(__name__)
+
+
+class PortState:
+    """
+    What is known about one PCF8574 port, shared by every driver on it
+    """
+    __slots__ = ('latch', 'inputs', 'value', 'read_at', 'writes', 'lock')
+
+    def __init__(self):
+        # Last byte written, None until the first write or after a failed one
+        self.latch = None
+        # Pins used as inputs, always written high
+        self.inputs = 0
+        # Last byte read and when
+        self.value = None
+        self.read_at = 0.0
+        # Bumped by every write, a read that overlapped one isn't kept
+        self.writes = 0
+        # Guards the fields above, never held across a bus transaction
+        self.lock = Lock()
+
+
+# Bus object to {address: PortState}, dropped with the bus
+_ports = WeakKeyDictionary()
+_ports_lock = Lock()
+
+
+def port_state(bus: SMBus, address: int) -> PortState:
+    """
+    :param bus: The raw bus, not a BusArbiter
+    :return: The shared state of the port at address on bus
+    """
+    with _ports_lock:
+        ports = _ports.get(bus)
+        if ports is None:
+            ports = _ports[bus] = {}
+        port = ports.get(address)
+        if port is None:
+            port = ports[address] = PortState()
+        return port
+
+
+class PortExpander(I2CModule):
+    """
+    A quasi-bidirectional 8-bit expander such as the PCF8574.
+
+    The port has no direction register: a pin reads as an input only while its latch bit is high. Writes are made
+    against the cached latch, only the pins asked for change and input pins are always written high, so a driver can't
+    drive another one's inputs low. The last read is kept for the port, so while something polls it, e.g. an
+    InputScanner, every other consumer can use the poll's read instead of going to the bus if it asks for one by passing
+    a max_age, or a subclass sets MAX_AGE.
+
+    The port lock only guards the cached state, the bus transactions are made without it so they queue on the
+    BusArbiter like any other. A write that finds the latch changed under it by the time it is through writes the newer
+    latch again, so the last latch composed is the last one the device is given.
+    """
+    # Pins this driver reads
+    INPUTS = 0x00
+    # Seconds an earlier read of the port is reused for, 0 always reads
+    MAX_AGE = 0.0
+
+    def __init__(self, bus: SMBus, address, shadow: bool = None):
+        super().__init__(bus, address, shadow)
+        self._attach()
+
+    def bind(self, bus: SMBus):
+        super().bind(bus)
+        # bind is called by I2CModule.__init__ before there is an address
+        if hasattr(self, 'address'):
+            self._attach()
+
+    def _attach(self):
+        previous = getattr(self, 'port', None)
+        port = port_state(self.bus, self.address)
+        with port.lock:
+            port.inputs |= self.INPUTS
+            if previous is not None and previous is not port:
+                # What was written through the old bus object is the latest the device was told
+                port.inputs |= previous.inputs
+                if previous.latch is not None:
+                    port.latch = previous.latch
+                port.value = None
+        self.port = port
+
+    def resync(self):
+        """
+        Forget the cached latch and read so the next write and read go to the bus
+        """
+        super().resync()
+        port = self.port
+        with port.lock:
+            port.latch = None
+            port.value = None
+
+    @I2CModule._write_except
+    def write_port(self, byte: int, mask: int = 0xFF, force: bool = False):
+        """
+        Change the pins in mask to their bits in byte and leave the rest of the latch alone
+        :param force: Write even if the latch already holds the byte, for init writes
+        :return: True if the write succeeded or nothing changed
+        """
+        port = self.port
+        with port.lock:
+            latch = 0xFF if port.latch is None else port.latch
+            latch = (latch & ~mask | byte & mask | port.inputs) & 0xFF
+            if latch == port.latch and not force:
+                self.shadow_hits += 1
+                return
+            self.shadow_misses += 1
+            port.latch = latch
+            port.value = None
+            port.writes += 1
+        while True:
+            self._call('write_byte', self.address, latch)
+            with port.lock:
+                # None after a failed write, which resynced the port
+                if port.latch is None or port.latch == latch:
+                    return
+                # Another write composed a newer latch while this one was on the bus and may have landed first
+                latch = port.latch
+
+    def read_port(self, max_age: float = None) -> Optional[int]:
+        """
+        :param max_age: Reuse a read of the port this many seconds old, defaults to MAX_AGE
+        :return: The port byte, None if the read failed
+        """
+        max_age = self.MAX_AGE if max_age is None else max_age
+        port = self.port
+        with port.lock:
+            now = monotonic()
+            if port.value is not None and now - port.read_at < max_age:
+                return port.value
+            writes = port.writes
+        success, value = self.read_byte()
+        if not success:
+            return None
+        with port.lock:
+            if port.writes == writes and now >= port.read_at:
+                port.value, port.read_at = value, now
+        return value
+
+    def pin(self, mask: int, max_age: float = None) -> Optional[bool]:
+        """
+        :param mask: The pin's bit
+        :return: Whether the pin is high, None if the read failed
+        """
+        byte = self.read_port(max_age)
+        return None if byte is None else bool(byte & mask)
@@ -0,0 +1,287 @@
+import logging
+import multiprocessing
+import pickle
+import queue
+from functools import partial
+from itertools import count
+from threading import Lock, Thread
+from time import monotonic, perf_counter_ns
+from typing import Any, Callable, Dict, List
+
+from smbus2 import SMBus
+
+from Project_Theseus_API.i2c.bus_arbiter import BusArbiter
+from Project_Theseus_API.i2c.metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+
+class BoxController:
+    """
+    Runs one box's main loop on its own bus: builds the drivers, scans the inputs, applies commands and reports
+    telemetry. A Fleet runs each controller in a worker process or thread.
+    """
+
+    def __init__(self, name: str, bus_factory: Callable[[], SMBus], addresses: Dict[str, int] = None,
+                 tick_rate: float = 10.0, telemetry_interval: float = 1.0):
+        """
+        :param name: Identifies the box in commands and telemetry
+        :param bus_factory: Opens the box's bus in the worker, must be picklable to run in a process
+        :param addresses: Device addresses by name, see TestSuite
+        :param tick_rate: Main loop iterations per second
+        :param telemetry_interval: Seconds between telemetry reports
+        """
+        self.name = name
+        self.bus_factory = bus_factory
+        self.addresses = addresses
+        self.tick_rate = tick_rate
+        self.telemetry_interval = telemetry_interval
+
+    def run(self, commands, out):
+        """
+        Worker entry point, returns once a stop command arrives
+        :param commands: Queue of (id, target, args), target None stops the box
+        :param out: Queue the worker puts ('reply', name, id, ok, result) and ('telemetry', name, stats) on
+        """
+        # The drivers are only imported in the worker, a spawned process starts from nothing
+        from Project_Theseus_API.i2c.test_suite import TestSuite
+
+        # Replies to a Fleet of processes are pickled by the queue's feeder thread, which drops what it can't pickle
+        pickled = not isinstance(out, queue.Queue)
+        arbiter = None
+        try:
+            # The countdown writes the display from the timer thread, the arbiter keeps it off the main loop's
+            # transactions
+            arbiter = BusArbiter(self.bus_factory(), name='{}-i2c'.format(self.name))
+            suite = TestSuite(arbiter, self.addresses)
+            scanner = suite.scanner(self.tick_rate)
+        except Exception as e:
+            if arbiter is not None:
+                arbiter.close()
+            out.put(('exit', self.name, repr(e)))
+            return
+        try:
+            self._loop(suite, scanner, commands, out, pickled)
+        finally:
+            arbiter.close()
+
+    def _loop(self, suite, scanner, commands, out, pickled: bool):
+        period = 1.0 / self.tick_rate
+        latency = LatencyHistogram()
+        ticks = overruns = errors = 0
+        reported_ticks = 0
+        start = reported = deadline = monotonic()
+        while True:
+            # Wait out the rest of the tick for commands
+            while True:
+                delay = deadline - monotonic()
+                try:
+                    command = commands.get(timeout=delay) if delay > 0 else commands.get_nowait()
+                except queue.Empty:
+                    break
+                command_id, target, args = command
+                if target is None:
+                    out.put(('exit', self.name, None))
+                    return
+                reply = self._apply(suite, target, args)
+                if pickled:
+                    reply = self._picklable(target, reply)
+                out.put(('reply', self.name, command_id) + reply)
+
+            begin = perf_counter_ns()
+            try:
+                suite.update(scanner.tick())
+            except Exception:
+                errors += 1
+                logger.exception('{} tick failed'.format(self.name))
+            latency.record(perf_counter_ns() - begin)
+            ticks += 1
+
+            now = monotonic()
+            deadline += period
+            if deadline < now:
+                overruns += 1
+                deadline = now
+            if now - reported >= self.telemetry_interval:
+                out.put(('telemetry', self.name, {
+                    'ticks': ticks,
+                    'tick_rate': (ticks - reported_ticks) / (now - reported),
+                    'overruns': overruns,
+                    'errors': errors,
+                    'uptime': now - start,
+                    'latency': latency.snapshot(),
+                    'scanner': scanner.stats(),
+                }))
+                reported, reported_ticks = now, ticks
+
+    @staticmethod
+    def _apply(suite, target: str, args: tuple) -> tuple:
+        """
+        Call a method of the box's TestSuite by dotted name, e.g. 'i2c_lock.open'
+        :return: (ok, result or the error)
+        """
+        try:
+            obj = suite
+            for attr in target.split('.'):
+                obj = getattr(obj, attr)
+            return True, obj(*args) if callable(obj) else obj
+        except Exception as e:
+            return False, e
+
+    @staticmethod
+    def _picklable(target: str, reply: tuple) -> tuple:
+        """
+        :return: The reply, or an error reply if it can't be sent to another process
+        """
+        try:
+            pickle.dumps(reply)
+        except Exception as e:
+            return False, RuntimeError('The result of {} could not be sent back: {!r}'.format(target, e))
+        return reply
+
+
+class Fleet:
+    """
+    Several boxes behind one control and telemetry API.
+
+    Each box gets its own worker process by default, so boxes on independent buses don't share a GIL, or a thread with
+    processes=False for in-process fake buses.
+    """
+
+    def __init__(self, boxes: List[BoxController], processes: bool = True):
+        self.boxes = {box.name: box for box in boxes}
+        self.processes = processes
+        self._context = multiprocessing.get_context()
+        if processes:
+            self._out = self._context.Queue()
+            self._commands = {name: self._context.Queue() for name in self.boxes}
+        else:
+            self._out = queue.Queue()
+            self._commands = {name: queue.Queue() for name in self.boxes}
+        self._workers = {}
+        self._telemetry = {}
+        self._exits = {}
+        self._pending = {}
+        self._ids = count()
+        self._lock = Lock()
+        self._collector = None
+
+    @classmethod
+    def from_buses(cls, buses: List[int], addresses: List[Dict[str, int]] = None, **kwargs) -> 'Fleet':
+        """
+        :param buses: I2C bus numbers, a box on each
+        :param addresses: Device addresses for each box, see TestSuite
+        :param kwargs: Passed to every BoxController
+        """
+        fleet_args = {'processes': kwargs.pop('processes')} if 'processes' in kwargs else {}
+        addresses = addresses or [None] * len(buses)
+        return cls([BoxController('bus{}'.format(n), partial(SMBus, n), a, **kwargs)
+                    for n, a in zip(buses, addresses)], **fleet_args)
+
+    def start(self) -> 'Fleet':
+        # Workers first, a process forked while the collector thread holds a lock would inherit it held
+        for name, box in self.boxes.items():
+            if name in self._workers:
+                continue
+            self._exits.pop(name, None)
+            args = (self._commands[name], self._out)
+            if self.processes:
+                worker = self._context.Process(target=box.run, args=args, name=name, daemon=True)
+            else:
+                worker = Thread(target=box.run, args=args, name=name, daemon=True)
+            worker.start()
+            self._workers[name] = worker
+        if self._collector is None:
+            self._collector = Thread(target=self._collect, name='fleet-telemetry', daemon=True)
+            self._collector.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        for name in self._workers:
+            self._commands[name].put((None, None, ()))
+        for worker in self._workers.values():
+            worker.join(timeout)
+        self._workers.clear()
+        if self._collector is not None:
+            self._out.put(None)
+            self._collector.join(timeout)
+            self._collector = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _collect(self):
+        while True:
+            message = self._out.get()
+            if message is None:
+                return
+            kind, name = message[:2]
+            if kind == 'telemetry':
+                self._telemetry[name] = message[2]
+            elif kind == 'reply':
+                with self._lock:
+                    reply = self._pending.pop(message[2], None)
+                if reply is not None:
+                    reply.put(message[3:])
+            elif kind == 'exit':
+                self._exits[name] = message[2]
+                if message[2]:
+                    logger.error('Box {} stopped: {}'.format(name, message[2]))
+
+    def _send(self, name: str, target: str, args: tuple) -> tuple:
+        reply = queue.Queue(1)
+        command_id = next(self._ids)
+        with self._lock:
+            self._pending[command_id] = reply
+        self._commands[name].put((command_id, target, args))
+        return command_id, reply
+
+    def _wait(self, name: str, target: str, command: tuple, timeout: float) -> Any:
+        command_id, reply = command
+        try:
+            ok, result = reply.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self._pending.pop(command_id, None)
+            raise TimeoutError('Box {} did not answer {}'.format(name, target))
+        if not ok:
+            raise result
+        return result
+
+    def call(self, name: str, target: str, *args, timeout: float = 5.0) -> Any:
+        """
+        Call a method of one box's TestSuite by dotted name, e.g. fleet.call('bus1', 'i2c_lock.open')
+        :return: What the method returned, errors are raised here
+        """
+        return self._wait(name, target, self._send(name, target, args), timeout)
+
+    def broadcast(self, target: str, *args, timeout: float = 5.0) -> Dict[str, Any]:
+        """
+        Call a method on every box at once
+        :return: The results by box name
+        """
+        sent = {name: self._send(name, target, args) for name in self.boxes}
+        return {name: self._wait(name, target, command, timeout) for name, command in sent.items()}
+
+    def telemetry(self) -> Dict[str, dict]:
+        """
+        :return: The latest report from each box that has sent one
+        """
+        return dict(self._telemetry)
+
+    def status(self) -> Dict[str, str]:
+        """
+        :return: 'running', 'stopped' or the error that stopped each box
+        """
+        status = {}
+        for name in self.boxes:
+            if name in self._exits:
+                status[name] = self._exits[name] or 'stopped'
+            elif name in self._workers and self._workers[name].is_alive():
+                status[name] = 'running'
+            else:
+                status[name] = 'stopped'
+        return status
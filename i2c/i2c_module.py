@@ -1,16 +1,221 @@
+import errno
 import logging
 from functools import wraps
+from threading import Lock
+from time import perf_counter_ns, sleep
+from weakref import WeakKeyDictionary, ref
 
 from smbus2 import SMBus, i2c_msg
 
+from Project_Theseus_API.i2c.bus_arbiter import BusArbiter, Priority
+from Project_Theseus_API.i2c.metrics import BusMetrics
+from Project_Theseus_API.i2c.policy import CircuitBreaker, DeviceUnavailable, RetryPolicy
+
 logger = logging.getLogger(__name__)
 
+# Bus object to {address: CircuitBreaker}, dropped with the bus
+_breakers = WeakKeyDictionary()
+_breakers_lock = Lock()
+
+
+def _transfer_size(op: str, args: tuple) -> int:
+    """
+    :return: Bytes a bus call moves after the device address, register pointers included
+    """
+    if op in ('write_byte', 'read_byte'):
+        return 1
+    if op in ('write_byte_data', 'read_byte_data'):
+        return 2
+    if op == 'write_i2c_block_data':
+        return 1 + len(args[2])
+    if op == 'read_i2c_block_data':
+        return 1 + args[2]
+    if op == 'i2c_rdwr':
+        return sum(msg.len for msg in args)
+    return 0
+
+
+def _weak_probe(bus: ref, address: int):
+    """
+    :param bus: Weak reference to the SMBus or BusArbiter the device is on
+    :return: A probe of the device, see I2CModule.probe
+    """
+
+    def probe():
+        target = bus()
+        if target is None:
+            raise OSError(errno.ENODEV, 'The bus of {} is gone'.format(hex(address)))
+        I2CModule(target, address).probe()
+
+    return probe
+
 
 class I2CModule:
+    # Queue position of this device's transactions when the bus is shared through a BusArbiter
+    PRIORITY = Priority.NORMAL
+    # Keep a shadow of written registers and skip writes that would not change them
+    SHADOW = False
+    # A BusMetrics that records every bus call when set, on I2CModule for all devices or on one driver class
+    metrics = None
+    # A RetryPolicy for failed bus calls, None leaves errors to the caller straight away
+    policy = None
+    # What a NullDevice standing in for a missing device gives for an attribute or returns from a method, by name
+    ABSENT = {}
 
-    def __init__(self, bus: SMBus, address):
-        self.bus = bus
+    def __init__(self, bus: SMBus, address, shadow: bool = None):
+        """
+        :param bus: An SMBus, or a BusArbiter that owns one
+        :param address: The device's address on the bus
+        :param shadow: Enable the shadow write cache, defaults to the class's SHADOW
+        """
+        self.bind(bus)
         self.address = address
+        self._shadow = {} if (self.SHADOW if shadow is None else shadow) else None
+        self.shadow_hits = 0
+        self.shadow_misses = 0
+        self._breaker = None
+        self._breaker_bus = None
+
+    def bind(self, bus: SMBus):
+        """
+        Move the device to another bus object for the same physical bus, the shadow registers are kept
+        :param bus: An SMBus, or a BusArbiter that owns one
+        """
+        if isinstance(bus, BusArbiter):
+            self.arbiter = bus
+            self.bus = bus.bus
+        else:
+            self.arbiter = None
+            self.bus = bus
+
+    def resync(self):
+        """
+        Forget the shadow registers so the next write of every register goes to the bus
+        """
+        if self._shadow is not None:
+            self._shadow.clear()
+
+    @property
+    def shadow_stats(self) -> dict:
+        return {'hits': self.shadow_hits, 'misses': self.shadow_misses}
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        """
+        :return: The circuit breaker of the device, None without a policy. Every driver of the same address on the same
+        bus gets the same breaker, so once one trips the others fail fast too. Its thresholds are the policy of the
+        driver that last used it.
+        """
+        policy = self.policy
+        if policy is None:
+            return None
+        breaker = self._breaker
+        if breaker is None or self._breaker_bus is not self.bus:
+            with _breakers_lock:
+                device = _breakers.get(self.bus)
+                if device is None:
+                    device = _breakers[self.bus] = {}
+                breaker = device.get(self.address)
+                if breaker is None:
+                    # The probe holds the bus weakly so the breaker doesn't keep its own key alive
+                    target = self.arbiter if self.arbiter is not None else self.bus
+                    breaker = device[self.address] = CircuitBreaker(policy, self.address,
+                                                                    _weak_probe(ref(target), self.address))
+            self._breaker, self._breaker_bus = breaker, self.bus
+        if breaker.policy is not policy:
+            breaker.policy = policy
+        return breaker
+
+    @property
+    def breaker_state(self) -> dict:
+        breaker = self.breaker
+        return breaker.snapshot() if breaker is not None else None
+
+    def probe(self):
+        """
+        Check the device answers, raises OSError if it doesn't. It is an address only write, or a one byte read on a bus
+        without i2c_rdwr. Not retried, the circuit breaker and discovery want to know about a single failure.
+        """
+        try:
+            self._transfer('i2c_rdwr', i2c_msg.write(self.address, b''))
+        except AttributeError:
+            # Wrappers such as BusRecorder have i2c_rdwr even when the bus they wrap doesn't
+            self._transfer('read_byte', self.address)
+
+    def _call(self, op: str, *args):
+        """
+        Run a bus method under the retry policy if there is one
+        """
+        breaker = self.breaker
+        if breaker is None:
+            return self._transfer(op, *args)
+        if not breaker.allow():
+            raise DeviceUnavailable(self.address)
+        policy = self.policy or breaker.policy
+        for attempt in range(policy.retries + 1):
+            try:
+                result = self._transfer(op, *args)
+            except OSError as e:
+                if attempt == policy.retries:
+                    breaker.failure(e)
+                    raise
+                logger.debug('i2c {} to {} failed, retrying: {}'.format(op, hex(self.address), e))
+                sleep(policy.delay(attempt))
+            else:
+                breaker.success()
+                return result
+
+    def _transfer(self, op: str, *args):
+        """
+        Run a bus method, through the arbiter if there is one
+        """
+        if self.metrics is not None:
+            if self.arbiter is not None:
+                return self.arbiter.call(self.PRIORITY, self._measure, op, *args)
+            return self._measure(self.bus, op, *args)
+        if self.arbiter is not None:
+            return self.arbiter.call(self.PRIORITY, op, *args)
+        return getattr(self.bus, op)(*args)
+
+    def _measure(self, bus: SMBus, op: str, *args):
+        """
+        Run a bus method and record it in metrics, time spent queued in the arbiter is not counted
+        """
+        metrics = self.metrics
+        start = perf_counter_ns()
+        try:
+            result = getattr(bus, op)(*args)
+        except OSError:
+            metrics.record(self.address, op, perf_counter_ns() - start, 0, error=True)
+            raise
+        metrics.record(self.address, op, perf_counter_ns() - start, _transfer_size(op, args))
+        return result
+
+    @classmethod
+    def enable_metrics(cls, metrics: BusMetrics = None) -> BusMetrics:
+        """
+        Record the bus calls of this class and its subclasses
+        :param metrics: Where to record, defaults to a new BusMetrics
+        """
+        cls.metrics = metrics if metrics is not None else BusMetrics()
+        return cls.metrics
+
+    @classmethod
+    def disable_metrics(cls):
+        cls.metrics = None
+
+    @classmethod
+    def set_policy(cls, policy: RetryPolicy = None) -> RetryPolicy:
+        """
+        Retry the bus calls of this class and its subclasses, and fail fast while a device is down
+        :param policy: Defaults to a new RetryPolicy
+        """
+        cls.policy = policy if policy is not None else RetryPolicy()
+        return cls.policy
+
+    @classmethod
+    def clear_policy(cls):
+        cls.policy = None
 
     def _write_except(f):
         @wraps(f)
@@ -20,6 +225,8 @@ class I2CModule:
                 return True
             except OSError:
                 logger.debug('i2c write error')
+                # The device may have taken part of the write, the shadow can't be trusted
+                inst.resync()
                 return False
 
         return wrapped
@@ -31,41 +238,66 @@ class I2CModule:
                 return True, f(inst, *args, **kwargs)
             except OSError:
                 logger.debug('i2c read error')
+                # A device that stops answering may have been reset, which clears the registers the shadow holds
+                inst.resync()
                 return False, None
 
         return wrapped
 
     @_write_except
     def write_byte(self, byte):
-        try:
-            self.bus.write_byte(self.address, byte)
-            return True
-        except OSError:
-            logger.debug('i2c write error')
-            return False
+        # Writes without a register are shadowed under the key None
+        if self._shadow is not None:
+            if self._shadow.get(None) == byte:
+                self.shadow_hits += 1
+                return
+            self.shadow_misses += 1
+        self._call('write_byte', self.address, byte)
+        if self._shadow is not None:
+            self._shadow[None] = byte
 
     @_write_except
     def write_reg_byte(self, reg, byte):
-        self.bus.write_byte_data(self.address, reg, byte)
+        if self._shadow is not None:
+            if self._shadow.get(reg) == byte:
+                self.shadow_hits += 1
+                return
+            self.shadow_misses += 1
+        self._call('write_byte_data', self.address, reg, byte)
+        if self._shadow is not None:
+            self._shadow[reg] = byte
 
     @_write_except
     def write_reg_bytes(self, reg, data):
-        self.bus.write_i2c_block_data(self.address, reg, data)
+        if self._shadow is None:
+            self._call('write_i2c_block_data', self.address, reg, data)
+            return
+        # Trim the block to the range of registers that differ from the shadow
+        shadow = self._shadow
+        changed = [i for i, d in enumerate(data) if shadow.get(reg + i) != d]
+        if not changed:
+            self.shadow_hits += 1
+            return
+        self.shadow_misses += 1
+        first, last = changed[0], changed[-1] + 1
+        self._call('write_i2c_block_data', self.address, reg + first, list(data[first:last]))
+        for i in range(first, last):
+            shadow[reg + i] = data[i]
 
     @_read_except
     def read_byte(self):
-        return self.bus.read_byte(self.address)
+        return self._call('read_byte', self.address)
 
     @_read_except
     def read_reg_byte(self, reg):
-        return self.bus.read_byte_data(self.address, reg)
+        return self._call('read_byte_data', self.address, reg)
 
     @_read_except
     def read_reg_bytes(self, reg, n=32):
-        return self.bus.read_i2c_block_data(self.address, reg, n)
+        return self._call('read_i2c_block_data', self.address, reg, n)
 
     @_read_except
     def read_bytes(self, n=32):
         read = i2c_msg.read(self.address, n)
-        self.bus.i2c_rdwr(read)
+        self._call('i2c_rdwr', read)
         return list(read)
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+from functools import partial
+from operator import attrgetter
+from queue import Queue
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Any, Callable, List, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class InputEvent(NamedTuple):
+    source: str
+    value: Any
+    previous: Any
+    timestamp: float
+
+
+class KeypadEvent(InputEvent):
+    """
+    value is the list of KeyEvents read in one scan, previous is always None
+    """
+    __slots__ = ()
+
+
+class SwitchEvent(InputEvent):
+    """
+    value and previous are SwitchSnapshots
+    """
+    __slots__ = ()
+
+
+class ReceptorEvent(InputEvent):
+    """
+    value and previous are receptor threshold masks, receptor 0 in the highest bit
+    """
+    __slots__ = ()
+
+
+class PowerEvent(InputEvent):
+    """
+    value and previous are whether the lock is powered
+    """
+    __slots__ = ()
+
+
+class _Input:
+    __slots__ = ('name', 'read', 'event', 'period', 'edge', 'key', 'value', 'last', 'due', 'reads', 'errors', 'events')
+
+    def __init__(self, name, read, event, period, edge, key):
+        self.name = name
+        self.read = read
+        self.event = event
+        self.period = period
+        self.edge = edge
+        self.key = key
+        self.value = None
+        # What edge detection compares, key(value)
+        self.last = None
+        self.due = 0.0
+        self.reads = 0
+        self.errors = 0
+        self.events = 0
+
+
+class InputScanner:
+    """
+    Reads every input device once per tick, in the order they were added, and publishes typed change events.
+    """
+
+    def __init__(self, tick_rate: float = 10.0):
+        """
+        :param tick_rate: Scans per second, devices with a lower rate are read on the ticks they are due
+        """
+        self.period = 1.0 / tick_rate
+        self._inputs = []
+        # Queue to the function that puts events on it
+        self._subscribers = {}
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+        self.ticks = 0
+        self.overruns = 0
+        self.max_lateness = 0.0
+
+    def add(self, name: str, read: Callable[[], Any], event=InputEvent, rate: float = None, edge: bool = True,
+            key: Callable[[Any], Any] = None):
+        """
+        :param name: The event source name
+        :param read: Reads the device, returns None when the read failed
+        :param event: The InputEvent subclass published for this device
+        :param rate: Reads per second, defaults to every tick
+        :param edge: Publish when the value changes, else publish every truthy value
+        :param key: The part of a value that counts as a change, defaults to the whole value
+        """
+        period = self.period if rate is None else max(1.0 / rate, self.period)
+        self._inputs.append(_Input(name, read, event, period, edge, key))
+        return self
+
+    def add_switches(self, switches, rate: float = None):
+        # The scan is the poll other consumers of a port expander share, so it always reads. Snapshots carry the time
+        # they were read, only the port byte says whether a switch moved.
+        return self.add('switches', partial(switches.snapshot, 0), SwitchEvent, rate, key=attrgetter('raw'))
+
+    def add_keypad(self, arduino, rate: float = None):
+        return self.add('keypad', arduino.read_keys, KeypadEvent, rate, edge=False)
+
+    def add_receptors(self, receptors, rate: float = None):
+        def read():
+            # A running sampler already reads the device, take its newest sample instead of a read of our own
+            sampler = receptors.sampler
+            if sampler is not None and sampler.running:
+                sample = sampler.latest()
+                return None if sample is None else sample.mask
+            return receptors.mask if receptors.read_bus() else None
+
+        return self.add('receptors', read, ReceptorEvent, rate)
+
+    def add_lock_power(self, lock, rate: float = None):
+        def read():
+            return lock.pin(lock.POWERED, 0)
+
+        return self.add('lock', read, PowerEvent, rate)
+
+    def subscribe(self, maxsize: int = 0) -> Queue:
+        """
+        :return: A thread safe queue that receives every event
+        """
+        queue = Queue(maxsize)
+        with self._lock:
+            self._subscribers[queue] = queue.put_nowait
+        return queue
+
+    def subscribe_async(self, loop: asyncio.AbstractEventLoop = None) -> asyncio.Queue:
+        """
+        :param loop: The loop that consumes the queue, defaults to the running loop
+        :return: An asyncio queue that receives every event
+        """
+        loop = loop or asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def put(event):
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+        with self._lock:
+            self._subscribers[queue] = put
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def _publish(self, event: InputEvent):
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+        for put in subscribers:
+            try:
+                put(event)
+            except Exception:
+                logger.exception('Dropped {} for a subscriber'.format(type(event).__name__))
+
+    def tick(self, now: float = None) -> List[InputEvent]:
+        """
+        Read every device that is due and publish the changes
+        :return: The events published
+        """
+        now = monotonic() if now is None else now
+        events = []
+        for i in self._inputs:
+            if now < i.due:
+                continue
+            i.due = i.due + i.period if i.due + i.period > now else now + i.period
+            i.reads += 1
+            try:
+                value = i.read()
+            except OSError:
+                value = None
+            if value is None:
+                i.errors += 1
+                continue
+            previous = i.value
+            if i.edge:
+                last = value if i.key is None else i.key(value)
+                if last == i.last:
+                    continue
+                i.value, i.last = value, last
+            elif not value:
+                continue
+            else:
+                previous = None
+            i.events += 1
+            event = i.event(i.name, value, previous, now)
+            events.append(event)
+            self._publish(event)
+        self.ticks += 1
+        return events
+
+    def _run(self):
+        deadline = monotonic()
+        while not self._stop.is_set():
+            now = monotonic()
+            lateness = now - deadline
+            self.max_lateness = max(self.max_lateness, lateness)
+            self.tick(now)
+            deadline += self.period
+            delay = deadline - monotonic()
+            if delay < 0:
+                # The scan took longer than a tick, start the next one now rather than bursting
+                self.overruns += 1
+                deadline = monotonic()
+            else:
+                self._stop.wait(delay)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name='input-scanner', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'max_lateness': self.max_lateness,
+            'inputs': {i.name: {'period': i.period, 'reads': i.reads, 'errors': i.errors, 'events': i.events}
+                       for i in self._inputs},
+        }
+
+
+def box_scanner(switches=None, arduino=None, receptors=None, lock=None, tick_rate: float = 10.0,
+                rates: dict = None) -> InputScanner:
+    """
+    Build a scanner over a box's input devices, ones that are None or a NullDevice are left out
+    :param rates: Reads per second by source name: 'switches', 'keypad', 'receptors', 'lock'
+    """
+    rates = rates or {}
+    scanner = InputScanner(tick_rate)
+    if switches:
+        scanner.add_switches(switches, rates.get('switches'))
+    if arduino:
+        scanner.add_keypad(arduino, rates.get('keypad'))
+    if receptors:
+        scanner.add_receptors(receptors, rates.get('receptors'))
+    if lock:
+        scanner.add_lock_power(lock, rates.get('lock'))
+    return scanner
@@ -1,74 +1,142 @@
+from contextlib import contextmanager, nullcontext
+
 from smbus2 import SMBus
-from bitarray import bitarray
-from Project_Theseus_API.i2c.i2c_module import I2CModule
+from Project_Theseus_API.i2c.bus_arbiter import Priority
+from Project_Theseus_API.i2c.expander import PortExpander
+
+
+def _port_byte(lasers: int) -> int:
+    # Lasers are on when their pin is low, and lasers 4 and 5 are wired to each other's pins
+    byte = ~lasers & 0x0F
+    byte |= (not lasers & 0x20) << 4
+    byte |= (not lasers & 0x10) << 5
+    return byte
+
 
+def _reversed_table(bits: int) -> bytes:
+    return bytes(int('{:0{}b}'.format(i, bits)[::-1], 2) for i in range(1 << bits))
 
-class LaserControl(I2CModule):
+
+class LaserControl(PortExpander):
     LASER_COUNT = 6
+    PRIORITY = Priority.BULK
+    # Port byte for every combination of lasers, laser i in bit i of the index
+    PORT = bytes(map(_port_byte, range(1 << LASER_COUNT)))
+    # Converts between laser i in bit i and laser 0 as the most significant bit, either way
+    REVERSED = _reversed_table(LASER_COUNT)
+    ABSENT = {'mask': 0, 'state': 0, 'batch': nullcontext()}
 
     def __init__(self, bus: SMBus, addr=0x3a):
         super().__init__(bus, addr)
-        self._state = bitarray([False]*self.LASER_COUNT, endian='little')
-        self._update()
+        # Laser i in bit i
+        self._lasers = 0
+        self._batch_depth = 0
+        self._dirty = False
+        self.write_port(self.PORT[self._lasers], force=True)
+
+    def _positions(self, pos) -> range:
+        if isinstance(pos, slice):
+            return range(*pos.indices(self.LASER_COUNT))
+        if not -self.LASER_COUNT <= pos < self.LASER_COUNT:
+            raise IndexError('Laser {} out of range'.format(pos))
+        return range(pos % self.LASER_COUNT, pos % self.LASER_COUNT + 1)
 
     def __getitem__(self, pos):
-        return self._state.__getitem__(pos)
+        if isinstance(pos, slice):
+            return [bool(self._lasers >> i & 1) for i in self._positions(pos)]
+        return bool(self._lasers >> self._positions(pos)[0] & 1)
 
     def __setitem__(self, pos, value):
-        self._state.__setitem__(pos, value)
-        self._update()
+        lasers = self._lasers
+        for i in self._positions(pos):
+            if value:
+                lasers |= 1 << i
+            else:
+                lasers &= ~(1 << i)
+        if lasers != self._lasers:
+            self._lasers = lasers
+            self._update()
 
     @property
-    def state(self):
-        return self._state.tobytes()[0]
+    def mask(self) -> int:
+        """
+        The lasers as an integer, laser i in bit i
+        """
+        return self._lasers
+
+    @mask.setter
+    def mask(self, value: int):
+        value &= (1 << self.LASER_COUNT) - 1
+        if value != self._lasers:
+            self._lasers = value
+            self._update()
+
+    def write_mask(self, value: int) -> bool:
+        """
+        Set the lasers like mask, and write the port again if the last write of it failed
+        :param value: The lasers, laser i in bit i
+        :return: True if the port holds the lasers, or they will be written at the end of a batch
+        """
+        self._lasers = value & (1 << self.LASER_COUNT) - 1
+        return self._update()
+
+    @property
+    def state(self) -> int:
+        """
+        The lasers as an integer, laser 0 is the most significant bit
+        """
+        return self.REVERSED[self._lasers]
 
     @state.setter
-    def state(self, byte):
-        self._state = bitarray(endian='little')
-        self._state.frombytes(byte.to_bytes(1, byteorder='little'))
+    def state(self, value):
+        """
+        :param value: An integer (or a string of one) with laser 0 as the most significant bit, or bytes in little endian
+        """
+        if isinstance(value, (bytes, bytearray)):
+            number = int.from_bytes(value, byteorder='little')
+        else:
+            number = int(value)
+        self._lasers = self.REVERSED[number % (1 << self.LASER_COUNT)]
         self._update()
 
-    @state.setter
-    def state(self, number: int):
-        # You passed an integer, write that integer to the lasers
-        i = 0
-        # Iterate through binary but skip 0b at beginning
-        for c in bin(int(number) % (2**self.LASER_COUNT))[2:].zfill(self.LASER_COUNT):
-            self[i] = (c == '1')
-            i += 1
-
-    def _update(self):
-        buf = bitarray(self._state)
-        buf.invert()
-        buf[4], buf[5] = buf[5], buf[4]
-        self.write_byte(buf.tobytes()[0])
+    @contextmanager
+    def batch(self):
+        """
+        Collect every change made inside the block and write them to the port once at the end
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._dirty:
+                self._update()
+
+    def _update(self) -> bool:
+        if self._batch_depth:
+            self._dirty = True
+            return True
+        self._dirty = False
+        return self.write_port(self.PORT[self._lasers])
 
     def reset(self):
         self[:] = False
 
 
-from time import sleep
 if __name__ == '__main__':
     from sys import argv
+    from threading import Event
+
+    from Project_Theseus_API.i2c.laser_patterns import PatternPlayer, chase
 
     master = SMBus(1)
     lasers = LaserControl(master)
     lasers[:] = False
     option = argv[1]
     if option == "cycle":
-        i = 0
-        j = -1
-        k = -2
-        while True:
-            k = j
-            j = i
-            i += 1
-            if i >= lasers.LASER_COUNT:
-                i = 0
-            lasers[i] = True
-            lasers[k] = False
-
-            sleep(.1)
+        # Two lasers lit at a time, moving up one every 0.1 s
+        PatternPlayer(lasers).play(chase(.1, width=2))
+        Event().wait()
     else:
         try:
             lasers.state = option
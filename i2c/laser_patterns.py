@@ -0,0 +1,196 @@
+import logging
+import random
+from array import array
+from bisect import bisect_right
+from math import floor
+from threading import RLock
+from typing import Iterable, Tuple
+
+from Project_Theseus_API.i2c.laser_i2c import LaserControl
+from Project_Theseus_API.i2c.timers import TimerWheel, default_timers
+
+logger = logging.getLogger(__name__)
+
+ALL = (1 << LaserControl.LASER_COUNT) - 1
+
+
+class Pattern:
+    """
+    A laser animation compiled to frames: frame i shows masks[i], laser i in bit i, from offsets[i] seconds after the
+    start until the next frame. Frames that would not change the lasers are merged when the pattern is compiled.
+    """
+    __slots__ = ('offsets', 'masks', 'duration', 'loop')
+
+    def __init__(self, frames: Iterable[Tuple[float, int]], loop: bool = True):
+        """
+        :param frames: (seconds shown, mask) for each frame
+        :param loop: Start over at the end, else the last frame stays on
+        """
+        self.offsets = array('d')
+        self.masks = array('B')
+        self.loop = loop
+        t = 0.0
+        for hold, mask in frames:
+            if hold < 0:
+                raise ValueError('Frame held for {} seconds'.format(hold))
+            mask &= ALL
+            if not self.masks or self.masks[-1] != mask:
+                self.offsets.append(t)
+                self.masks.append(mask)
+            t += hold
+        if not self.masks:
+            raise ValueError('A pattern needs at least one frame')
+        self.duration = t
+        if loop and t <= 0:
+            raise ValueError('A looping pattern needs a duration')
+
+    def __len__(self):
+        return len(self.masks)
+
+    def frame(self, t: float) -> int:
+        """
+        :param t: Seconds since the start, wrapped round for a looping pattern
+        :return: The index of the frame shown at t
+        """
+        return max(bisect_right(self.offsets, t) - 1, 0)
+
+
+def keyframes(frames: Iterable[Tuple[float, int]], loop: bool = True) -> Pattern:
+    """
+    :param frames: (seconds shown, mask) for each frame, laser i in bit i of the mask
+    """
+    return Pattern(frames, loop)
+
+
+def sweep(interval: float, loop: bool = True) -> Pattern:
+    """
+    Count through every combination of lasers, laser 0 as the most significant bit as in LaserControl.state
+    """
+    return Pattern(((interval, LaserControl.REVERSED[state]) for state in range(ALL + 1)), loop)
+
+
+def chase(interval: float, width: int = 1, loop: bool = True) -> Pattern:
+    """
+    A run of width lasers moving up one laser per frame and wrapping round
+    """
+    count = LaserControl.LASER_COUNT
+    run = (1 << width) - 1
+    return Pattern(((interval, (run << i | run >> count - i) & ALL) for i in range(count)), loop)
+
+
+def random_masks(interval: float, frames: int, seed=None, loop: bool = True) -> Pattern:
+    """
+    :param frames: Random masks to compile, the pattern repeats them when it loops
+    :param seed: Seeds the masks so a pattern can be compiled again the same
+    """
+    rng = random.Random(seed)
+    return Pattern(((interval, rng.getrandbits(LaserControl.LASER_COUNT)) for _ in range(frames)), loop)
+
+
+class PatternPlayer:
+    """
+    Plays compiled patterns on a LaserControl from the timer wheel.
+
+    Frame deadlines are worked out from when the pattern started, not from when the last frame was shown, so timing
+    doesn't drift. A frame whose time has passed by the time the wheel gets to it is skipped in favour of the one that
+    is due, and the lasers are only written when the mask changes. A frame whose write failed is written again on the
+    next tick of the wheel.
+    """
+
+    def __init__(self, lasers: LaserControl, timers: TimerWheel = None):
+        """
+        :param lasers: The lasers to drive
+        :param timers: Runs the frames, defaults to the shared timer wheel
+        """
+        self.lasers = lasers
+        self.timers = timers if timers is not None else default_timers()
+        self.pattern = None
+        self._start = None
+        self._handle = None
+        # Frame the next step expects to show, counting across loops, to count the skipped ones
+        self._next = 0
+        # Mask of the last write the lasers acked, None until one is or after a failed write
+        self._written = None
+        self._lock = RLock()
+        self.frames = 0
+        self.skipped = 0
+        self.writes = 0
+
+    @property
+    def playing(self) -> bool:
+        return self._start is not None
+
+    def play(self, pattern: Pattern) -> 'PatternPlayer':
+        """
+        Start pattern from its first frame, replacing whatever was playing
+        """
+        with self._lock:
+            self.pattern = pattern
+            self._start = self.timers.clock()
+            self._next = 0
+        self._step()
+        return self
+
+    def stop(self):
+        """
+        Stop at the current frame, the lasers are left as they are
+        """
+        with self._lock:
+            self._start = None
+            if self._handle is not None:
+                self._handle.cancel()
+
+    def _step(self):
+        with self._lock:
+            pattern = self.pattern
+            start = self._start
+            if start is None:
+                return
+            now = self.timers.clock()
+            elapsed = now - start
+            n = len(pattern)
+            if pattern.loop:
+                cycle = floor(elapsed / pattern.duration)
+                elapsed -= cycle * pattern.duration
+            elif elapsed >= pattern.duration:
+                cycle = 0
+                elapsed = pattern.duration
+            else:
+                cycle = 0
+            i = pattern.frame(elapsed)
+            position = cycle * n + i
+            # The wheel can wake a hair before a deadline, that is still the frame already shown
+            if position >= self._next:
+                self.skipped += position - self._next
+                self._next = position + 1
+                self.frames += 1
+
+            mask = pattern.masks[i]
+            failed = False
+            if mask != self._written or mask != self.lasers.mask:
+                if self.lasers.write_mask(mask):
+                    self._written = mask
+                    self.writes += 1
+                else:
+                    self._written = None
+                    failed = True
+
+            if i + 1 < n:
+                deadline = start + cycle * pattern.duration + pattern.offsets[i + 1]
+            elif pattern.loop:
+                deadline = start + (cycle + 1) * pattern.duration
+            elif failed:
+                # The last frame stays on, so it is retried until it is written
+                deadline = now
+            else:
+                self._start = None
+                return
+            # A retry comes a tick later rather than straight away, whatever the next frame's deadline
+            delay = self.timers.tick if failed else deadline - now
+            if self._handle is None:
+                self._handle = self.timers.schedule(delay, self._step)
+            else:
+                self._handle.reschedule(delay)
+
+    def stats(self) -> dict:
+        return {'frames': self.frames, 'skipped': self.skipped, 'writes': self.writes}
@@ -1,9 +1,15 @@
+import logging
 from enum import IntEnum
+from time import monotonic
+from typing import List, NamedTuple
 
 from smbus2 import SMBus
 
+from Project_Theseus_API.i2c.bus_arbiter import Priority
 from Project_Theseus_API.i2c.i2c_module import I2CModule
 
+logger = logging.getLogger(__name__)
+
 
 class COLOR(IntEnum):
     BLANK = 0b0000000
@@ -12,13 +18,39 @@ class COLOR(IntEnum):
     BLUE = 0b0000011
 
 
+class KeyEvent(NamedTuple):
+    key: str
+    # Arduino sequence number, counts every key pressed modulo 256
+    seq: int
+    timestamp: float
+    # Keys the Arduino dropped just before this one because its buffer was full
+    lost: int = 0
+
+
 class ArduinoI2C(I2CModule):
-    NO_DATA = '.'.encode()
-    EMPTY = b'\xff'
+    """
+    The lid kit sketch. Reads return a frame of the pending keys, {count, seq, keys...}, where seq is the sequence
+    number of the first key. Keys stay on the Arduino until they are acked, so a failed read loses nothing, and a jump
+    in seq shows keys the Arduino had to drop.
+    """
+    PRIORITY = Priority.INPUT
+    # Not shadowed, the Arduino resets without a bus error (watchdog, USB) and comes back blank, so every colour
+    # write has to reach it
+    # Two byte write {KEYPAD_ACK, seq} drops every key up to and including the one numbered seq
+    KEYPAD_ACK = 0x23
+    FRAME_HEADER = 2
+    # The Arduino's Wire buffer holds 32 bytes
+    MAX_FRAME_KEYS = 30
+    ABSENT = {'color': COLOR.BLANK, 'keypad': [], 'read_keys': [], 'lost': 0, 'repeated': 0}
 
     def __init__(self, bus: SMBus, address: hex = 0x0d):
         I2CModule.__init__(self, bus, address)
         self.current_color = COLOR.BLANK
+        # Sequence number of the next key expected, None until the first frame
+        self.next_seq = None
+        # Keys dropped by the Arduino, and keys read twice because an ack was lost
+        self.lost = 0
+        self.repeated = 0
 
     @property
     def color(self):
@@ -30,12 +62,56 @@ class ArduinoI2C(I2CModule):
         self.write_byte(color)
 
     @property
-    def keypad(self) -> chr:
-        # TODO device won't read data unless listening on serial too
-        # success, data = self.read_reg_bytes(self.current_color, 16)
-        success, data = self.read_bytes(16)
-        data = [chr(x) for x in data if x.to_bytes(1, 'little') != self.NO_DATA and x.to_bytes(1, 'little') != self.EMPTY]
-        return data
+    def keypad(self) -> List[str]:
+        return [e.key for e in self.read_keys() or ()]
+
+    def read_keys(self) -> List[KeyEvent]:
+        """
+        Read the count byte and, if there are keys waiting, the frame holding them, then ack them
+        :return: The new keys, None if the bus failed
+        """
+        success, count = self.read_byte()
+        if not success:
+            return None
+        # 0xFF is the Wire padding of a sketch with nothing to send, anything over the frame size isn't a count
+        if not count or count > self.MAX_FRAME_KEYS:
+            return []
+        success, frame = self.read_bytes(self.FRAME_HEADER + count)
+        if not success:
+            return None
+        count, seq = frame[0], frame[1]
+        if count > self.MAX_FRAME_KEYS:
+            return []
+        # More keys may have arrived since the count byte, only the ones read are acked
+        keys = frame[self.FRAME_HEADER:self.FRAME_HEADER + count]
+        count = len(keys)
+        skip = lost = 0
+        if self.next_seq is not None:
+            behind = (self.next_seq - seq) & 0xFF
+            if behind < 0x80:
+                # The last ack didn't arrive, the first keys were already delivered
+                skip = min(behind, count)
+                self.repeated += skip
+            else:
+                lost = 0x100 - behind
+                self.lost += lost
+                logger.warning('Keypad dropped {} keys'.format(lost))
+        now = monotonic()
+        events = [KeyEvent(chr(keys[i]), (seq + i) & 0xFF, now, lost if i == skip else 0)
+                  for i in range(skip, count)]
+        self.next_seq = (seq + count) & 0xFF
+        if count:
+            self.ack((seq + count - 1) & 0xFF)
+        return events
+
+    @I2CModule._write_except
+    def ack(self, seq: int):
+        """
+        Tell the Arduino every key up to and including seq has been read. Acking by sequence number rather than count
+        drops the right keys even if the Arduino dropped or took more keys since the frame was read.
+        """
+        # Not shadowed, every ack has to reach the Arduino even when it repeats the last one
+        self._call('write_byte_data', self.address, self.KEYPAD_ACK, seq)
 
 
 if __name__ == "__main__":
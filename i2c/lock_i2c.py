@@ -1,47 +1,84 @@
 from smbus2 import SMBus
-from sched import scheduler
-from Project_Theseus_API.i2c.i2c_module import I2CModule
+from Project_Theseus_API.i2c.bus_arbiter import Priority
+from Project_Theseus_API.i2c.expander import PortExpander
+from Project_Theseus_API.i2c.policy import RetryPolicy
+from Project_Theseus_API.i2c.timers import TimerWheel, default_timers
 import time
 import logging
-from threading import Timer
 
 logger = logging.Logger(__name__)
 
 
-class BoxLock(I2CModule):
+class BoxLock(PortExpander):
     OPEN_TIME = 6
+    PRIORITY = Priority.CRITICAL
+    # Input pin that is high while the lock has power
+    POWERED = 0x40
+    # Output pin that releases the solenoid while low, the rest of the port is read
+    SOLENOID = 0x80
+    INPUTS = 0xFF & ~SOLENOID
+    # Failing to close must not go unnoticed or retry forever, see close
+    policy = RetryPolicy()
+    ABSENT = {'powered': False, 'is_powered': False}
 
-    def __init__(self, bus, addr=0x39):
+    def __init__(self, bus, addr=0x39, timers: TimerWheel = None):
+        """
+        :param timers: Runs the auto close and close retries, defaults to the shared timer wheel
+        """
         super().__init__(bus, addr)
         self._open = False
-        self.write_byte(0xFF)
-        self.scheduler = scheduler(time.time, time.sleep)
-        self.timer = Timer(0, self.close)
+        self.timers = timers if timers is not None else default_timers()
+        # Pending auto close or close retry
+        self.timer = None
+        self.write_port(self.SOLENOID, self.SOLENOID, force=True)
 
     @property
-    def powered(self):
-        return bool(self.read_byte()[1] & 0x40)
+    def powered(self) -> bool:
+        """
+        :return: Whether the lock has power, False if the port can't be read
+        """
+        return self.is_powered()
+
+    def is_powered(self, max_age: float = None) -> bool:
+        """
+        :param max_age: Reuse a read of the port this many seconds old, defaults to MAX_AGE
+        :return: Whether the lock has power, False if the port can't be read
+        """
+        return bool(self.pin(self.POWERED, max_age))
 
     def open(self):
         if self._open:
-            if not self.timer.is_alive():
+            if self.timer is None or not self.timer.active:
                 logger.error('Lock open and timer not running! Closing.')
                 self.close()
         else:
-            s = self.write_byte(0x7F)
+            s = self.write_port(0, self.SOLENOID)
             if s:
                 self._open = True
-                self.timer = Timer(self.OPEN_TIME, self.close)
-                self.timer.start()
+                self._close_in(self.OPEN_TIME)
+
+    def _close_in(self, delay: float):
+        if self.timer is not None:
+            self.timer.reschedule(delay)
+        else:
+            self.timer = self.timers.schedule(delay, self.close)
 
     def close(self):
-        s = self.write_byte(0xFF)
+        if self.timer is not None:
+            self.timer.cancel()
+        # Forced, the latch can say closed when the solenoid isn't, e.g. after the device reset
+        s = self.write_port(self.SOLENOID, self.SOLENOID, force=True)
         if s:
             self._open = False
         else:
             logger.error('Solenoid close failed!!!!')
-            self.timer = Timer(1, self.close)
-            self.timer.start()
+            breaker = self.breaker
+            if breaker is not None and not breaker.allow():
+                # The lock is down, close it as soon as the probe finds it again
+                breaker.on_recover(self.close)
+            else:
+                # Each failed close counts towards tripping the breaker, so this stops once the lock is marked down
+                self._close_in(1)
 
 
 def main():
@@ -0,0 +1,192 @@
+import json
+import os
+from array import array
+from threading import Lock
+from typing import Dict, List, Tuple
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of nanosecond latencies, in the style of HdrHistogram.
+
+    Values below SUB_COUNT get a bucket each, above that each power of two is split into SUB_COUNT / 2 buckets,
+    so a value is never off by more than 1 / (SUB_COUNT / 2) of itself.
+    """
+    SUB_BITS = 5
+    SUB_COUNT = 1 << SUB_BITS
+    HALF = SUB_COUNT >> 1
+    # Enough buckets for 2 ** 48 ns, about 3 days
+    BUCKETS = SUB_COUNT + (48 - SUB_BITS) * HALF
+
+    def __init__(self):
+        self.counts = array('Q', bytes(8 * self.BUCKETS))
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @classmethod
+    def index(cls, value: int) -> int:
+        if value < cls.SUB_COUNT:
+            return value
+        shift = value.bit_length() - cls.SUB_BITS
+        return min(shift * cls.HALF + (value >> shift), cls.BUCKETS - 1)
+
+    @classmethod
+    def lower_bound(cls, index: int) -> int:
+        if index < cls.SUB_COUNT:
+            return index
+        shift = index // cls.HALF - 1
+        return (index - shift * cls.HALF) << shift
+
+    @classmethod
+    def upper_bound(cls, index: int) -> int:
+        """
+        :return: The smallest value above the bucket
+        """
+        return cls.lower_bound(index + 1)
+
+    def record(self, value: int):
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> int:
+        """
+        :param p: Percentile from 0 to 100
+        :return: The upper bound of the bucket holding the percentile, capped at the largest value seen
+        """
+        if not self.count:
+            return 0
+        rank = max(1, int(round(p / 100 * self.count)))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(self.upper_bound(i) - 1, self.max)
+        return self.max
+
+    def buckets(self) -> List[Tuple[int, int]]:
+        """
+        :return: (exclusive upper bound, count) of every bucket with values in it
+        """
+        return [(self.upper_bound(i), c) for i, c in enumerate(self.counts) if c]
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'sum_ns': self.total,
+            'min_ns': self.min or 0,
+            'max_ns': self.max,
+            'mean_ns': self.total / self.count if self.count else 0,
+            'p50_ns': self.percentile(50),
+            'p90_ns': self.percentile(90),
+            'p99_ns': self.percentile(99),
+            'p999_ns': self.percentile(99.9),
+        }
+
+
+class OpStats:
+    __slots__ = ('count', 'bytes', 'errors', 'latency')
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+
+
+class BusMetrics:
+    """
+    Counts, bytes, errors and latency of bus calls by device address and SMBus method.
+
+    Set I2CModule.metrics (or a driver class's) to a BusMetrics to start recording, None turns it off again.
+    """
+    # Prometheus histogram bucket bounds in seconds
+    PROMETHEUS_BUCKETS = (50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3, 50e-3, 100e-3)
+
+    def __init__(self, prefix: str = 'theseus_i2c'):
+        self.prefix = prefix
+        self._ops = {}
+        self._lock = Lock()
+
+    def record(self, address: int, op: str, ns: int, n_bytes: int, error: bool = False):
+        key = (address, op)
+        with self._lock:
+            stats = self._ops.get(key)
+            if stats is None:
+                stats = self._ops[key] = OpStats()
+            stats.count += 1
+            if error:
+                stats.errors += 1
+            else:
+                stats.bytes += n_bytes
+            stats.latency.record(ns)
+
+    def reset(self):
+        with self._lock:
+            self._ops.clear()
+
+    def snapshot(self) -> List[dict]:
+        """
+        :return: One entry per address and method, the devices that used the most bus time first
+        """
+        with self._lock:
+            entries = [dict(address=hex(address), op=op, count=s.count, bytes=s.bytes, errors=s.errors,
+                            latency=s.latency.snapshot())
+                       for (address, op), s in self._ops.items()]
+        entries.sort(key=lambda e: e['latency']['sum_ns'], reverse=True)
+        return entries
+
+    def bus_time(self) -> Dict[str, float]:
+        """
+        :return: Seconds spent on the bus by each address, largest first
+        """
+        totals = {}
+        for e in self.snapshot():
+            totals[e['address']] = totals.get(e['address'], 0) + e['latency']['sum_ns'] / 1e9
+        return dict(sorted(totals.items(), key=lambda t: t[1], reverse=True))
+
+    def to_json(self, path: str):
+        """
+        Write the snapshot to a JSON file, replacing it atomically
+        """
+        tmp = '{}.tmp'.format(path)
+        with open(tmp, 'w') as f:
+            json.dump({'ops': self.snapshot(), 'bus_time': self.bus_time()}, f, indent=2)
+        os.replace(tmp, path)
+
+    def to_prometheus(self) -> str:
+        """
+        :return: The metrics in the Prometheus text exposition format
+        """
+        p = self.prefix
+        lines = [
+            '# HELP {}_ops_total I2C transactions.'.format(p),
+            '# TYPE {}_ops_total counter'.format(p),
+        ]
+        with self._lock:
+            items = [((hex(address), op), s.count, s.bytes, s.errors, s.latency.buckets(), s.latency.total)
+                     for (address, op), s in sorted(self._ops.items())]
+        labels = {key: 'address="{}",op="{}"'.format(*key) for key, *_ in items}
+        lines += ['{}_ops_total{{{}}} {}'.format(p, labels[key], count) for key, count, *_ in items]
+        lines += ['# HELP {}_bytes_total Bytes moved by successful transactions.'.format(p),
+                  '# TYPE {}_bytes_total counter'.format(p)]
+        lines += ['{}_bytes_total{{{}}} {}'.format(p, labels[key], n) for key, _, n, *_ in items]
+        lines += ['# HELP {}_errors_total Transactions that raised OSError.'.format(p),
+                  '# TYPE {}_errors_total counter'.format(p)]
+        lines += ['{}_errors_total{{{}}} {}'.format(p, labels[key], n) for key, _, _, n, *_ in items]
+        lines += ['# HELP {}_latency_seconds Transaction latency.'.format(p),
+                  '# TYPE {}_latency_seconds histogram'.format(p)]
+        for key, count, _, _, buckets, total in items:
+            for le in self.PROMETHEUS_BUCKETS:
+                below = sum(c for upper, c in buckets if upper <= le * 1e9)
+                lines.append('{}_latency_seconds_bucket{{{},le="{}"}} {}'.format(p, labels[key], le, below))
+            lines.append('{}_latency_seconds_bucket{{{},le="+Inf"}} {}'.format(p, labels[key], count))
+            lines.append('{}_latency_seconds_sum{{{}}} {}'.format(p, labels[key], total / 1e9))
+            lines.append('{}_latency_seconds_count{{{}}} {}'.format(p, labels[key], count))
+        return '\n'.join(lines) + '\n'
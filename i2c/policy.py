@@ -0,0 +1,150 @@
+import errno
+import logging
+import random
+from enum import Enum
+from threading import Lock
+from time import monotonic
+from typing import Callable, List
+from weakref import WeakSet
+
+from Project_Theseus_API.i2c.timers import TimerWheel, default_timers
+
+logger = logging.getLogger(__name__)
+
+
+class BreakerState(Enum):
+    CLOSED = 'closed'        # device is up, calls go through
+    OPEN = 'open'            # device is down, calls fail fast
+    HALF_OPEN = 'half_open'  # a probe is checking whether the device is back
+
+
+class DeviceUnavailable(OSError):
+    """
+    Raised instead of touching the bus while a device's breaker is open
+    """
+
+    def __init__(self, address: int):
+        super().__init__(errno.EHOSTDOWN, 'Device {} is down'.format(hex(address)))
+        self.address = address
+
+
+class RetryPolicy:
+    def __init__(self, retries: int = 2, backoff: float = 0.002, max_backoff: float = 0.05, jitter: float = 0.5,
+                 failure_threshold: int = 3, probe_interval: float = 1.0):
+        """
+        :param retries: Extra attempts after a call fails
+        :param backoff: Delay before the first retry in seconds, doubled for each retry after it
+        :param max_backoff: Longest delay between retries
+        :param jitter: Fraction of each delay that is randomised, so devices don't retry in lockstep
+        :param failure_threshold: Failed calls in a row (after their retries) that mark the device down
+        :param probe_interval: Seconds between background probes of a device that is down
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+
+    def delay(self, attempt: int) -> float:
+        """
+        :param attempt: 0 for the first retry
+        """
+        delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+        return delay * (1 - self.jitter * random.random())
+
+
+# Every breaker that exists, for monitoring
+_breakers = WeakSet()
+
+
+def breakers() -> List[dict]:
+    """
+    :return: The state of every device breaker
+    """
+    return [b.snapshot() for b in list(_breakers)]
+
+
+class CircuitBreaker:
+    def __init__(self, policy: RetryPolicy, address: int, probe: Callable[[], None], timers: TimerWheel = None):
+        """
+        :param policy: Thresholds and probe interval
+        :param address: The device, for reporting
+        :param probe: Touches the device, raises OSError if it is still down
+        :param timers: Runs the probes, defaults to the shared timer wheel
+        """
+        self.policy = policy
+        self.address = address
+        self.probe = probe
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.last_error = None
+        self.opened_at = None
+        self._recover = []
+        self._timers = timers
+        self._lock = Lock()
+        _breakers.add(self)
+
+    def allow(self) -> bool:
+        return self.state is BreakerState.CLOSED
+
+    def success(self):
+        if self.failures:
+            with self._lock:
+                self.failures = 0
+
+    def failure(self, error: OSError):
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            if self.state is BreakerState.CLOSED and self.failures >= self.policy.failure_threshold:
+                logger.error('Device {} is down after {} failures: {}'.format(hex(self.address), self.failures, error))
+                self.state = BreakerState.OPEN
+                self.opened_at = monotonic()
+                self.trips += 1
+                self._schedule_probe()
+
+    def on_recover(self, callback: Callable[[], None]):
+        """
+        Call back once, the next time the device comes back up
+        """
+        with self._lock:
+            if callback not in self._recover:
+                self._recover.append(callback)
+
+    def _schedule_probe(self):
+        timers = self._timers if self._timers is not None else default_timers()
+        timers.schedule(self.policy.probe_interval, self._probe)
+
+    def _probe(self):
+        with self._lock:
+            if self.state is not BreakerState.OPEN:
+                return
+            self.state = BreakerState.HALF_OPEN
+        try:
+            self.probe()
+        except OSError as e:
+            with self._lock:
+                self.last_error = e
+                self.state = BreakerState.OPEN
+                self._schedule_probe()
+            return
+        with self._lock:
+            logger.info('Device {} is back up'.format(hex(self.address)))
+            self.state = BreakerState.CLOSED
+            self.failures = 0
+            self.opened_at = None
+            recover, self._recover = self._recover, []
+        for callback in recover:
+            callback()
+
+    def snapshot(self) -> dict:
+        return {
+            'address': hex(self.address),
+            'state': self.state.value,
+            'failures': self.failures,
+            'trips': self.trips,
+            'down_for': monotonic() - self.opened_at if self.opened_at is not None else 0.0,
+            'last_error': str(self.last_error) if self.last_error else None,
+        }
@@ -0,0 +1,128 @@
+import logging
+from array import array
+from threading import Condition, Event, Thread
+from time import monotonic
+from typing import List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Sample(NamedTuple):
+    timestamp: float
+    values: Tuple[int, ...]
+    mask: int
+
+
+class ReceptorSampler:
+    """
+    Reads every receptor at a fixed rate on one thread and keeps the samples in a ring buffer.
+
+    Use ReceptorControl.sample() to start one, the control then answers reads from here.
+    """
+
+    def __init__(self, receptors, rate: float = 100.0, size: int = 1024):
+        """
+        :param receptors: The ReceptorControl to sample
+        :param rate: Samples per second
+        :param size: Number of samples kept
+        """
+        self.receptors = receptors
+        self.period = 1.0 / rate
+        self.size = size
+        self.channels = receptors.RECEPTOR_COUNT
+        self._times = array('d', bytes(8 * size))
+        self._values = array('H', bytes(2 * size * self.channels))
+        self._masks = array('B', bytes(size))
+        # Total samples written, the newest is at (_count - 1) % size
+        self._count = 0
+        self.overruns = 0
+        self._changed = Condition()
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name='receptor-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive() and not self._stop.is_set()
+
+    def _sample(self, i: int) -> Sample:
+        slot = i % self.size
+        start = slot * self.channels
+        return Sample(self._times[slot], tuple(self._values[start:start + self.channels]), self._masks[slot])
+
+    def _store(self, timestamp: float, values: List[int], mask: int):
+        with self._changed:
+            slot = self._count % self.size
+            start = slot * self.channels
+            self._times[slot] = timestamp
+            self._values[start:start + self.channels] = array('H', values)
+            self._masks[slot] = mask
+            self._count += 1
+            self._changed.notify_all()
+
+    def _run(self):
+        deadline = monotonic()
+        while not self._stop.is_set():
+            if self.receptors.read_bus():
+                self._store(monotonic(), self.receptors.receptors, self.receptors.mask)
+            deadline += self.period
+            delay = deadline - monotonic()
+            if delay < 0:
+                # Fell behind, skip the missed samples instead of bursting to catch up
+                self.overruns += 1
+                deadline = monotonic()
+            else:
+                self._stop.wait(delay)
+
+    def latest(self) -> Optional[Sample]:
+        """
+        :return: The newest sample, or None before the first one
+        """
+        with self._changed:
+            if not self._count:
+                return None
+            return self._sample(self._count - 1)
+
+    def window(self, seconds: float) -> List[Sample]:
+        """
+        :return: The samples taken in the last `seconds`, oldest first
+        """
+        since = monotonic() - seconds
+        with self._changed:
+            samples = []
+            for i in range(self._count - 1, max(self._count - self.size, 0) - 1, -1):
+                if self._times[i % self.size] < since:
+                    break
+                samples.append(self._sample(i))
+        samples.reverse()
+        return samples
+
+    def wait_for_change(self, mask: int = None, timeout: float = None) -> Optional[Sample]:
+        """
+        Block until a sample's threshold mask differs from `mask`
+        :param mask: The mask to compare against, defaults to the latest sample's
+        :param timeout: Seconds to wait, None waits forever
+        :return: The first sample with a different mask, or None on timeout
+        """
+        with self._changed:
+            seen = self._count
+            if mask is None:
+                mask = self._masks[(seen - 1) % self.size] if seen else None
+            deadline = None if timeout is None else monotonic() + timeout
+            while True:
+                for i in range(max(seen, self._count - self.size), self._count):
+                    if self._masks[i % self.size] != mask:
+                        return self._sample(i)
+                seen = self._count
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
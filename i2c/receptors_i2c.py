@@ -1,13 +1,19 @@
-from array import array
 from enum import IntEnum
-from struct import unpack
+from struct import Struct
 from time import sleep
-from typing import List, Union
+from typing import List, Tuple
 import logging
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from smbus2 import SMBus
 
+from Project_Theseus_API.i2c.bus_arbiter import Priority
 from Project_Theseus_API.i2c.i2c_module import I2CModule
+from Project_Theseus_API.i2c.receptor_sampler import ReceptorSampler, Sample
 
 
 logger = logging.Logger(__name__)
@@ -34,42 +40,188 @@ class ReceptorRegisters(IntEnum):
 
 class ReceptorControl(I2CModule):
     RECEPTOR_COUNT = 6
+    PRIORITY = Priority.INPUT
     CHANNEL = [0x80, 0x90, 0xA0, 0xB0, 0xC0, 0xD0, 0xE0, 0xF0]
     CONFIG = [0x03, 0xF8]
     READ_ALL = 0x70
     THRESHOLD = 1300
-    # UNPACK_ALL = ''.join(['>'].extend(['H']*RECEPTOR_COUNT))
-    UNPACK_ALL = '>HHHHHH'
+    UNPACK_ALL = Struct('>' + 'H' * RECEPTOR_COUNT)
+    UNPACK_ONE = Struct('>H')
+    # Config bit that enables limit checking and the ALERT pin
+    ALERT_ENABLE = 0x04
+    # Only the first 4 channels have limit and hysteresis registers
+    ALERT_CHANNELS = 4
+    DATA_LOW = [ReceptorRegisters.Data1Low, ReceptorRegisters.Data2Low,
+                ReceptorRegisters.Data3Low, ReceptorRegisters.Data4Low]
+    DATA_HIGH = [ReceptorRegisters.Data1High, ReceptorRegisters.Data2High,
+                 ReceptorRegisters.Data3High, ReceptorRegisters.Data4High]
+    HYST = [ReceptorRegisters.Hyst1, ReceptorRegisters.Hyst2, ReceptorRegisters.Hyst3, ReceptorRegisters.Hyst4]
+    ABSENT = {'receptors': [0] * RECEPTOR_COUNT, 'mask': 0, 'sampler': None, 'alerts': False, 'read_bus': False,
+              'read_raw': [], 'read': [], 'read_int': 0}
 
     def __init__(self, bus: SMBus, address: hex = 0x21):
         super().__init__(bus, address)
         self.receptors = [0] * self.RECEPTOR_COUNT
+        # Bit (RECEPTOR_COUNT - 1 - n) is set when receptor n is above THRESHOLD
+        self.mask = 0
+        self.sampler = None
+        self.alerts = False
+        self.gpio = None
+        self.alert_pin = None
+        self.write_reg_bytes(ReceptorRegisters.Config, self.CONFIG)
+
+    def decode(self, data, unpacker: Struct = UNPACK_ALL) -> Tuple[List[int], int]:
+        """
+        Convert a block read into receptor values and a threshold mask in one pass
+        :param data: Big endian conversion results, the channel id in the top nibble of each is ignored
+        :return: The receptor values and the mask of receptors above THRESHOLD, receptor 0 in the highest bit
+        """
+        return decode_block(data, self.THRESHOLD, unpacker)
+
+    def read_bus(self) -> bool:
+        """
+        Read every receptor from the device into receptors and mask
+        :return: False if the read failed and the previous reading was kept
+        """
+        if self.alerts:
+            return self.poll_alerts()
+        success, data = self.read_reg_bytes(self.READ_ALL, self.UNPACK_ALL.size)
+        if success:
+            self.receptors, self.mask = self.decode(data)
+        else:
+            logger.error('Receptor read failed, reusing last reading')
+        return success
+
+    def enable_alerts(self, cycle_time: int = 1, hysteresis: int = 64, gpio=None, pin: int = None) -> bool:
+        """
+        Let the ADC convert on its own and flag channels that cross THRESHOLD, polls then only read the Alert register
+        :param cycle_time: Automatic conversion interval, 1 to 7 for 32 to 2048 conversion times
+        :param hysteresis: Raw counts a channel has to move back past a limit before it can alert again
+        :param gpio: An RPi.GPIO compatible module if the ALERT pin is wired, enables wait_for_alert()
+        :param pin: The GPIO pin wired to ALERT
+        """
+        assert 1 <= cycle_time <= 7, "Cycle time is out of range: {}".format(cycle_time)
+        self.alerts = False
+        if not self.read_bus():
+            return False
+        for ch in range(self.ALERT_CHANNELS):
+            self.write_reg_bytes(self.HYST[ch], list(hysteresis.to_bytes(2, 'big')))
+            self._arm(ch)
+        self.write_reg_bytes(ReceptorRegisters.Config, [self.CONFIG[0], self.CONFIG[1] | self.ALERT_ENABLE])
+        self.write_reg_byte(ReceptorRegisters.CycleTime, cycle_time)
+        if gpio is not None:
+            gpio.setup(pin, gpio.IN)
+        self.gpio = gpio
+        self.alert_pin = pin
+        self.alerts = True
+        return True
+
+    def disable_alerts(self):
+        self.alerts = False
+        self.write_reg_byte(ReceptorRegisters.CycleTime, 0)
         self.write_reg_bytes(ReceptorRegisters.Config, self.CONFIG)
 
+    def _arm(self, ch: int):
+        """
+        Set a channel's limits so it alerts when it next crosses THRESHOLD, in raw (inverted) units
+        """
+        limit = 4096 - self.THRESHOLD
+        if self.receptors[ch] > self.THRESHOLD:
+            low, high = 0, limit
+        else:
+            low, high = limit, 0x0FFF
+        self.write_reg_bytes(self.DATA_LOW[ch], list(low.to_bytes(2, 'big')))
+        self.write_reg_bytes(self.DATA_HIGH[ch], list(high.to_bytes(2, 'big')))
+
+    def _read_channel(self, ch: int) -> bool:
+        success, data = self.read_reg_bytes(self.CHANNEL[ch], 2)
+        if success:
+            self.receptors[ch] = self.decode(data, self.UNPACK_ONE)[0][0]
+        return success
+
+    def poll_alerts(self) -> bool:
+        """
+        Read the Alert register and only the channels that fired, plus the channels without limits
+        """
+        success, status = self.read_reg_byte(ReceptorRegisters.Alert)
+        if not success:
+            logger.error('Receptor alert read failed, reusing last reading')
+            return False
+        self.receptors = list(self.receptors)
+        if status:
+            for ch in range(self.ALERT_CHANNELS):
+                # Low and high alert bits for each channel
+                if status & (0b11 << (2 * ch)) and self._read_channel(ch):
+                    self._arm(ch)
+            # Writing the flags back clears them
+            self.write_reg_byte(ReceptorRegisters.Alert, status)
+        for ch in range(self.ALERT_CHANNELS, self.RECEPTOR_COUNT):
+            success &= self._read_channel(ch)
+        mask = 0
+        for value in self.receptors:
+            mask = (mask << 1) | (value > self.THRESHOLD)
+        self.mask = mask
+        return success
+
+    def wait_for_alert(self, timeout: float = None) -> bool:
+        """
+        Block on the ALERT pin, then poll
+        :return: True if the pin fired before the timeout
+        """
+        assert self.alerts and self.gpio is not None, "Alerts aren't enabled with a GPIO pin"
+        kwargs = {} if timeout is None else {'timeout': int(timeout * 1000)}
+        fired = self.gpio.wait_for_edge(self.alert_pin, self.gpio.FALLING, **kwargs) is not None
+        self.read_bus()
+        return fired
+
+    def sample(self, rate: float = 100.0, size: int = 1024) -> ReceptorSampler:
+        """
+        Start sampling on a background thread, reads are answered from its newest sample from then on
+        :param rate: Samples per second
+        :param size: Number of samples kept in the ring buffer
+        """
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.sampler = ReceptorSampler(self, rate, size).start()
+        return self.sampler
+
+    def _latest(self) -> Sample:
+        sample = self.sampler.latest()
+        if sample is None:
+            # Sampler just started, wait for its first reading
+            sample = self.sampler.wait_for_change(timeout=self.sampler.period * 10)
+        if sample is None:
+            return Sample(0.0, tuple(self.receptors), self.mask)
+        return sample
+
     def read_raw(self, n=None) -> List[int]:
-        if n:
+        if self.sampler is not None:
+            values = list(self._latest().values)
+            if n is not None:
+                return values[n:n + 1]
+            return values
+        if n is not None:
             if n >= self.RECEPTOR_COUNT:
                 return []
-            _, data = self.read_reg_bytes(self.CHANNEL[n], 2)
-            data = unpack('>H', array('B', data).tostring())
-        else:
-            _, data = self.read_reg_bytes(self.READ_ALL, 2 * self.RECEPTOR_COUNT)
-            data = list(unpack(self.UNPACK_ALL, array('B', data).tostring()))
-        data = [4096 - (0x0FFF & x) for x in data]
-        self.receptors = data
-        return data
+            success, data = self.read_reg_bytes(self.CHANNEL[n], 2)
+            if not success:
+                return []
+            values, _ = self.decode(data, self.UNPACK_ONE)
+            return values
+        self.read_bus()
+        return self.receptors
 
     def read_int(self) -> int:
-        array = self.read()
-        retVal = 0
-        for i in range(6):
-            if array[i]:
-                retVal |= 0x1 << (5-i)
-        # get list and convert to boolean
-        return retVal
+        if self.sampler is not None:
+            return self._latest().mask
+        self.read_bus()
+        return self.mask
 
     def read(self, n=None) -> List[bool]:
-        return [x > self.THRESHOLD for x in self.read_raw(n)]
+        if n is not None:
+            return [x > self.THRESHOLD for x in self.read_raw(n)]
+        mask = self.read_int()
+        return [bool(mask & (1 << i)) for i in range(self.RECEPTOR_COUNT - 1, -1, -1)]
 
     def __getitem__(self, item):
         if isinstance(item, slice):
@@ -82,6 +234,42 @@ class ReceptorControl(I2CModule):
             return []
 
 
+def decode_block(data, threshold: int, unpacker: Struct) -> Tuple[List[int], int]:
+    """
+    See ReceptorControl.decode
+    """
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data)
+    values = []
+    mask = 0
+    for x in unpacker.unpack_from(data):
+        value = 4096 - (0x0FFF & x)
+        values.append(value)
+        mask = (mask << 1) | (value > threshold)
+    return values, mask
+
+
+def decode_blocks(blocks, threshold: int = ReceptorControl.THRESHOLD):
+    """
+    Decode READ_ALL blocks from several boxes at once, uses NumPy when it is installed
+    :param blocks: One 12 byte block read per box
+    :return: Lists of the receptor values of each box and of each box's threshold mask, the same with or without NumPy
+    """
+    count = ReceptorControl.RECEPTOR_COUNT
+    if numpy is None:
+        values, masks = [], []
+        for block in blocks:
+            v, m = decode_block(block, threshold, ReceptorControl.UNPACK_ALL)
+            values.append(v)
+            masks.append(m)
+        return values, masks
+    raw = numpy.frombuffer(b''.join(bytes(b) for b in blocks), dtype='>u2').reshape(-1, count)
+    values = 4096 - (raw & 0x0FFF).astype(numpy.int32)
+    weights = 1 << numpy.arange(count - 1, -1, -1)
+    masks = (values > threshold) @ weights
+    return values.tolist(), masks.tolist()
+
+
 if __name__ == '__main__':
     master = SMBus(1)
     read = ReceptorControl(master)
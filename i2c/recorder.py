@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Record every bus transaction to a binary log and replay logs back to the drivers:
+
+    python -m Project_Theseus_API.i2c.recorder session.log
+"""
+import mmap
+import os
+from argparse import ArgumentParser
+from ctypes import memmove
+from enum import IntEnum
+from struct import Struct
+from threading import Lock
+from time import monotonic_ns, perf_counter_ns, sleep
+from typing import Iterator, List, NamedTuple
+
+from smbus2 import SMBus
+from smbus2.smbus2 import I2C_M_RD
+
+
+class Op(IntEnum):
+    WRITE_BYTE = 1
+    READ_BYTE = 2
+    WRITE_BYTE_DATA = 3
+    READ_BYTE_DATA = 4
+    WRITE_BLOCK = 5
+    READ_BLOCK = 6
+    # One record for each message of an i2c_rdwr call
+    RDWR_WRITE = 7
+    RDWR_READ = 8
+
+
+READS = frozenset((Op.READ_BYTE, Op.READ_BYTE_DATA, Op.READ_BLOCK, Op.RDWR_READ))
+NO_REGISTER = -1
+
+MAGIC = b'THBR'
+VERSION = 1
+FILE_HEADER = Struct('<4sHH')
+# Nanoseconds since recording started, call duration in ns, address, op, register, errno (0 on success), length.
+# The payload follows: the bytes written, or the bytes read if the read succeeded.
+RECORD = Struct('<QIBBhHH')
+
+
+class Record(NamedTuple):
+    timestamp: int
+    duration: int
+    address: int
+    op: Op
+    register: int
+    status: int
+    length: int
+    data: bytes
+
+
+class ReplayMismatch(Exception):
+    """
+    The drivers asked for a different transaction than the one recorded
+    """
+
+
+def read_log(path: str) -> Iterator[Record]:
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, _ = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('{} is not a version {} bus log'.format(path, VERSION))
+    offset = FILE_HEADER.size
+    while offset + RECORD.size <= len(data):
+        timestamp, duration, address, op, register, status, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        n = length if (op not in READS or not status) else 0
+        yield Record(timestamp, duration, address, Op(op), register, status, length, data[offset:offset + n])
+        offset += n
+
+
+class BusRecorder(object):
+    """
+    Wraps an SMBus or MockBus and appends every transaction to a memory mapped log.
+
+    The file grows a chunk at a time and is trimmed to the records written when the recorder is closed.
+    """
+
+    def __init__(self, bus: SMBus, path: str, chunk: int = 1 << 20):
+        """
+        :param bus: The bus to record
+        :param path: Log file, replaced if it exists
+        :param chunk: Bytes the file grows by when it fills up
+        """
+        self.bus = bus
+        self.path = path
+        self.chunk = chunk
+        self.records = 0
+        self._file = open(path, 'w+b')
+        self._file.truncate(chunk)
+        self._map = mmap.mmap(self._file.fileno(), chunk)
+        FILE_HEADER.pack_into(self._map, 0, MAGIC, VERSION, 0)
+        self._offset = FILE_HEADER.size
+        self._lock = Lock()
+        self._start = monotonic_ns()
+
+    def __getattr__(self, item):
+        return getattr(self.bus, item)
+
+    def _append(self, start: int, op: Op, address: int, register: int, status: int, length: int, data: bytes = b''):
+        duration = min(perf_counter_ns() - start, 0xFFFFFFFF)
+        size = RECORD.size + len(data)
+        with self._lock:
+            if self._map is None:
+                return
+            if self._offset + size > len(self._map):
+                self._grow(size)
+            RECORD.pack_into(self._map, self._offset, monotonic_ns() - self._start, duration, address, op,
+                             register, status, length)
+            self._map[self._offset + RECORD.size:self._offset + size] = data
+            self._offset += size
+            self.records += 1
+
+    def _grow(self, size: int):
+        new = len(self._map) + max(self.chunk, size)
+        self._map.close()
+        self._file.truncate(new)
+        self._map = mmap.mmap(self._file.fileno(), new)
+
+    def _run(self, op: Op, address: int, register: int, length: int, call, *args, data: bytes = b''):
+        start = perf_counter_ns()
+        try:
+            result = call(*args)
+        except OSError as e:
+            self._append(start, op, address, register, e.errno or 0xFFFF, length, b'' if op in READS else data)
+            raise
+        if op in READS:
+            data = bytes((result,)) if isinstance(result, int) else bytes(result)
+        self._append(start, op, address, register, 0, length, data)
+        return result
+
+    def write_byte(self, i2c_addr, value):
+        return self._run(Op.WRITE_BYTE, i2c_addr, NO_REGISTER, 1, self.bus.write_byte, i2c_addr, value,
+                         data=bytes((value,)))
+
+    def read_byte(self, i2c_addr):
+        return self._run(Op.READ_BYTE, i2c_addr, NO_REGISTER, 1, self.bus.read_byte, i2c_addr)
+
+    def write_byte_data(self, i2c_addr, register, value):
+        return self._run(Op.WRITE_BYTE_DATA, i2c_addr, register, 1, self.bus.write_byte_data, i2c_addr, register,
+                         value, data=bytes((value,)))
+
+    def read_byte_data(self, i2c_addr, register):
+        return self._run(Op.READ_BYTE_DATA, i2c_addr, register, 1, self.bus.read_byte_data, i2c_addr, register)
+
+    def write_i2c_block_data(self, i2c_addr, register, data):
+        return self._run(Op.WRITE_BLOCK, i2c_addr, register, len(data), self.bus.write_i2c_block_data, i2c_addr,
+                         register, data, data=bytes(data))
+
+    def read_i2c_block_data(self, i2c_addr, register, length):
+        return self._run(Op.READ_BLOCK, i2c_addr, register, length, self.bus.read_i2c_block_data, i2c_addr,
+                         register, length)
+
+    def i2c_rdwr(self, *i2c_msgs):
+        start = perf_counter_ns()
+        try:
+            self.bus.i2c_rdwr(*i2c_msgs)
+        except OSError as e:
+            status = e.errno or 0xFFFF
+        else:
+            status = 0
+        for msg in i2c_msgs:
+            read = msg.flags & I2C_M_RD
+            data = b'' if read and status else bytes(msg.buf[:msg.len])
+            self._append(start, Op.RDWR_READ if read else Op.RDWR_WRITE, msg.addr, NO_REGISTER, status, msg.len,
+                         data)
+        if status:
+            raise OSError(status, os.strerror(status))
+
+    def flush(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+
+    def close(self):
+        """
+        Trim and close the log, the wrapped bus is left open
+        """
+        with self._lock:
+            if self._map is None:
+                return
+            self._map.flush()
+            self._map.close()
+            self._map = None
+            self._file.truncate(self._offset)
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BusReplayer(object):
+    """
+    A bus that answers the drivers from a recorded log.
+
+    Every call is checked against the next record, writes must match byte for byte, and recorded errors are raised as
+    OSError again, so replaying a session exercises the same driver paths it did in the field.
+    """
+
+    def __init__(self, path: str, realtime: bool = False):
+        """
+        :param path: A log written by BusRecorder
+        :param realtime: Wait until each transaction's original time, else replay as fast as possible
+        """
+        self.records = list(read_log(path))
+        self.realtime = realtime
+        self.position = 0
+        self._start = None
+
+    @property
+    def done(self) -> bool:
+        return self.position == len(self.records)
+
+    def open(self, bus):
+        pass
+
+    def close(self):
+        pass
+
+    def _next(self, op: Op, address: int, register: int = NO_REGISTER, length: int = None,
+              data: bytes = None) -> Record:
+        if self.done:
+            raise ReplayMismatch('Log ended, {} to {} was not recorded'.format(op.name, hex(address)))
+        record = self.records[self.position]
+        if (record.op, record.address, record.register) != (op, address, register) \
+                or (length is not None and record.length != length) \
+                or (data is not None and record.data != data):
+            raise ReplayMismatch('Transaction {}: recorded {} to {} register {} length {} {}, got {} to {} register {} '
+                                 'length {} {}'.format(self.position, record.op.name, hex(record.address),
+                                                       record.register, record.length, record.data.hex(), op.name,
+                                                       hex(address), register, length, (data or b'').hex()))
+        self.position += 1
+        if self.realtime:
+            if self._start is None:
+                self._start = monotonic_ns() - record.timestamp
+            delay = self._start + record.timestamp - monotonic_ns()
+            if delay > 0:
+                sleep(delay / 1e9)
+        if record.status:
+            raise OSError(record.status, os.strerror(record.status))
+        return record
+
+    def write_byte(self, i2c_addr, value):
+        self._next(Op.WRITE_BYTE, i2c_addr, data=bytes((value,)))
+
+    def read_byte(self, i2c_addr) -> int:
+        return self._next(Op.READ_BYTE, i2c_addr).data[0]
+
+    def write_byte_data(self, i2c_addr, register, value):
+        self._next(Op.WRITE_BYTE_DATA, i2c_addr, register, data=bytes((value,)))
+
+    def read_byte_data(self, i2c_addr, register) -> int:
+        return self._next(Op.READ_BYTE_DATA, i2c_addr, register).data[0]
+
+    def write_i2c_block_data(self, i2c_addr, register, data):
+        self._next(Op.WRITE_BLOCK, i2c_addr, register, len(data), bytes(data))
+
+    def read_i2c_block_data(self, i2c_addr, register, length) -> List[int]:
+        return list(self._next(Op.READ_BLOCK, i2c_addr, register, length).data)
+
+    def i2c_rdwr(self, *i2c_msgs):
+        error = None
+        for msg in i2c_msgs:
+            read = msg.flags & I2C_M_RD
+            try:
+                record = self._next(Op.RDWR_READ if read else Op.RDWR_WRITE, msg.addr, NO_REGISTER, msg.len,
+                                    None if read else bytes(msg.buf[:msg.len]))
+            except OSError as e:
+                # The whole call failed, its other messages were recorded with the same error
+                error = e
+                continue
+            if read:
+                memmove(msg.buf, record.data, msg.len)
+        if error is not None:
+            raise error
+
+
+def main():
+    args = ArgumentParser(description=__doc__)
+    args.add_argument('log', help='A log written by BusRecorder')
+    opts = args.parse_args()
+
+    records = errors = 0
+    busy = 0
+    for r in read_log(opts.log):
+        records += 1
+        errors += bool(r.status)
+        busy += r.duration
+        print('{:>12.6f} {:>8.1f}us {:>5} {:<16}{:>5} {:<6} {}'.format(
+            r.timestamp / 1e9, r.duration / 1e3, hex(r.address), r.op.name,
+            r.register if r.register != NO_REGISTER else '', os.strerror(r.status) if r.status else 'ok',
+            r.data.hex()))
+    print('{} transactions, {} errors, {:.3f} s on the bus'.format(records, errors, busy / 1e9))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,11 @@
 import logging
+from itertools import chain, product
 from multiprocessing import Lock
 from typing import List
 
 from smbus2 import SMBus
 
+from Project_Theseus_API.i2c.bus_arbiter import Priority
 from Project_Theseus_API.i2c.i2c_module import I2CModule
 
 logger = logging.getLogger(__name__)
@@ -11,11 +13,19 @@ logger = logging.getLogger(__name__)
 
 class SevenSeg(I2CModule):
     _lock = Lock()
+    PRIORITY = Priority.BULK
+    SHADOW = True
     NUM_DOTS = 4
+    NUM_DIGITS = 4
     BLINK_CMD = 0x80
     BLINK_DISPLAY_ON = 0x01
     CMD_BRIGHTNESS = 0xE0
     COLON = 0x02
+    DOT = 0x80
+    # Display RAM address of each frame position: digit, digit, colon, digit, digit
+    FRAME_REGISTERS = (0, 2, 4, 6, 8)
+    # Frame positions that hold digits
+    DIGIT_POSITIONS = (0, 1, 3, 4)
     CHARMAP = {
         '0': 0x3F,
         '1': 0x06,
@@ -35,6 +45,8 @@ class SevenSeg(I2CModule):
         'f': 0x71
     }
     inv_map = {v: k for k, v in CHARMAP.items()}
+    # Built on first use by _frame_table()
+    _frames = None
 
     def __init__(self, bus: SMBus, address: hex = 0x70, blink_rate: int = 0, brightness: hex = 0):
         """
@@ -43,6 +55,8 @@ class SevenSeg(I2CModule):
         :param brightness:
         """
         super().__init__(bus, address)
+        # Last frame written to the display, None when unknown
+        self._frame = None
         assert blink_rate >= 0, "Blink rate must be positive: {}".format(blink_rate)
         assert 0 <= brightness <= 0xf, "Brightness level is out of range: {}".format(brightness)
         # start oscillator
@@ -56,42 +70,75 @@ class SevenSeg(I2CModule):
         with self._lock:
             self.write_byte(byte)
 
+    @classmethod
+    def _frame_table(cls) -> bytes:
+        """
+        :return: The 4 digit segments of every value from 0 to 0xffff, most significant digit first, at value * 4
+        """
+        if cls._frames is None:
+            digits = bytes(cls.CHARMAP[c] for c in '0123456789abcdef')
+            cls._frames = bytes(chain.from_iterable(product(digits, repeat=cls.NUM_DIGITS)))
+        return cls._frames
+
+    @classmethod
+    def encode(cls, value: hex = None, dots: List[bool] = None, colon: bool = True) -> bytes:
+        """
+        :return: The segments for each position in FRAME_REGISTERS
+        """
+        if value is None:
+            digits = bytes(cls.NUM_DIGITS)
+        else:
+            assert 0 <= value <= 0xffff, "'{}' is out of the range of the i2c_seven segment display".format(value)
+            i = value * cls.NUM_DIGITS
+            digits = cls._frame_table()[i:i + cls.NUM_DIGITS]
+        frame = bytearray((digits[0], digits[1], cls.COLON if colon else 0, digits[2], digits[3]))
+        if dots:
+            assert len(dots) <= cls.NUM_DOTS, "There are only 4 dots on the display"
+            for pos, dot in zip(cls.DIGIT_POSITIONS, dots):
+                if dot:
+                    frame[pos] |= cls.DOT
+        return bytes(frame)
+
     def sevenseg(self, value: hex = None, dots: List[bool] = None, colon: bool = True):
         """
         :param colon: True if a colon should be written, else false
         :param dots: A list of 4 booleans representing the 4 dots that should be written
         :param value: A 4 digit hex value to write to the i2c_seven segment display
         """
-        # Type checking and input sensitization
-        if value is not None:
-            assert 0 <= value <= 0xffff, "'{}' is out of the range of the i2c_seven segment display".format(value)
-        if dots is None:
-            dots = list()
-        assert len(dots) <= 4, "There are only 4 dots on the display"
-
-        # Add to the dots array until there are enough
-        while len(dots) < 4:
-            dots.append(False)
+        self.write_frame(self.encode(value, dots, colon))
 
-        if value is not None:
-            chars = [self.CHARMAP[c] for c in str(hex(value))[2:].zfill(4)]
+    def write_frame(self, frame: bytes):
+        """
+        Send the positions of an encoded frame that differ from the last frame written
+        :param frame: A frame from encode()
+        """
+        last = self._frame
+        if last is None:
+            changed = range(len(frame))
         else:
-            chars = [0] * 4
-
-        # Build the buffer that sends characters to the device
-        buffer = []
-        for i in range(4):
-            buffer.append((dots[i] << 7) | chars[i])
-            buffer.append(0)
-            if i == 1:
-                buffer.append(self.COLON if colon else 0)
-                buffer.append(0)
-
-        try:
-            with self._lock:
-                self.write_reg_bytes(0, buffer)
-        except OSError as c:
-            logger.error("{}:{}".format(c, hex(value)))
+            changed = [i for i in range(len(frame)) if frame[i] != last[i]]
+            if not changed:
+                return
+        first = changed[0]
+        with self._lock:
+            if len(changed) == 1:
+                success = self.write_reg_byte(self.FRAME_REGISTERS[first], frame[first])
+            else:
+                # Display RAM auto-increments, every other byte is an unused common line
+                buffer = []
+                for b in frame[first:changed[-1] + 1]:
+                    buffer.append(b)
+                    buffer.append(0)
+                success = self.write_reg_bytes(self.FRAME_REGISTERS[first], buffer)
+        if success:
+            self._frame = frame
+        else:
+            logger.error("Seven segment write failed: {}".format(frame.hex()))
+            self._frame = None
+
+    def resync(self):
+        super().resync()
+        self._frame = None
 
     def brightness(self, level: int):
         level = 0 if level > 15 else level
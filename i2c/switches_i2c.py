@@ -1,27 +1,100 @@
-from bitarray import bitarray
+from threading import Lock
+from time import monotonic
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
 from smbus2 import SMBus
 
-from Project_Theseus_API.i2c.i2c_module import I2CModule
+from Project_Theseus_API.i2c.bus_arbiter import Priority
+from Project_Theseus_API.i2c.expander import PortExpander
+
+
+class SwitchSnapshot(NamedTuple):
+    timestamp: float
+    raw: int
+    switches: Tuple[bool, ...]
+
+    @property
+    def dots(self) -> Tuple[bool, ...]:
+        return self.switches[:4]
+
+    @property
+    def rgb(self) -> Tuple[bool, ...]:
+        return self.switches[4:]
+
+
+def _decode(byte: int) -> Tuple[bool, ...]:
+    # Switches pull their pin low when on, switch 0 is on pin 7 and switches 1 to 5 on pins 2 to 6
+    return tuple(not byte >> pin & 1 for pin in (7, 2, 3, 4, 5, 6))
+
+
+class SwitchesI2C(PortExpander):
+    PRIORITY = Priority.INPUT
+    INPUTS = 0xFF
+    # Switch positions for every port byte
+    DECODE = tuple(map(_decode, range(256)))
+    ABSENT = {'read_switches': [], 'last': None, 'subscribe': lambda: None}
 
-class SwitchesI2C(I2CModule):
     def __init__(self, bus, addr=0x3b):
         super().__init__(bus, addr)
-        self.write_byte(0xff)
+        self.write_port(0xFF, force=True)
+        self.last = None
+        self._subscribers = []
+        self._subscribers_lock = Lock()
 
     @property
-    def switches(self) -> int:
-        _, byte = self.read_byte()
-        return byte
+    def switches(self) -> Optional[int]:
+        return self.read_port()
+
+    @classmethod
+    def decode(cls, byte: int) -> Tuple[bool, ...]:
+        return cls.DECODE[byte]
+
+    def snapshot(self, max_age: float = None) -> Optional[SwitchSnapshot]:
+        """
+        Read the port once and decode it
+        :param max_age: Reuse a read of the port this many seconds old, defaults to MAX_AGE
+        :return: The switch positions, or None if the read failed
+        """
+        byte = self.read_port(max_age)
+        if byte is None:
+            return None
+        return SwitchSnapshot(monotonic(), byte, self.DECODE[byte])
 
-    def read_switches(self):
-        if self.switches is None:
+    def read_switches(self, max_age: float = None) -> List[bool]:
+        snapshot = self.snapshot(max_age)
+        if snapshot is None:
             return []
-        byte = bytes([self.switches])
-        array = bitarray(endian='little')
-        array.frombytes(byte)
-        array = array[2:]
-        array = array[5:6] + array[:-1]
-        return [not x for x in array]
+        return list(snapshot.switches)
+
+    def subscribe(self, callback: Callable[[SwitchSnapshot, Optional[SwitchSnapshot]], None]) -> Callable[[], None]:
+        """
+        :param callback: Called by poll() with the new and previous snapshot whenever the switches change
+        :return: A function that removes the callback
+        """
+        with self._subscribers_lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._subscribers_lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+
+        return unsubscribe
+
+    def poll(self) -> Optional[SwitchSnapshot]:
+        """
+        Take a snapshot and notify subscribers if the switches moved since the last poll
+        """
+        snapshot = self.snapshot(0)
+        if snapshot is None:
+            return None
+        previous, self.last = self.last, snapshot
+        if previous is None or previous.switches != snapshot.switches:
+            with self._subscribers_lock:
+                subscribers = list(self._subscribers)
+            for callback in subscribers:
+                callback(snapshot, previous)
+        return snapshot
 
 
 from time import sleep
@@ -29,13 +102,10 @@ from time import sleep
 
 if __name__ == "__main__":
     switches = SwitchesI2C(SMBus(1))
-    old_val = 0
+    switches.subscribe(lambda snapshot, _: print(''.join(['1' if x else '0' for x in snapshot.switches])))
     while True:
         sleep(.01)
-        val = ''.join(['1' if x else '0' for x in switches.read_switches()])
-        if val != old_val:
-            print(val)
-            old_val = val
+        switches.poll()
 
 '''
 432105
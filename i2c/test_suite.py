@@ -1,16 +1,26 @@
+import asyncio
 import logging
 from argparse import ArgumentParser
-from threading import Thread
+from functools import partial
 from time import sleep
-from typing import List
+from typing import Dict, Iterable, List
 
 from smbus2 import SMBus
 
+from Project_Theseus_API.i2c.aio import AsyncArduinoI2C, AsyncBoxLock, AsyncBus, AsyncLaserControl, AsyncSevenSeg, \
+    AsyncSwitchesI2C
+from Project_Theseus_API.i2c.bus_arbiter import BusArbiter
+from Project_Theseus_API.i2c.countdown import Countdown
+from Project_Theseus_API.i2c.discovery import PresenceCache, build_devices
+from Project_Theseus_API.i2c.input_scanner import InputEvent, InputScanner, KeypadEvent, PowerEvent, SwitchEvent, \
+    box_scanner
 from Project_Theseus_API.i2c.laser_i2c import LaserControl
+from Project_Theseus_API.i2c.laser_patterns import PatternPlayer, sweep
 from Project_Theseus_API.i2c.lid_kit import ArduinoI2C, COLOR
 from Project_Theseus_API.i2c.lock_i2c import BoxLock
 from Project_Theseus_API.i2c.sevenseg import SevenSeg
-from Project_Theseus_API.i2c.switches_i2c import SwitchesI2C
+from Project_Theseus_API.i2c.switches_i2c import SwitchesI2C, SwitchSnapshot
+from Project_Theseus_API.i2c.timers import TimerWheel, default_timers
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -18,124 +28,240 @@ logging.basicConfig(level=logging.INFO)
 
 class TestSuite:
     DIGITS = 4
-    timer_running = False
     _keypress = ["0"] * DIGITS
     dead = False
+    # Game length
     minutes = 0
     seconds = 0
 
     i2c_seven = None
+    i2c_display = None
     i2c_arduino = None
     i2c_lasers = None
     i2c_switches = None
     i2c_lock = None
+    countdown = None
 
-    def timer(self):
-        while True:
-            if self.timer_running:
-                if self.seconds:
-                    self.seconds -= 1
-                elif self.minutes:
-                    self.minutes -= 1
-                    self.seconds = 59
-                else:
-                    self.dead = True
-                    self.timer_running = False
-            sleep(0.9)
-
-    def __init__(self, bus: SMBus):
-        try:
-            self.i2c_arduino = ArduinoI2C(bus)
-            logger.info("Arduino Ready")
-        except OSError:
-            logger.warning("Arduino setup failed")
-        try:
-            self.i2c_lasers = LaserControl(bus)
-            logger.info("Lasers Ready")
-        except OSError:
-            logger.warning("Laser setup failed")
-
-        try:
-            self.i2c_seven = SevenSeg(bus).sevenseg
-            logger.info("Seven Segment Display Ready")
-        except OSError:
-            logger.warning("Seven Segment Display setup failed")
-
-        try:
-            self.i2c_switches = SwitchesI2C(bus)
-            logger.info("Switches Ready")
-        except OSError:
-            logger.warning("Switches setup failed")
-
-        try:
-            self.i2c_lock = BoxLock(bus)
-            logger.info("Lock ready")
-        except OSError:
-            logger.warning("Solenoid setup failed")
+    # Latest input state, kept up to date by handle()
+    switches = None
+    powered = False
+    # Seconds dots, rgb and keypress reuse a port read for, one scanner tick once scanner() has made one
+    max_age = 0.0
+
+    @property
+    def timer_running(self) -> bool:
+        return bool(self.countdown and self.countdown.running)
+
+    def expire(self):
+        self.dead = True
+
+    def __init__(self, bus: SMBus, addresses: Dict[str, int] = None, presence: PresenceCache = None,
+                 timers: TimerWheel = None):
+        """
+        :param bus: An SMBus, or a BusArbiter so the timer, laser and main loop threads share it safely
+        :param addresses: Device addresses by name, 'arduino', 'lasers', 'display', 'switches' and 'lock', for boxes
+        that don't use the drivers' defaults
+        :param presence: Cache of which devices are on the bus, None probes them every time
+        :param timers: Runs the countdown, lasers and lock, defaults to the shared timer wheel
+        """
+        self.bus = bus
+        self.timers = timers if timers is not None else default_timers()
+        self._keypress = ["0"] * self.DIGITS
+        devices = build_devices(bus, {
+            'arduino': ArduinoI2C,
+            'lasers': LaserControl,
+            'display': SevenSeg,
+            'switches': SwitchesI2C,
+            'lock': partial(BoxLock, timers=self.timers),
+        }, addresses, presence)
+        # Missing devices are NullDevices, falsy and harmless to call
+        self.i2c_arduino = devices['arduino']
+        self.i2c_lasers = devices['lasers']
+        self.i2c_display = devices['display']
+        self.i2c_seven = self.i2c_display.sevenseg
+        self.i2c_switches = devices['switches']
+        self.i2c_lock = devices['lock']
+        # A game of no time has nothing to count down, '#' ends it straight away
+        length = self.minutes * 60 + self.seconds
+        if length > 0:
+            self.countdown = Countdown(self.i2c_display, length, on_expire=self.expire, timers=self.timers)
+        logger.info("Devices ready: {}".format(", ".join(name for name, device in devices.items() if device)))
 
     @property
     def dots(self) -> List[bool]:
         """
         Read switches to determine the values of the dots
         """
-        return self.i2c_switches.read_switches()[:4]
+        return self.i2c_switches.read_switches(self.max_age)[:4]
 
     @property
     def rgb(self) -> List[bool]:
         """
         Read switches to determine the value of the RGB
         """
-        return self.i2c_switches.read_switches()[4:]
+        return self.i2c_switches.read_switches(self.max_age)[4:]
 
     @property
     def keypress(self) -> List[str]:
-        rcv = self.i2c_arduino.keypad
-        for r in rcv:
+        if self.i2c_lock:
+            self.powered = self.i2c_lock.is_powered(self.max_age)
+        self.handle_keys(self.i2c_arduino.keypad)
+        return self._keypress
+
+    def handle_keys(self, keys: List[str]):
+        if self.press_keys(keys):
+            self.i2c_lock.open()
+
+    def press_keys(self, keys: List[str]) -> bool:
+        """
+        Update the game state for a list of key presses
+        :return: True if the lock should be opened
+        """
+        unlock = False
+        for r in keys:
             if r == '*':
-                if self.i2c_lock and self.i2c_lock.powered:
-                    self.i2c_lock.open()
+                unlock = bool(self.i2c_lock and self.powered)
             elif r == "#":
-                self.timer_running = True
+                if self.countdown and not self.countdown.expired:
+                    self.countdown.resume()
+                else:
+                    self.expire()
             else:
-                self.timer_running = False
+                if self.countdown:
+                    self.countdown.pause()
+                    # Once time is up a digit takes the display back from the flashing clock
+                    self.countdown.dismiss()
                 self._keypress.append(r)
                 self._keypress = self._keypress[-self.DIGITS:]
-        return self._keypress
+        return unlock
 
-    def run_lasers(self):
-        while True:
-            for x in range(0x40):
-                self.i2c_lasers.state = x
-                sleep(0.3)
+    @staticmethod
+    def color(rgb) -> COLOR:
+        if not rgb[0] and not rgb[1]:
+            return COLOR.BLANK
+        if not rgb[0] and rgb[1]:
+            return COLOR.RED
+        if rgb[0] and not rgb[1]:
+            return COLOR.BLUE
+        return COLOR.GREEN
+
+    def handle_switches(self, switches: SwitchSnapshot):
+        self.switches = switches
+        if self.countdown:
+            self.countdown.dots = switches.dots
+        if self.i2c_arduino:
+            self.i2c_arduino.color = self.color(switches.rgb)
+
+    def handle(self, event: InputEvent):
+        if isinstance(event, KeypadEvent):
+            self.handle_keys([k.key for k in event.value])
+        elif isinstance(event, SwitchEvent):
+            self.handle_switches(event.value)
+        elif isinstance(event, PowerEvent):
+            self.powered = event.value
+
+    def scanner(self, tick_rate: float = 10.0) -> InputScanner:
+        """
+        :return: A scanner over the inputs that were set up, its reads of the ports are reused by dots, rgb and keypress
+        """
+        self.max_age = 1 / tick_rate
+        return box_scanner(switches=self.i2c_switches, arduino=self.i2c_arduino, lock=self.i2c_lock,
+                           tick_rate=tick_rate, rates={'lock': 10})
+
+    @property
+    def display(self) -> int:
+        if self.timer_running:
+            return self.countdown.value
+        return int("0x{}".format("".join(self._keypress)), 16)
+
+    def render(self):
+        if self.countdown and self.countdown.active:
+            # The countdown writes the display itself when its digits change
+            return
+        self.i2c_seven(self.display, self.switches.dots if self.switches else None)
+
+    def run_lasers(self) -> PatternPlayer:
+        """
+        Step the lasers through every state on the shared timer wheel
+        """
+        return PatternPlayer(self.i2c_lasers, self.timers).play(sweep(0.3))
 
     def run(self):
-        Thread(target=self.timer).start()
-        Thread(target=self.run_lasers).start()
+        if self.i2c_lasers:
+            self.run_lasers()
 
+        scanner = self.scanner()
+        # Subscribe before the first scan so its events, the initial switch positions among them, aren't missed
+        events = scanner.subscribe()
+        scanner.start()
+        self.render()
         while True:
             sleep(.1)
-            self.i2c_seven(int("0x{}".format(
-                "".join(self.keypress) if not self.timer_running else "{}{:02}".format(self.minutes, self.seconds)), 16)
-                , self.dots)
-            rgb = self.rgb
-            if rgb:
-                if not rgb[0] and not rgb[1]:
-                    self.i2c_arduino.color = COLOR.BLANK
-                if not rgb[0] and rgb[1]:
-                    self.i2c_arduino.color = COLOR.RED
-                if rgb[0] and not rgb[1]:
-                    self.i2c_arduino.color = COLOR.BLUE
-                if rgb[0] and rgb[1]:
-                    self.i2c_arduino.color = COLOR.GREEN
+            self.update(events.get_nowait() for _ in range(events.qsize()))
+
+    def update(self, events: Iterable[InputEvent]):
+        """
+        One iteration of the main loop: apply the input events, then redraw the display if there were any
+        """
+        changed = False
+        for event in events:
+            self.handle(event)
+            changed = True
+        if changed:
+            self.render()
+
+    async def run_async(self):
+        """
+        Run the box from one event loop, all bus traffic goes through a single AsyncBus
+        """
+        bus = AsyncBus(self.bus)
+        arduino = AsyncArduinoI2C(bus, self.i2c_arduino) if self.i2c_arduino else None
+        lasers = AsyncLaserControl(bus, self.i2c_lasers) if self.i2c_lasers else None
+        seven = AsyncSevenSeg(bus, self.i2c_display) if self.i2c_display else None
+        switches = AsyncSwitchesI2C(bus, self.i2c_switches) if self.i2c_switches else None
+        lock = AsyncBoxLock(bus, self.i2c_lock) if self.i2c_lock else None
+
+        async def run_lasers():
+            while True:
+                for x in range(0x40):
+                    await lasers.set_state(x)
+                    await asyncio.sleep(0.3)
+
+        async def inputs():
+            while True:
+                await asyncio.sleep(.1)
+                if switches:
+                    snapshot = await switches.snapshot()
+                    if snapshot and (self.switches is None or snapshot.raw != self.switches.raw):
+                        self.switches = snapshot
+                        if arduino:
+                            await arduino.set_color(self.color(snapshot.rgb))
+                if arduino:
+                    keys = await arduino.keypad()
+                    if lock and '*' in keys:
+                        self.powered = await lock.powered()
+                    if self.press_keys(keys):
+                        await lock.open()
+                if seven and not (self.countdown and self.countdown.active):
+                    await seven.sevenseg(self.display, self.switches.dots if self.switches else None)
+
+        tasks = [inputs()]
+        if lasers:
+            tasks.append(run_lasers())
+        await asyncio.gather(*tasks)
 
 
 if __name__ == "__main__":
     args = ArgumentParser()
     args.add_argument("--mock", action="store_true")
+    args.add_argument("--asyncio", action="store_true", help="Run from a single event loop instead of threads")
 
     opts = args.parse_args()
 
-    TestSuite(SMBus(1)).run()
+    if opts.asyncio:
+        asyncio.run(TestSuite(BusArbiter(SMBus(1)), presence=PresenceCache(1)).run_async())
+    else:
+        TestSuite(BusArbiter(SMBus(1)), presence=PresenceCache(1)).run()
 
     if opts.mock:
         # Start the gui the simulates the box
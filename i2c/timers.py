@@ -0,0 +1,202 @@
+import logging
+import os
+from math import ceil, floor
+from threading import Condition, Lock, Thread
+from time import monotonic
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    """
+    A callback scheduled on a TimerWheel, returned by schedule and call_every
+    """
+    __slots__ = ('deadline', 'interval', 'callback', 'args', '_wheel', '_tick')
+
+    def __init__(self, wheel: 'TimerWheel', deadline: float, interval: float, callback: Callable, args: tuple):
+        self.deadline = deadline
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self._wheel = wheel
+        # Wheel tick the handle is filed under, None when it isn't scheduled
+        self._tick = None
+
+    @property
+    def active(self) -> bool:
+        return self._tick is not None
+
+    def cancel(self):
+        self._wheel.cancel(self)
+
+    def reschedule(self, delay: float):
+        """
+        Move the next call to delay seconds from now, a repeating timer keeps its interval from there
+        """
+        self._wheel.reschedule(self, delay)
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel on one thread.
+
+    Timers are filed in the slot for their deadline's tick, a slot is a dict so cancelling or rescheduling a timer is
+    O(1) no matter how many are pending. Timers further away than one turn of the wheel share slots with nearer ones and
+    are skipped until their tick comes round.
+
+    Callbacks run on the wheel's thread and should be short, anything slow delays every other timer.
+    """
+
+    def __init__(self, tick: float = 0.01, slots: int = 512, clock: Callable[[], float] = monotonic):
+        """
+        :param tick: Resolution in seconds, timers never fire early and fire at most a tick late when the thread is idle
+        :param slots: Slots in the wheel, one turn covers tick * slots seconds
+        :param clock: Monotonic time in seconds
+        """
+        self.tick = tick
+        self.clock = clock
+        self._slots = [{} for _ in range(slots)]
+        self._current = floor(clock() / tick)
+        self._count = 0
+        self._cond = Condition(Lock())
+        self._thread = None
+        self._stopped = False
+
+    def __len__(self):
+        return self._count
+
+    def schedule(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        """
+        Call callback(*args) once, delay seconds from now
+        """
+        handle = TimerHandle(self, self.clock() + delay, None, callback, args)
+        with self._cond:
+            self._insert(handle)
+        return handle
+
+    def call_every(self, interval: float, callback: Callable, *args) -> TimerHandle:
+        """
+        Call callback(*args) every interval seconds, starting one interval from now.
+
+        Each deadline follows on from the last rather than from when the callback ran, so the timer doesn't drift,
+        calls missed while the thread was busy are skipped rather than run late in a burst.
+        """
+        handle = TimerHandle(self, self.clock() + interval, interval, callback, args)
+        with self._cond:
+            self._insert(handle)
+        return handle
+
+    def cancel(self, handle: TimerHandle):
+        with self._cond:
+            self._remove(handle)
+
+    def reschedule(self, handle: TimerHandle, delay: float):
+        with self._cond:
+            self._remove(handle)
+            handle.deadline = self.clock() + delay
+            self._insert(handle)
+
+    def _insert(self, handle: TimerHandle):
+        tick = max(ceil(handle.deadline / self.tick), self._current)
+        handle._tick = tick
+        self._slots[tick % len(self._slots)][handle] = None
+        self._count += 1
+        if self._count == 1:
+            self._cond.notify()
+
+    def _remove(self, handle: TimerHandle):
+        if handle._tick is not None:
+            del self._slots[handle._tick % len(self._slots)][handle]
+            handle._tick = None
+            self._count -= 1
+
+    def advance(self, now: float = None) -> int:
+        """
+        Run every timer that is due, the wheel's thread calls this each tick
+        :param now: Clock time to advance to, defaults to the clock
+        :return: The number of callbacks run
+        """
+        if now is None:
+            now = self.clock()
+        target = floor(now / self.tick)
+        due = []
+        with self._cond:
+            if target < self._current:
+                return 0
+            n = len(self._slots)
+            # After a long stall every slot is visited once rather than once per missed tick
+            for tick in range(self._current, min(target, self._current + n - 1) + 1):
+                slot = self._slots[tick % n]
+                if not slot:
+                    continue
+                for handle in [h for h in slot if h._tick <= target]:
+                    self._remove(handle)
+                    due.append(handle)
+            self._current = target + 1
+            for handle in due:
+                if handle.interval:
+                    missed = floor((now - handle.deadline) / handle.interval)
+                    handle.deadline += handle.interval * (max(missed, 0) + 1)
+                    self._insert(handle)
+        for handle in due:
+            try:
+                handle.callback(*handle.args)
+            except Exception:
+                logger.exception('Timer callback {} failed'.format(handle.callback))
+        return len(due)
+
+    def start(self) -> 'TimerWheel':
+        if self._thread is None:
+            self._stopped = False
+            self._thread = Thread(target=self._run, name='TimerWheel', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._count and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                # Sleep until the next tick starts
+                self._cond.wait(max(self._current * self.tick - self.clock(), 0))
+                if self._stopped:
+                    return
+            self.advance()
+
+
+_default = None
+_default_lock = Lock()
+
+
+def _forget_default():
+    # A forked child has the wheel but not its thread, it starts its own on first use
+    global _default, _default_lock
+    _default = None
+    _default_lock = Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_default)
+
+
+def default_timers() -> TimerWheel:
+    """
+    :return: The timer wheel shared by the drivers, started on first use
+    """
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = TimerWheel().start()
+    return _default
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+An in-process SMBus backed by behavioural models of the chips in the box, no IPC and no hardware
+"""
+import errno
+from abc import ABC, abstractmethod
+from ctypes import memmove
+from typing import Dict
+
+from smbus2.smbus2 import I2C_M_RD
+
+from Project_Theseus_API.i2c.receptors_i2c import ReceptorRegisters
+
+
+class FakeDevice(ABC):
+    """
+    A device on the fake bus, sees each I2C transaction as the raw bytes on the wire
+    """
+
+    @abstractmethod
+    def write(self, data: bytes):
+        """
+        :param data: Every byte of a write transaction, a register pointer first if the device has one
+        """
+
+    @abstractmethod
+    def read(self, n: int) -> bytes:
+        """
+        :return: The n bytes the device clocks out for a read transaction
+        """
+
+
+class PCF8574(FakeDevice):
+    """
+    Quasi-bidirectional 8 bit port, a pin reads low if the latch or the outside world pulls it low
+    """
+
+    def __init__(self, pins: int = 0xFF):
+        """
+        :param pins: Level the outside world presents on each pin
+        """
+        self.latch = 0xFF
+        self.pins = pins
+        self.writes = 0
+
+    def write(self, data: bytes):
+        self.latch = data[-1]
+        self.writes += len(data)
+
+    def read(self, n: int) -> bytes:
+        return bytes((self.latch & self.pins,)) * n
+
+    def set_pin(self, bit: int, level: bool):
+        if level:
+            self.pins |= 1 << bit
+        else:
+            self.pins &= ~(1 << bit)
+
+
+class HT16K33(FakeDevice):
+    """
+    LED driver with 16 bytes of display RAM, used by SevenSeg
+    """
+    RAM_SIZE = 16
+
+    def __init__(self):
+        self.ram = bytearray(self.RAM_SIZE)
+        self.pointer = 0
+        self.oscillator = False
+        self.display_on = False
+        self.blink = 0
+        self.brightness = 0
+
+    def write(self, data: bytes):
+        cmd = data[0]
+        kind = cmd & 0xF0
+        if kind == 0x00:
+            # Display RAM pointer, the rest of the transaction is data that auto-increments
+            pointer = cmd
+            for b in data[1:]:
+                self.ram[pointer] = b
+                pointer = (pointer + 1) % self.RAM_SIZE
+            self.pointer = pointer
+        elif kind == 0x20:
+            self.oscillator = bool(cmd & 0x01)
+        elif kind == 0x80:
+            self.display_on = bool(cmd & 0x01)
+            self.blink = (cmd >> 1) & 0x03
+        elif kind == 0xE0:
+            self.brightness = cmd & 0x0F
+
+    def read(self, n: int) -> bytes:
+        out = bytes(self.ram[(self.pointer + i) % self.RAM_SIZE] for i in range(n))
+        self.pointer = (self.pointer + n) % self.RAM_SIZE
+        return out
+
+    @property
+    def digits(self) -> bytes:
+        """
+        :return: Segments of the four digits, dots included
+        """
+        return bytes((self.ram[0], self.ram[2], self.ram[6], self.ram[8]))
+
+    @property
+    def colon(self) -> bool:
+        return bool(self.ram[4] & 0x02)
+
+
+class AD7998(FakeDevice):
+    """
+    8 channel 12 bit ADC with the ReceptorRegisters map, used by ReceptorControl
+    """
+    CHANNELS = 8
+    LIMIT_CHANNELS = 4
+    # Bytes in each register, the rest are 16 bit
+    BYTE_REGISTERS = (ReceptorRegisters.Alert, ReceptorRegisters.CycleTime)
+    ALERT_ENABLE = 0x04
+
+    def __init__(self):
+        self.channels = [0] * self.CHANNELS
+        self.registers = {r: 0 for r in ReceptorRegisters}
+        for ch in range(self.LIMIT_CHANNELS):
+            self.registers[ReceptorRegisters.Data1High + 3 * ch] = 0x0FFF
+        self.pointer = ReceptorRegisters.Conversion
+        self.command = 0
+
+    def write(self, data: bytes):
+        address = data[0]
+        if address & 0xF0:
+            # Conversion command, the next read returns the result
+            self.command = address
+            return
+        self.command = 0
+        self.pointer = ReceptorRegisters(address & 0x0F)
+        if len(data) == 1:
+            return
+        if self.pointer in self.BYTE_REGISTERS:
+            value = data[1]
+        else:
+            value = int.from_bytes(data[1:3], 'big')
+        if self.pointer == ReceptorRegisters.Alert:
+            # Writing 1s clears the flags
+            self.registers[self.pointer] &= ~value
+        else:
+            self.registers[self.pointer] = value
+            self._check_limits()
+
+    def read(self, n: int) -> bytes:
+        if self.command:
+            if self.command >> 4 == 0x7:
+                channels = [ch for ch in range(self.CHANNELS) if self.registers[ReceptorRegisters.Config] & (1 << (4 + ch))]
+            else:
+                channels = [(self.command >> 4) & 0x07]
+            out = bytearray()
+            while len(out) < n:
+                for ch in channels:
+                    out += ((ch << 12) | self.channels[ch]).to_bytes(2, 'big')
+            return bytes(out[:n])
+        size = 1 if self.pointer in self.BYTE_REGISTERS else 2
+        return self.registers[self.pointer].to_bytes(size, 'big')[:n].ljust(n, b'\0')
+
+    def set_channel(self, ch: int, raw: int):
+        self.channels[ch] = raw & 0x0FFF
+        self._check_limits()
+
+    def set_receptor(self, n: int, value: int):
+        """
+        Set a channel from the inverted value ReceptorControl reports
+        """
+        self.set_channel(n, 4096 - value)
+
+    @property
+    def cycling(self) -> bool:
+        return bool(self.registers[ReceptorRegisters.CycleTime] & 0x07
+                    and self.registers[ReceptorRegisters.Config] & self.ALERT_ENABLE)
+
+    def _check_limits(self):
+        if not self.cycling:
+            return
+        alert = self.registers[ReceptorRegisters.Alert]
+        for ch in range(self.LIMIT_CHANNELS):
+            raw = self.channels[ch]
+            if raw < self.registers[ReceptorRegisters.Data1Low + 3 * ch]:
+                alert |= 1 << (2 * ch)
+            if raw > self.registers[ReceptorRegisters.Data1High + 3 * ch]:
+                alert |= 1 << (2 * ch + 1)
+        self.registers[ReceptorRegisters.Alert] = alert
+
+
+class LidKitArduino(FakeDevice):
+    """
+    The lid kit sketch: one byte writes set the colour, {KEYPAD_ACK, seq} drops keys up to seq, reads return a key frame
+    """
+    BUFLEN = 64
+    MAX_FRAME_KEYS = 30
+    KEYPAD_ACK = 0x23
+    # What the Wire library clocks out after the sketch's data runs out
+    PAD = 0xFF
+
+    def __init__(self):
+        self.keys = bytearray()
+        # Sequence number of the oldest key in the buffer
+        self.seq = 0
+        self.color = 0
+        self.rgb = (0, 0, 0)
+
+    def press(self, keys: str):
+        for k in keys.encode():
+            if len(self.keys) == self.BUFLEN:
+                self._drop(1)
+            self.keys.append(k)
+
+    def _drop(self, n: int):
+        n = min(n, len(self.keys))
+        del self.keys[:n]
+        self.seq = (self.seq + n) & 0xFF
+
+    def _ack(self, seq: int):
+        # Keys acked after they were already dropped from a full buffer are behind self.seq and left alone
+        n = (seq - self.seq) & 0xFF
+        if n < len(self.keys):
+            self._drop(n + 1)
+
+    def write(self, data: bytes):
+        if len(data) == 1:
+            self.color = data[0]
+        elif len(data) == 2:
+            if data[0] == self.KEYPAD_ACK:
+                self._ack(data[1])
+        elif len(data) == 3:
+            self.rgb = tuple(data)
+
+    def read(self, n: int) -> bytes:
+        keys = self.keys[:self.MAX_FRAME_KEYS]
+        out = bytes((len(keys), self.seq)) + keys
+        return out[:n].ljust(n, bytes((self.PAD,)))
+
+
+class FakeSMBus(object):
+    """
+    Implements the smbus2 SMBus calls the drivers use against in-process FakeDevices
+    """
+
+    def __init__(self, devices: Dict[int, FakeDevice] = None):
+        self.devices = dict(devices or {})
+
+    def attach(self, address: int, device: FakeDevice) -> FakeDevice:
+        self.devices[address] = device
+        return device
+
+    def detach(self, address: int):
+        self.devices.pop(address, None)
+
+    def _device(self, address: int) -> FakeDevice:
+        try:
+            return self.devices[address]
+        except KeyError:
+            raise OSError(errno.EREMOTEIO, 'No device at {}'.format(hex(address)))
+
+    def open(self, bus):
+        pass
+
+    def close(self):
+        pass
+
+    def write_byte(self, i2c_addr: int, value: int):
+        self._device(i2c_addr).write(bytes((value,)))
+
+    def read_byte(self, i2c_addr: int) -> int:
+        return self._device(i2c_addr).read(1)[0]
+
+    def write_byte_data(self, i2c_addr: int, register: int, value: int):
+        self._device(i2c_addr).write(bytes((register, value)))
+
+    def read_byte_data(self, i2c_addr: int, register: int) -> int:
+        device = self._device(i2c_addr)
+        device.write(bytes((register,)))
+        return device.read(1)[0]
+
+    def write_i2c_block_data(self, i2c_addr: int, register: int, data):
+        self._device(i2c_addr).write(bytes((register,)) + bytes(data))
+
+    def read_i2c_block_data(self, i2c_addr: int, register: int, length: int):
+        device = self._device(i2c_addr)
+        device.write(bytes((register,)))
+        return list(device.read(length))
+
+    def i2c_rdwr(self, *i2c_msgs):
+        for msg in i2c_msgs:
+            device = self._device(msg.addr)
+            if msg.flags & I2C_M_RD:
+                data = device.read(msg.len)
+                memmove(msg.buf, data, msg.len)
+            elif msg.len:
+                device.write(msg.buf[:msg.len])
+            # An empty write only checks the device acknowledges its address
+
+
+def theseus_box() -> FakeSMBus:
+    """
+    :return: A bus with every device at the drivers' default addresses
+    """
+    return FakeSMBus({
+        0x0d: LidKitArduino(),
+        0x21: AD7998(),
+        0x39: PCF8574(),
+        0x3a: PCF8574(),
+        0x3b: PCF8574(),
+        0x70: HT16K33(),
+    })
@@ -1,6 +1,7 @@
 class MockGPIO(object):
     BCM = 0
     IN = 0
+    FALLING = 0
 
     @staticmethod
     def setmode(bcm):
@@ -1,69 +1,245 @@
 #!/usr/bin/env python3
+import os
+import sys
+import tempfile
+from fcntl import LOCK_EX, LOCK_UN, lockf
 from enum import IntEnum
-from multiprocessing import Manager, Process
+from multiprocessing import Manager, Process, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from threading import Lock
+from time import sleep
 from typing import List
 import logging
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.ERROR)
 
-manager = Manager()
-shared_dict = manager.dict()
+# Created by the first ManagerRegisters, processes forked after that share it
+manager = None
+shared_dict = None
+
+
+def _name(address) -> str:
+    return getattr(address, 'name', hex(address))
+
+
+class ManagerRegisters(object):
+    """
+    Registers kept in a Manager dict, every byte access is a round trip to the manager process
+    """
+
+    def __init__(self, bus: int = None, registers: int = 64):
+        global manager, shared_dict
+        if manager is None:
+            manager = Manager()
+            shared_dict = manager.dict()
+        self.registers = registers
+        self.messages = shared_dict
+
+    def read(self, address: int, register: int, n: int) -> List[int]:
+        self._create_reg_if_not_exists(address)
+        if isinstance(self.messages[address], int):
+            return [self.messages[address]]
+        return self.messages[address][register: register + n]
+
+    def write(self, address: int, register: int, data: List[int]):
+        self._create_reg_if_not_exists(address)
+        for i, d in enumerate(data):
+            self.messages[address][register + i] = d
+
+    def _create_reg_if_not_exists(self, address: int):
+        if self.messages.get(address, None) is None:
+            self.messages[address] = manager.list(bytearray(self.registers))
+
+    def close(self):
+        global manager, shared_dict
+        if manager is not None:
+            manager.shutdown()
+            manager = shared_dict = None
+
+
+class SharedMemoryRegisters(object):
+    """
+    A fixed ADDRESSES x registers map in a named shared memory segment, shared by every process that opens the same bus.
+
+    Each address has a sequence counter that writers make odd while they write, readers retry until they copy the
+    registers with the same even count before and after. Writers to an address are serialized across processes by a
+    lock on that address's byte of a lock file next to the segment, and within a process by a thread lock, since the
+    file lock is held by the process.
+
+    The segment starts with the creator's PID. A segment whose creator is gone was left by a run that crashed before it
+    could unlink it, it is unlinked and created again rather than handing out its stale registers.
+    """
+    ADDRESSES = 128
+    SEQ_SIZE = 4
+    # Creator's PID and the PID of its resource tracker
+    HEADER_SIZE = 8
+
+    def __init__(self, bus: int = None, registers: int = 64):
+        self.registers = registers
+        name = 'theseus_mockbus_{}'.format(bus)
+        size = self.HEADER_SIZE + self.ADDRESSES * (self.SEQ_SIZE + registers)
+        self.shm, self.owner = self._open(name, size)
+        buf = self.shm.buf
+        self.header = buf[:self.HEADER_SIZE].cast('I')
+        if self.owner:
+            self.header[0] = os.getpid()
+            self.header[1] = self._tracker_pid()
+        self.lock_path = os.path.join(tempfile.gettempdir(), '{}.lock'.format(name))
+        self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+        seq_end = self.HEADER_SIZE + self.ADDRESSES * self.SEQ_SIZE
+        self.seq = buf[self.HEADER_SIZE:seq_end].cast('I')
+        self.regs = buf[seq_end:size]
+        self._write_lock = Lock()
+
+    @staticmethod
+    def _tracker_pid() -> int:
+        resource_tracker.ensure_running()
+        return resource_tracker._resource_tracker._pid or 0
+
+    @staticmethod
+    def _creator_alive(shm: SharedMemory, size: int) -> bool:
+        if shm.size < size:
+            # Made by an older layout, nothing current can be using it
+            return False
+        pid = int.from_bytes(shm.buf[:4], sys.byteorder)
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    @classmethod
+    def _open(cls, name: str, size: int):
+        """
+        :return: The segment, and whether this process created it
+        """
+        try:
+            return SharedMemory(name, create=True, size=size), True
+        except FileExistsError:
+            pass
+        shm = SharedMemory(name)
+        if cls._creator_alive(shm, size):
+            # Only the creator unlinks the segment, stop this process's tracker from removing it on exit. A forked
+            # process shares the creator's tracker, which has to keep it
+            if int.from_bytes(shm.buf[4:8], sys.byteorder) != cls._tracker_pid():
+                resource_tracker.unregister(shm._name, 'shared_memory')
+            return shm, False
+        logger.warning('Replacing shared memory {} left by a process that is gone'.format(name))
+        shm.close()
+        shm.unlink()
+        return SharedMemory(name, create=True, size=size), True
+
+    def read(self, address: int, register: int, n: int) -> List[int]:
+        start = address * self.registers + register
+        end = start + min(n, self.registers - register)
+        seq, regs = self.seq, self.regs
+        spins = 0
+        while True:
+            before = seq[address]
+            if not before & 1:
+                data = list(regs[start:end])
+                if seq[address] == before:
+                    return data
+            spins += 1
+            if spins & 0xFF == 0:
+                sleep(0)
+
+    def write(self, address: int, register: int, data: List[int]):
+        start = address * self.registers + register
+        data = bytes(data[:self.registers - register])
+        with self._write_lock:
+            lockf(self._lock_fd, LOCK_EX, 1, address)
+            try:
+                count = self.seq[address]
+                self.seq[address] = (count + 1) & 0xFFFFFFFF
+                self.regs[start:start + len(data)] = data
+                self.seq[address] = (count + 2) & 0xFFFFFFFF
+            finally:
+                lockf(self._lock_fd, LOCK_UN, 1, address)
+
+    def close(self):
+        self.header.release()
+        self.seq.release()
+        self.regs.release()
+        self.shm.close()
+        os.close(self._lock_fd)
+        if self.owner:
+            self.shm.unlink()
+            try:
+                os.remove(self.lock_path)
+            except FileNotFoundError:
+                pass
 
 
 class MockBus(object):
     # The total number of registers
     REGISTERS = 64
+    BACKENDS = {
+        'manager': ManagerRegisters,
+        'shm': SharedMemoryRegisters,
+    }
+    DEFAULT_BACKEND = 'manager'
+    # Open backends by (backend, bus), so each process attaches to a bus once
+    _backends = {}
+    _backends_lock = Lock()
 
-    def __init__(self, bus: int = None):
+    def __init__(self, bus: int = None, backend: str = None):
+        """
+        :param bus: The bus number, buses with the same number share registers across processes
+        :param backend: 'manager' or 'shm', defaults to DEFAULT_BACKEND
+        """
         self.bus = bus
-        self.messages = shared_dict
+        backend = backend or self.DEFAULT_BACKEND
+        with self._backends_lock:
+            key = (backend, bus)
+            if key not in self._backends:
+                self._backends[key] = self.BACKENDS[backend](bus, self.REGISTERS)
+            self.backend = self._backends[key]
+
+    @classmethod
+    def shutdown(cls):
+        """
+        Close every backend this process opened, stopping the Manager process and unlinking shared memory it created
+        """
+        with cls._backends_lock:
+            backends, cls._backends = list(cls._backends.values()), {}
+        for backend in backends:
+            backend.close()
 
     def read_byte(self, address: IntEnum) -> int:
         result = self.read_byte_data(address, 0)
-        logger.debug("Read Byte: DEVICE: {} Value: {}".format(address.name, result))
+        logger.debug("Read Byte: DEVICE: %s Value: %s", _name(address), result)
         return result
 
     def write_byte(self, address: IntEnum, byte: int):
-        logger.debug("Write Byte: DEVICE: {} Value: {}".format(address.name, byte))
+        logger.debug("Write Byte: DEVICE: %s Value: %s", _name(address), byte)
         self.write_byte_data(address, 0, byte)
 
     def read_byte_data(self, address: IntEnum, register: int) -> int:
         """Read a single word from a designated register."""
-        self._create_reg_if_not_exists(address)
-        if isinstance(self.messages[address], int):
-            result = self.messages[address]
-        else:
-            result = self.messages[address][register]
-        logger.debug("Read Byte Data: DEVICE: {} Register: {} Value: {}".format(address.name, register, result))
+        result = self.backend.read(address, register, 1)[0]
+        logger.debug("Read Byte Data: DEVICE: %s Register: %s Value: %s", _name(address), register, result)
         return result
 
     def write_byte_data(self, address: IntEnum, register: int, value: int):
         """Write a single byte to a designated register."""
-        logger.debug("Write Byte Data: DEVICE: {} Register: {} Value: {}".format(address.name, register, value))
-        self._create_reg_if_not_exists(address)
-        self.messages[address][register] = value
+        logger.debug("Write Byte Data: DEVICE: %s Register: %s Value: %s", _name(address), register, value)
+        self.backend.write(address, register, [value])
 
     def read_i2c_block_data(self, address: IntEnum, start_register: int, buffer: int) -> bytearray:
-        self._create_reg_if_not_exists(address)
-        result = self.messages[address][start_register: start_register + buffer]
-        logger.debug("Read Block Data: DEVICE: {} Register: {} Value: {}".format(address.name, start_register, result))
+        result = self.backend.read(address, start_register, buffer)
+        logger.debug("Read Block Data: DEVICE: %s Register: %s Value: %s", _name(address), start_register, result)
         return result
 
     def write_i2c_block_data(self, address: IntEnum, start_register: int, data: List[ord]):
-        self._create_reg_if_not_exists(address)
-        logger.debug("Write Block Data: DEVICE: {} Register: {} Value: {}".format(address.name, start_register, data))
-        for i, d in enumerate(data):
-            self.messages[address][start_register + i] = d
-
-    def _create_reg_if_not_exists(self, address: IntEnum):
-        if self.messages.get(address, None) is None:
-            self.messages[address] = manager.list(bytearray(self.REGISTERS))
+        logger.debug("Write Block Data: DEVICE: %s Register: %s Value: %s", _name(address), start_register, data)
+        self.backend.write(address, start_register, data)
 
 
 if __name__ == "__main__":
-    from time import sleep
-
+    logging.basicConfig(level=logging.ERROR)
     master = 1
     length = 5
 
@@ -79,3 +255,4 @@ if __name__ == "__main__":
     sleep(.1)
 
     print(MockBus().read_i2c_block_data(master, 0, length))
+    MockBus.shutdown()
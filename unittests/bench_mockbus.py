@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Compare MockBus backends: python -m Project_Theseus_API.unittests.bench_mockbus
+"""
+from argparse import ArgumentParser
+from multiprocessing import Process
+from time import perf_counter
+
+from Project_Theseus_API.mockpi.smbus import MockBus
+
+ADDRESS = 0x70
+BLOCK = list(range(10))
+
+
+def _ops(bus: MockBus):
+    return {
+        'write_byte_data': lambda: bus.write_byte_data(ADDRESS, 3, 0x5A),
+        'read_byte_data': lambda: bus.read_byte_data(ADDRESS, 3),
+        'write_i2c_block_data': lambda: bus.write_i2c_block_data(ADDRESS, 0, BLOCK),
+        'read_i2c_block_data': lambda: bus.read_i2c_block_data(ADDRESS, 0, len(BLOCK)),
+    }
+
+
+def bench(backend: str, n: int) -> dict:
+    """
+    :return: Operations per second for each MockBus method
+    """
+    bus = MockBus(1, backend=backend)
+    results = {}
+    for name, op in _ops(bus).items():
+        start = perf_counter()
+        for _ in range(n):
+            op()
+        results[name] = n / (perf_counter() - start)
+    return results
+
+
+def _write_pattern(backend: str, n: int):
+    bus = MockBus(1, backend=backend)
+    for i in range(n):
+        bus.write_i2c_block_data(ADDRESS, 0, [i & 0xFF] * len(BLOCK))
+
+
+def check_cross_process(backend: str, n: int = 200) -> int:
+    """
+    Read blocks while another process writes them
+    :return: The number of torn reads, blocks holding bytes from two different writes
+    """
+    bus = MockBus(1, backend=backend)
+    bus.write_i2c_block_data(ADDRESS, 0, [0] * len(BLOCK))
+    writer = Process(target=_write_pattern, args=(backend, n))
+    writer.start()
+    torn = 0
+    while writer.is_alive():
+        block = bus.read_i2c_block_data(ADDRESS, 0, len(BLOCK))
+        torn += len(set(block)) > 1
+    writer.join()
+    last = bus.read_i2c_block_data(ADDRESS, 0, len(BLOCK))
+    assert last == [(n - 1) & 0xFF] * len(BLOCK), "Write from the child process wasn't seen: {}".format(last)
+    return torn
+
+
+def main():
+    args = ArgumentParser(description=__doc__)
+    args.add_argument('-n', type=int, default=2000, help='Operations per measurement')
+    args.add_argument('--backends', nargs='+', default=list(MockBus.BACKENDS))
+    opts = args.parse_args()
+
+    results = {b: bench(b, opts.n) for b in opts.backends}
+    names = list(next(iter(results.values())))
+    print('{:<22}'.format('ops/s') + ''.join('{:>14}'.format(b) for b in opts.backends))
+    for name in names:
+        print('{:<22}'.format(name) + ''.join('{:>14,.0f}'.format(results[b][name]) for b in opts.backends))
+    for b in opts.backends:
+        print('{} torn block reads across processes: {}'.format(b, check_cross_process(b)))
+    MockBus.shutdown()
+
+
+if __name__ == '__main__':
+    main()
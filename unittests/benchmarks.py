@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Driver hot path benchmarks: python -m Project_Theseus_API.unittests.benchmarks [-o results.json] [--compare old.json]
+
+Drivers run against FakeSMBus so results measure the Python side, CountingBus counts what would go over the wire.
+"""
+import atexit
+import json
+import logging
+import os
+import shutil
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from argparse import ArgumentParser
+from datetime import datetime
+from itertools import count
+from time import perf_counter
+from typing import Callable, Dict
+
+from Project_Theseus_API.i2c.laser_i2c import LaserControl
+from Project_Theseus_API.i2c.laser_patterns import PatternPlayer, sweep
+from Project_Theseus_API.i2c.lid_kit import ArduinoI2C
+from Project_Theseus_API.i2c.receptors_i2c import ReceptorControl
+from Project_Theseus_API.i2c.recorder import BusRecorder, BusReplayer
+from Project_Theseus_API.i2c.sevenseg import SevenSeg
+from Project_Theseus_API.i2c.switches_i2c import SwitchesI2C
+from Project_Theseus_API.i2c.test_suite import TestSuite
+from Project_Theseus_API.i2c.timers import TimerWheel
+from Project_Theseus_API.mockpi.fake_smbus import theseus_box
+from Project_Theseus_API.mockpi.smbus import MockBus
+
+
+class CountingBus(object):
+    """
+    Wraps a bus and counts transactions and the bytes each puts on the wire, device addresses excluded
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.transactions = 0
+        self.bytes = 0
+
+    def reset(self):
+        self.transactions = self.bytes = 0
+
+    def _count(self, n: int):
+        self.transactions += 1
+        self.bytes += n
+
+    def write_byte(self, i2c_addr, value):
+        self._count(1)
+        return self.bus.write_byte(i2c_addr, value)
+
+    def read_byte(self, i2c_addr):
+        self._count(1)
+        return self.bus.read_byte(i2c_addr)
+
+    def write_byte_data(self, i2c_addr, register, value):
+        self._count(2)
+        return self.bus.write_byte_data(i2c_addr, register, value)
+
+    def read_byte_data(self, i2c_addr, register):
+        self._count(2)
+        return self.bus.read_byte_data(i2c_addr, register)
+
+    def write_i2c_block_data(self, i2c_addr, register, data):
+        self._count(1 + len(data))
+        return self.bus.write_i2c_block_data(i2c_addr, register, data)
+
+    def read_i2c_block_data(self, i2c_addr, register, length):
+        self._count(1 + length)
+        return self.bus.read_i2c_block_data(i2c_addr, register, length)
+
+    def i2c_rdwr(self, *i2c_msgs):
+        self._count(sum(msg.len for msg in i2c_msgs))
+        return self.bus.i2c_rdwr(*i2c_msgs)
+
+
+class Case(object):
+    def __init__(self, name: str, setup: Callable[[CountingBus], Callable[[], None]], n: int = None):
+        """
+        :param setup: Builds the devices on a counting bus and returns the operation to time
+        :param n: Operations per measurement, overrides the command line
+        """
+        self.name = name
+        self.setup = setup
+        self.n = n
+
+
+def _lasers(bus):
+    lasers = LaserControl(bus)
+    states = count()
+    return lambda: setattr(lasers, 'state', next(states) & 0x3F)
+
+
+def _laser_pattern(bus):
+    # A frame per call, the wheel runs on a clock that advances one frame interval at a time
+    clock = [0.0]
+    timers = TimerWheel(clock=lambda: clock[0])
+    PatternPlayer(LaserControl(bus), timers).play(sweep(0.1))
+
+    def step():
+        clock[0] += 0.1
+        timers.advance()
+
+    return step
+
+
+def _sevenseg(bus):
+    seven = SevenSeg(bus)
+    values = count()
+    return lambda: seven.sevenseg(next(values) & 0xFFFF, [True, False])
+
+
+def _sevenseg_countdown(bus):
+    # A clock refreshed at 10 Hz only changes digits once a second
+    seven = SevenSeg(bus)
+    ticks = count()
+    return lambda: seven.sevenseg(0x5959 - next(ticks) // 10 & 0xFFFF)
+
+
+def _receptors(method: str):
+    def setup(bus):
+        receptors = ReceptorControl(bus)
+        return getattr(receptors, method)
+
+    return setup
+
+
+def _switches(max_age: float):
+    # 0 reads the port every call, longer ages measure the shared read path
+    def setup(bus):
+        switches = SwitchesI2C(bus)
+        return lambda: switches.read_switches(max_age)
+
+    return setup
+
+
+def _keypad(bus):
+    arduino = ArduinoI2C(bus)
+    return lambda: arduino.keypad
+
+
+def _test_suite(bus):
+    suite = TestSuite(bus)
+    scanner = suite.scanner()
+    keypad = bus.bus.devices[0x0d]
+    ticks = count()
+
+    def step():
+        tick = next(ticks)
+        if tick % 50 == 0:
+            keypad.press('1')
+        # Advance a tick per call so every device is read at its configured rate
+        suite.update(scanner.tick(tick * scanner.period))
+
+    return step
+
+
+def _session(bus, ticks: int = 500):
+    """
+    A game session: TestSuite main loop iterations with a key pressed now and then
+    """
+    suite = TestSuite(bus)
+    scanner = suite.scanner()
+    for tick in range(ticks):
+        if tick % 50 == 0:
+            keypad = getattr(bus, 'devices', {}).get(0x0d)
+            if keypad:
+                keypad.press('1')
+        suite.update(scanner.tick(tick * scanner.period))
+
+
+def _replay(bus):
+    # Record a session once, then replay the whole of it through fresh drivers as fast as possible
+    directory = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, directory, True)
+    path = os.path.join(directory, 'session.log')
+    box = bus.bus
+    with BusRecorder(box, path) as recorder:
+        _session(recorder)
+
+    def replay():
+        bus.bus = BusReplayer(path)
+        _session(bus)
+
+    return replay
+
+
+def _mockbus(backend: str, op: str):
+    def setup(bus):
+        bus.bus = MockBus(1, backend=backend)
+        block = list(range(10))
+        if op == 'read':
+            return lambda: bus.read_i2c_block_data(0x70, 0, 10)
+        return lambda: bus.write_i2c_block_data(0x70, 0, block)
+
+    return setup
+
+
+CASES = [
+    Case('lasers.state', _lasers),
+    Case('lasers.pattern_sweep', _laser_pattern),
+    Case('sevenseg.sevenseg', _sevenseg),
+    Case('sevenseg.sevenseg_countdown', _sevenseg_countdown),
+    Case('receptors.read_raw', _receptors('read_raw')),
+    Case('receptors.read', _receptors('read')),
+    Case('receptors.read_int', _receptors('read_int')),
+    Case('switches.read_switches', _switches(0)),
+    Case('switches.read_switches_shared', _switches(60)),
+    Case('arduino.keypad', _keypad),
+    Case('test_suite.update', _test_suite),
+    Case('replay.test_suite_session', _replay, n=50),
+    Case('mockbus.shm.read_block', _mockbus('shm', 'read')),
+    Case('mockbus.shm.write_block', _mockbus('shm', 'write')),
+    Case('mockbus.manager.read_block', _mockbus('manager', 'read'), n=200),
+    Case('mockbus.manager.write_block', _mockbus('manager', 'write'), n=50),
+]
+
+
+def run_case(case: Case, n: int, alloc_samples: int = 200) -> Dict[str, float]:
+    bus = CountingBus(theseus_box())
+    op = case.setup(bus)
+    n = case.n or n
+    for _ in range(min(n, 100)):
+        op()
+
+    bus.reset()
+    start = perf_counter()
+    for _ in range(n):
+        op()
+    elapsed = perf_counter() - start
+    transactions, written = bus.transactions, bus.bytes
+
+    # Peak memory allocated while one operation runs, averaged
+    samples = min(alloc_samples, n)
+    tracemalloc.start()
+    peak = 0
+    for _ in range(samples):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        op()
+        peak += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+
+    return {
+        'n': n,
+        'ops_per_sec': n / elapsed,
+        'us_per_op': elapsed / n * 1e6,
+        'transactions_per_op': transactions / n,
+        'bytes_per_op': written / n,
+        'alloc_bytes_per_op': peak / samples,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              check=True, universal_newlines=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    :return: Names of the cases that got slower, or do more bus work, than the baseline allows
+    """
+    regressions = []
+    print('\n{:<32}{:>12}{:>12}{:>9}'.format('vs baseline', 'ops/s', 'was', 'ratio'))
+    for name, now in results['results'].items():
+        was = baseline['results'].get(name)
+        if was is None:
+            continue
+        ratio = now['ops_per_sec'] / was['ops_per_sec']
+        more_bus = (now['transactions_per_op'] > was['transactions_per_op'] + 1e-9
+                    or now['bytes_per_op'] > was['bytes_per_op'] + 1e-9)
+        flag = ' <-' if ratio < 1 - tolerance or more_bus else ''
+        if flag:
+            regressions.append(name)
+        print('{:<32}{:>12,.0f}{:>12,.0f}{:>9.2f}{}'.format(name, now['ops_per_sec'], was['ops_per_sec'], ratio, flag))
+    return regressions
+
+
+def main():
+    args = ArgumentParser(description=__doc__)
+    args.add_argument('-n', type=int, default=20000, help='Operations per case')
+    args.add_argument('-o', '--output', help='Write results to this JSON file')
+    args.add_argument('--compare', help='JSON results from an earlier run to compare against')
+    args.add_argument('--tolerance', type=float, default=0.1, help='Allowed slowdown before a case is flagged')
+    args.add_argument('-k', dest='only', help='Only run cases whose name contains this')
+    opts = args.parse_args()
+
+    logging.disable(logging.WARNING)
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'timestamp': datetime.now().isoformat(),
+        'results': {},
+    }
+    print('{:<32}{:>12}{:>10}{:>10}{:>10}{:>12}'.format('case', 'ops/s', 'us/op', 'txn/op', 'B/op', 'alloc B/op'))
+    for case in CASES:
+        if opts.only and opts.only not in case.name:
+            continue
+        r = run_case(case, opts.n)
+        results['results'][case.name] = r
+        print('{:<32}{:>12,.0f}{:>10.2f}{:>10.2f}{:>10.2f}{:>12.0f}'.format(
+            case.name, r['ops_per_sec'], r['us_per_op'], r['transactions_per_op'], r['bytes_per_op'],
+            r['alloc_bytes_per_op']))
+    MockBus.shutdown()
+
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if opts.compare:
+        with open(opts.compare) as f:
+            regressions = compare(results, json.load(f), opts.tolerance)
+        if regressions:
+            sys.exit('Regressed: {}'.format(', '.join(regressions)))
+
+
+if __name__ == '__main__':
+    main()
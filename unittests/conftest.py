@@ -0,0 +1,13 @@
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The package is imported as Project_Theseus_API, register a checkout under another name by that name
+try:
+    import Project_Theseus_API
+except ImportError:
+    package = types.ModuleType('Project_Theseus_API')
+    package.__path__ = [ROOT]
+    sys.modules['Project_Theseus_API'] = package
@@ -0,0 +1,96 @@
+import unittest
+from threading import Event
+
+from Project_Theseus_API.i2c.bus_arbiter import BusArbiter, Priority
+from Project_Theseus_API.i2c.switches_i2c import SwitchesI2C
+from Project_Theseus_API.mockpi.fake_smbus import theseus_box
+
+
+class BusArbiterTest(unittest.TestCase):
+    def setUp(self):
+        self.bus = theseus_box()
+        self.arbiter = BusArbiter(self.bus)
+        self.served = []
+
+    def tearDown(self):
+        self.arbiter.close(5)
+
+    def hold(self) -> Event:
+        """
+        Keep the worker busy until the returned event is set, so the queue fills up behind it
+        """
+        release, busy = Event(), Event()
+
+        def block(bus):
+            busy.set()
+            release.wait(5)
+
+        self.arbiter.submit(Priority.CRITICAL, block)
+        busy.wait(5)
+        return release
+
+    def record(self, name):
+        def op(bus):
+            self.served.append(name)
+            return name
+
+        return op
+
+    def test_priority_order(self):
+        release = self.hold()
+        futures = [self.arbiter.submit(p, self.record('{}{}'.format(p.name, n)))
+                   for n in range(2) for p in reversed(Priority)]
+        release.set()
+        for f in futures:
+            f.result(5)
+        self.assertEqual(self.served, ['CRITICAL0', 'CRITICAL1', 'INPUT0', 'INPUT1', 'NORMAL0', 'NORMAL1',
+                                       'BULK0', 'BULK1'])
+        stats = self.arbiter.stats()
+        self.assertEqual(stats['BULK']['max_depth'], 2)
+        self.assertEqual(stats['BULK']['depth'], 0)
+        self.assertEqual(stats['CRITICAL']['count'], 3)
+
+    def test_call(self):
+        self.assertEqual(self.arbiter.call(Priority.NORMAL, 'read_byte', 0x39), 0xFF)
+        with self.assertRaises(OSError):
+            self.arbiter.call(Priority.NORMAL, 'read_byte', 0x50)
+
+    def test_call_from_worker(self):
+        def nested(bus):
+            return self.arbiter.call(Priority.NORMAL, 'read_byte', 0x39)
+
+        self.assertEqual(self.arbiter.call(Priority.NORMAL, nested), 0xFF)
+
+    def test_driver(self):
+        switches = SwitchesI2C(self.arbiter)
+        self.assertIs(switches.bus, self.bus)
+        served = self.arbiter.stats()[SwitchesI2C.PRIORITY.name]['count']
+        self.assertEqual(switches.read_byte(), (True, 0xFF))
+        # Queued at the driver's priority
+        self.assertEqual(self.arbiter.stats()[SwitchesI2C.PRIORITY.name]['count'], served + 1)
+
+    def test_close_serves_queued(self):
+        release = self.hold()
+        futures = [self.arbiter.submit(Priority.BULK, self.record(n)) for n in range(3)]
+        release.set()
+        self.arbiter.close(5)
+        self.assertTrue(self.arbiter.closed)
+        self.assertEqual([f.result(0) for f in futures], [0, 1, 2])
+        with self.assertRaises(RuntimeError):
+            self.arbiter.submit(Priority.CRITICAL, 'read_byte', 0x39)
+        with self.assertRaises(RuntimeError):
+            self.arbiter.call(Priority.CRITICAL, 'read_byte', 0x39)
+        # Closing again is harmless
+        self.arbiter.close(5)
+
+    def test_cancelled(self):
+        release = self.hold()
+        future = self.arbiter.submit(Priority.BULK, self.record('cancelled'))
+        self.assertTrue(future.cancel())
+        release.set()
+        self.arbiter.call(Priority.BULK, 'read_byte', 0x39)
+        self.assertEqual(self.served, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
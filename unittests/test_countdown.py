@@ -0,0 +1,193 @@
+import unittest
+
+from Project_Theseus_API.i2c import test_suite
+from Project_Theseus_API.i2c.countdown import Countdown
+from Project_Theseus_API.i2c.sevenseg import SevenSeg
+from Project_Theseus_API.i2c.timers import TimerWheel
+from Project_Theseus_API.mockpi.fake_smbus import theseus_box
+from Project_Theseus_API.unittests.test_timers import ManualClock
+
+
+def digits(value: int) -> bytes:
+    # The four digits of a frame, without the colon
+    frame = SevenSeg.encode(value)
+    return bytes((frame[0], frame[1], frame[3], frame[4]))
+
+
+class CountdownTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = ManualClock()
+        self.timers = TimerWheel(tick=0.25, clock=self.clock)
+        bus = theseus_box()
+        self.ht16k33 = bus.devices[0x70]
+        self.expired = []
+        self.countdown = Countdown(SevenSeg(bus), 90, lambda: self.expired.append(self.clock.now), self.timers,
+                                   self.clock)
+
+    def advance(self, now: float):
+        self.clock.now = now
+        self.timers.advance()
+
+    def assertShows(self, value: int):
+        self.assertEqual(self.ht16k33.digits, digits(value))
+        self.assertTrue(self.ht16k33.colon)
+
+    def test_encode(self):
+        self.assertEqual(Countdown.encode(90), 0x0130)
+        self.assertEqual(Countdown.encode(59.1), 0x0100)
+        self.assertEqual(Countdown.encode(0), 0x0000)
+        self.assertEqual(Countdown.encode(-5), 0x0000)
+        self.assertEqual(Countdown.encode(100 * 60), 0x9900)
+
+    def test_counts_down(self):
+        self.assertFalse(self.countdown.running)
+        self.countdown.start()
+        self.assertTrue(self.countdown.running)
+        self.assertShows(0x0130)
+        self.advance(0.5)
+        self.assertShows(0x0130)
+        self.advance(1.0)
+        self.assertShows(0x0129)
+        self.advance(61.0)
+        self.assertShows(0x0029)
+        self.assertEqual(self.countdown.remaining, 29.0)
+
+    def test_pause_and_resume(self):
+        self.countdown.start()
+        self.advance(10.0)
+        self.countdown.pause()
+        self.assertFalse(self.countdown.running)
+        self.advance(50.0)
+        self.assertEqual(self.countdown.remaining, 80.0)
+        self.assertShows(0x0120)
+        self.countdown.resume()
+        self.advance(60.0)
+        self.assertShows(0x0110)
+        self.assertEqual(self.expired, [])
+
+    def test_add_time(self):
+        self.countdown.start()
+        self.countdown.add_time(30)
+        self.assertShows(0x0200)
+        self.countdown.add_time(-100)
+        self.assertShows(0x0020)
+        self.countdown.pause()
+        self.countdown.add_time(-100)
+        self.assertEqual(self.countdown.remaining, 0.0)
+
+    def test_expires(self):
+        self.countdown.start()
+        self.advance(89.75)
+        self.assertEqual(self.expired, [])
+        self.advance(90.0)
+        self.assertEqual(self.expired, [90.0])
+        self.assertShows(0x0000)
+        self.assertFalse(self.countdown.running)
+        self.assertTrue(self.countdown.expired)
+        self.assertTrue(self.countdown.flashing)
+        self.assertTrue(self.countdown.active)
+        self.assertEqual(self.ht16k33.blink, Countdown.BLINK)
+        self.assertEqual(len(self.timers), 0)
+
+    def test_resume_and_pause_do_nothing_once_expired(self):
+        self.countdown.start()
+        self.advance(90.0)
+        self.countdown.resume()
+        self.countdown.pause()
+        self.advance(100.0)
+        self.assertFalse(self.countdown.running)
+        self.assertTrue(self.countdown.flashing)
+        self.assertEqual(self.ht16k33.blink, Countdown.BLINK)
+        self.assertEqual(self.expired, [90.0])
+
+    def test_restart_after_expiry(self):
+        self.countdown.start()
+        self.advance(90.0)
+        self.countdown.start(10)
+        self.assertTrue(self.countdown.running)
+        self.assertFalse(self.countdown.flashing)
+        self.assertEqual(self.ht16k33.blink, 0)
+        self.assertShows(0x0010)
+        self.advance(100.0)
+        self.assertEqual(self.expired, [90.0, 100.0])
+
+    def test_dots(self):
+        self.countdown.start()
+        self.countdown.dots = [True, False, False, True]
+        frame = SevenSeg.encode(0x0130, [True, False, False, True])
+        self.assertEqual(self.ht16k33.digits, bytes((frame[0], frame[1], frame[3], frame[4])))
+        self.advance(1.0)
+        self.assertTrue(self.ht16k33.digits[3] & SevenSeg.DOT)
+
+
+class Game(test_suite.TestSuite):
+    seconds = 3
+
+
+class KeypadGameTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = ManualClock()
+        self.timers = TimerWheel(tick=0.25, clock=self.clock)
+        self.bus = theseus_box()
+        self.ht16k33 = self.bus.devices[0x70]
+
+    def press(self, suite, keys: str):
+        self.bus.devices[0x0d].press(keys)
+        suite.keypress
+        suite.render()
+
+    def advance(self, now: float):
+        self.clock.now = now
+        self.timers.advance()
+
+    def assertShows(self, value: int):
+        self.assertEqual(self.ht16k33.digits, digits(value))
+
+    def test_game(self):
+        suite = Game(self.bus, timers=self.timers)
+        self.press(suite, '12')
+        self.assertShows(0x0012)
+        self.press(suite, '#')
+        self.assertTrue(suite.timer_running)
+        self.assertShows(0x0003)
+        self.advance(1.0)
+        self.assertShows(0x0002)
+        # A digit pauses the clock and the display shows the code again
+        self.press(suite, '5')
+        self.assertFalse(suite.timer_running)
+        self.assertShows(0x0125)
+        self.advance(5.0)
+        self.press(suite, '#')
+        self.assertShows(0x0002)
+        self.advance(7.0)
+        self.assertTrue(suite.dead)
+        self.assertShows(0x0000)
+        self.assertEqual(self.ht16k33.blink, Countdown.BLINK)
+        # Time is up, '#' can't start the clock again
+        self.press(suite, '#')
+        self.assertFalse(suite.timer_running)
+        self.assertEqual(self.ht16k33.blink, Countdown.BLINK)
+        self.press(suite, '7')
+        self.assertEqual(self.ht16k33.blink, 0)
+        self.assertShows(0x1257)
+
+    def test_no_time(self):
+        suite = test_suite.TestSuite(self.bus, timers=self.timers)
+        self.assertIsNone(suite.countdown)
+        self.press(suite, '1')
+        self.assertFalse(suite.dead)
+        self.press(suite, '#')
+        self.assertTrue(suite.dead)
+        self.assertShows(0x0001)
+
+    def test_no_display(self):
+        self.bus.detach(0x70)
+        suite = Game(self.bus, timers=self.timers)
+        self.press(suite, '#')
+        self.assertTrue(suite.timer_running)
+        self.advance(3.0)
+        self.assertTrue(suite.dead)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,235 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from Project_Theseus_API.i2c import test_suite
+from Project_Theseus_API.i2c.bus_arbiter import BusArbiter
+from Project_Theseus_API.i2c.discovery import (DEFAULT_ADDRESSES, BatchBus, NullDevice, PresenceCache, build_devices,
+                                               discover, probe, scan)
+from Project_Theseus_API.i2c.laser_i2c import LaserControl
+from Project_Theseus_API.i2c.input_scanner import KeypadEvent, PowerEvent
+from Project_Theseus_API.i2c.lid_kit import COLOR, ArduinoI2C
+from Project_Theseus_API.i2c.lock_i2c import BoxLock
+from Project_Theseus_API.i2c.recorder import BusRecorder, read_log
+from Project_Theseus_API.i2c.sevenseg import SevenSeg
+from Project_Theseus_API.i2c.switches_i2c import SwitchesI2C
+from Project_Theseus_API.mockpi.fake_smbus import PCF8574, FakeSMBus, theseus_box
+from Project_Theseus_API.mockpi.smbus import MockBus
+
+FACTORIES = {
+    'arduino': ArduinoI2C,
+    'lasers': LaserControl,
+    'switches': SwitchesI2C,
+    'display': SevenSeg,
+}
+
+
+class CountingBus(FakeSMBus):
+    def __init__(self, devices):
+        super().__init__(devices)
+        self.calls = []
+
+    def write_byte(self, i2c_addr, value):
+        self.calls.append('write_byte')
+        super().write_byte(i2c_addr, value)
+
+    def read_byte(self, i2c_addr):
+        self.calls.append('read_byte')
+        return super().read_byte(i2c_addr)
+
+    def i2c_rdwr(self, *i2c_msgs):
+        self.calls.append('i2c_rdwr')
+        super().i2c_rdwr(*i2c_msgs)
+
+
+class DeafPort(PCF8574):
+    # Acknowledges its address but fails every write
+    def write(self, data: bytes):
+        raise OSError('Write failed')
+
+
+class ScanTest(unittest.TestCase):
+    def test_scan(self):
+        bus = theseus_box()
+        self.assertEqual(scan(bus), {name: True for name in DEFAULT_ADDRESSES})
+        bus.detach(0x21)
+        present = scan(bus)
+        self.assertFalse(present['receptors'])
+        self.assertTrue(present['lasers'])
+
+    def test_probe(self):
+        bus = theseus_box()
+        self.assertTrue(probe(bus, 0x39))
+        self.assertFalse(probe(bus, 0x40))
+
+    def test_through_arbiter(self):
+        arbiter = BusArbiter(theseus_box())
+        try:
+            self.assertTrue(all(scan(arbiter).values()))
+        finally:
+            arbiter.close()
+
+
+class PresenceCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, True)
+        self.cache = PresenceCache(path=os.path.join(self.dir, 'presence.json'))
+        self.bus = theseus_box()
+
+    def test_round_trip(self):
+        self.assertIsNone(self.cache.load(DEFAULT_ADDRESSES))
+        self.cache.store(DEFAULT_ADDRESSES, {'lock': True})
+        self.assertEqual(self.cache.load(DEFAULT_ADDRESSES), {'lock': True})
+        # A map of other addresses is no use
+        self.assertIsNone(self.cache.load(dict(DEFAULT_ADDRESSES, lock=0x38)))
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.load(DEFAULT_ADDRESSES))
+
+    def test_expires(self):
+        self.cache.store(DEFAULT_ADDRESSES, {'lock': True})
+        self.cache.max_age = -1
+        self.assertIsNone(self.cache.load(DEFAULT_ADDRESSES))
+
+    def test_present_devices_trusted(self):
+        discover(self.bus, cache=self.cache)
+        self.bus.detach(0x3a)
+        self.assertTrue(discover(self.bus, cache=self.cache)['lasers'])
+        self.assertFalse(discover(self.bus, cache=self.cache, rescan=True)['lasers'])
+
+    def test_absent_devices_probed_again(self):
+        lock = self.bus.devices[0x39]
+        self.bus.detach(0x39)
+        self.assertFalse(discover(self.bus, cache=self.cache)['lock'])
+        self.assertFalse(discover(self.bus, cache=self.cache)['lock'])
+        self.bus.attach(0x39, lock)
+        self.assertTrue(discover(self.bus, cache=self.cache)['lock'])
+        self.assertTrue(self.cache.load(DEFAULT_ADDRESSES)['lock'])
+
+
+class BuildDevicesTest(unittest.TestCase):
+    def test_build(self):
+        bus = CountingBus(theseus_box().devices)
+        bus.detach(0x0d)
+        devices = build_devices(bus, FACTORIES)
+        self.assertIsInstance(devices['arduino'], NullDevice)
+        self.assertFalse(devices['arduino'])
+        self.assertEqual(devices['arduino'].read_keys(), [])
+        for name in ('lasers', 'switches', 'display'):
+            self.assertIsInstance(devices[name], FACTORIES[name])
+            self.assertIs(devices[name].bus, bus)
+            self.assertIsNone(devices[name].arbiter)
+        # A probe per address, then every init write in one transaction
+        self.assertEqual(bus.calls, ['i2c_rdwr'] * (len(FACTORIES) + 1))
+        self.assertEqual(bus.devices[0x3b].latch, 0xFF)
+        self.assertTrue(bus.devices[0x70].oscillator)
+        self.assertTrue(bus.devices[0x70].display_on)
+
+    def test_failed_init_writes(self):
+        bus = theseus_box()
+        bus.attach(0x3a, DeafPort())
+        devices = build_devices(bus, FACTORIES)
+        self.assertIsInstance(devices['lasers'], NullDevice)
+        self.assertIsInstance(devices['switches'], SwitchesI2C)
+        self.assertEqual(bus.devices[0x3b].latch, 0xFF)
+
+    def test_through_arbiter(self):
+        arbiter = BusArbiter(theseus_box())
+        try:
+            devices = build_devices(arbiter, FACTORIES)
+            self.assertTrue(all(devices.values()))
+            self.assertIs(devices['lasers'].arbiter, arbiter)
+            self.assertEqual(arbiter.bus.devices[0x3a].latch, LaserControl.PORT[0])
+        finally:
+            arbiter.close()
+
+
+class NullDeviceTest(unittest.TestCase):
+    def test_values(self):
+        lock = NullDevice('lock', 0x39, BoxLock)
+        self.assertFalse(lock)
+        self.assertIs(lock.powered, False)
+        self.assertIs(lock.is_powered(0.1), False)
+        self.assertIsNone(lock.open())
+        self.assertEqual(lock.POWERED, BoxLock.POWERED)
+        arduino = NullDevice('arduino', 0x0d, ArduinoI2C)
+        self.assertEqual(arduino.keypad, [])
+        self.assertEqual(arduino.read_keys(), [])
+        self.assertEqual(arduino.color, COLOR.BLANK)
+        self.assertEqual(NullDevice('switches', 0x3b, SwitchesI2C).read_switches(), [])
+        self.assertEqual(NullDevice('switches', 0x3b, SwitchesI2C).decode(0xFF), SwitchesI2C.DECODE[0xFF])
+        lasers = NullDevice('lasers', 0x3a, LaserControl)
+        with lasers.batch():
+            lasers.mask = 0x3F
+
+    def test_results_are_copies(self):
+        arduino = NullDevice('arduino', 0x0d, ArduinoI2C)
+        arduino.keypad.append('1')
+        self.assertEqual(arduino.keypad, [])
+
+    def test_unknown_attribute(self):
+        with self.assertRaises(AttributeError):
+            NullDevice('lock', 0x39, BoxLock).keypad
+
+    def test_unknown_driver(self):
+        device = NullDevice('lock', 0x39)
+        self.assertIsNone(device.anything())
+
+
+class MissingDeviceSuiteTest(unittest.TestCase):
+    NAMES = ('arduino', 'lasers', 'display', 'switches', 'lock')
+
+    def check(self, missing):
+        bus = theseus_box()
+        bus.devices[0x0d].press('12*#')
+        for name in missing:
+            bus.detach(DEFAULT_ADDRESSES[name])
+        suite = test_suite.TestSuite(bus)
+        for name in missing:
+            self.assertIsInstance(getattr(suite, 'i2c_' + name), NullDevice)
+        self.assertEqual(len(suite.dots), 0 if 'switches' in missing else 4)
+        self.assertEqual(len(suite.rgb), 0 if 'switches' in missing else 2)
+        self.assertEqual(suite.keypress, ['0'] * 4 if 'arduino' in missing else ['0', '0', '1', '2'])
+        suite.render()
+        scanner = suite.scanner()
+        suite.update(scanner.tick())
+        suite.update([KeypadEvent('keypad', [], None, 0.0), PowerEvent('lock', True, None, 0.0)])
+        suite.press_keys(['*', '#', '3'])
+        suite.render()
+
+    def test_each_missing(self):
+        for name in self.NAMES:
+            with self.subTest(missing=name):
+                self.check([name])
+
+    def test_all_missing(self):
+        self.check(self.NAMES)
+
+
+class BatchBusTest(unittest.TestCase):
+    def test_recorded_mock_bus(self):
+        # The recorder has an i2c_rdwr, but MockBus doesn't
+        mock = MockBus('test_batch_{}'.format(os.getpid()), backend='shm')
+        self.addCleanup(MockBus.shutdown)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = os.path.join(directory, 'bus.log')
+        recorder = BusRecorder(mock, path)
+        batch = BatchBus(recorder)
+        batch.write_byte(0x3a, 0x12)
+        batch.write_byte_data(0x70, 0x02, 0x34)
+        batch.write_i2c_block_data(0x70, 0x04, [5, 6])
+        self.assertEqual(batch.flush(), set())
+        self.assertFalse(batch.rdwr)
+        self.assertEqual(mock.read_byte(0x3a), 0x12)
+        self.assertEqual(mock.read_i2c_block_data(0x70, 0x02, 4)[:4], [0x34, 0, 5, 6])
+        # Reads go straight to the bus once the writes are out
+        batch.write_byte(0x3b, 0x56)
+        self.assertEqual(batch.read_byte(0x3b), 0x56)
+        recorder.close()
+        self.assertEqual(len(list(read_log(path))), recorder.records)
+
+
+if __name__ == '__main__':
+    unittest.main()
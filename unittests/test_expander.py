@@ -0,0 +1,137 @@
+import random
+import unittest
+from threading import Barrier, Thread
+from time import monotonic, sleep
+
+from Project_Theseus_API.i2c import test_suite
+from Project_Theseus_API.i2c.bus_arbiter import BusArbiter
+from Project_Theseus_API.i2c.expander import PortExpander
+from Project_Theseus_API.i2c.lock_i2c import BoxLock
+from Project_Theseus_API.i2c.timers import TimerWheel
+from Project_Theseus_API.mockpi.fake_smbus import theseus_box
+from Project_Theseus_API.unittests.benchmarks import CountingBus
+
+
+class SharedPortTest(unittest.TestCase):
+    WRITES = 500
+
+    def test_concurrent_writers(self):
+        self.check_concurrent_writers(theseus_box())
+
+    def test_concurrent_writers_through_arbiter(self):
+        arbiter = BusArbiter(theseus_box())
+        self.addCleanup(arbiter.close)
+        self.check_concurrent_writers(arbiter)
+
+    def check_concurrent_writers(self, bus):
+        fake = bus.bus if isinstance(bus, BusArbiter) else bus
+        device = fake.devices[0x3a]
+        device_write = device.write
+        jitter = random.Random(0)
+
+        def slow_write(data):
+            # Transfers take a while, so writes from different threads land in any order
+            sleep(jitter.random() * 1e-4)
+            device_write(data)
+
+        device.write = slow_write
+        # Two drivers on one port, each owning some pins, and one that reads it
+        drivers = [PortExpander(bus, 0x3a) for _ in range(3)]
+        self.assertIs(drivers[0].port, drivers[1].port)
+        port = drivers[0].port
+        mismatches = []
+
+        def check():
+            # Both writes of the round are through, the device holds the last latch composed
+            if port.latch is not None and device.latch != port.latch:
+                mismatches.append((device.latch, port.latch))
+
+        rounds = Barrier(2, action=check)
+
+        def write(driver, mask):
+            rng = random.Random(mask)
+            for _ in range(self.WRITES):
+                rounds.wait()
+                self.assertTrue(driver.write_port(rng.getrandbits(8) & mask, mask))
+            rounds.wait()
+
+        def read(driver):
+            for _ in range(self.WRITES):
+                driver.read_port(0.001)
+
+        threads = [Thread(target=write, args=(driver, mask)) for driver, mask in zip(drivers, (0x0F, 0x30))]
+        threads.append(Thread(target=read, args=(drivers[2],)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(mismatches, [])
+        self.assertEqual(drivers[2].read_port(), port.latch)
+
+    def test_read_during_write_not_kept(self):
+        bus = theseus_box()
+        reader, writer = PortExpander(bus, 0x3a), PortExpander(bus, 0x3a)
+        device = bus.devices[0x3a]
+        read = device.read
+
+        def read_then_write(n):
+            out = read(n)
+            writer.write_port(0x00, 0x01)
+            return out
+
+        device.read = read_then_write
+        self.assertEqual(reader.read_port(60), 0xFF)
+        device.read = read
+        self.assertEqual(reader.read_port(60), 0xFE)
+
+    def test_inputs_stay_high(self):
+        bus = theseus_box()
+        output = PortExpander(bus, 0x39)
+        PortExpander.INPUTS, inputs = 0x40, PortExpander.INPUTS
+        try:
+            PortExpander(bus, 0x39)
+        finally:
+            PortExpander.INPUTS = inputs
+        output.write_port(0x00)
+        self.assertEqual(bus.devices[0x39].latch, 0x40)
+
+
+class BoxLockTest(unittest.TestCase):
+    def setUp(self):
+        self.bus = theseus_box()
+        self.timers = TimerWheel(clock=lambda: 0.0)
+        self.lock = BoxLock(self.bus, timers=self.timers)
+        self.device = self.bus.devices[0x39]
+
+    def test_open_and_close(self):
+        self.lock.open()
+        self.assertFalse(self.device.latch & BoxLock.SOLENOID)
+        self.lock.close()
+        self.assertTrue(self.device.latch & BoxLock.SOLENOID)
+
+    def test_close_always_reaches_the_solenoid(self):
+        # The device lost its latch, the cache still says closed
+        self.device.latch &= ~BoxLock.SOLENOID
+        self.lock.close()
+        self.assertTrue(self.device.latch & BoxLock.SOLENOID)
+
+
+class ScannerSharingTest(unittest.TestCase):
+    def test_consumers_reuse_scans(self):
+        bus = CountingBus(theseus_box())
+        suite = test_suite.TestSuite(bus)
+        scanner = suite.scanner()
+        now = monotonic()
+        scanner.tick(now)
+        bus.reset()
+        scanner.tick(now + scanner.period)
+        # Switches, the keypad's count byte and the lock's power pin
+        self.assertEqual(bus.transactions, 3)
+        bus.reset()
+        suite.dots, suite.rgb, suite.keypress
+        # Only the keypad, its keys aren't shared
+        self.assertEqual(bus.transactions, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from time import monotonic, sleep
+
+from Project_Theseus_API.i2c.fleet import BoxController, Fleet
+from Project_Theseus_API.i2c.lock_i2c import BoxLock
+from Project_Theseus_API.i2c.timers import default_timers
+from Project_Theseus_API.mockpi.fake_smbus import theseus_box
+
+
+def boxes(n: int = 2):
+    return [BoxController('box{}'.format(i), theseus_box, tick_rate=50, telemetry_interval=0.05) for i in range(n)]
+
+
+def wait_for(check, timeout: float = 5.0):
+    deadline = monotonic() + timeout
+    while not check():
+        if monotonic() > deadline:
+            raise AssertionError('Timed out')
+        sleep(0.01)
+
+
+class FleetTest(unittest.TestCase):
+    PROCESSES = False
+
+    def setUp(self):
+        self.fleet = Fleet(boxes(), processes=self.PROCESSES).start()
+        self.addCleanup(self.fleet.stop)
+
+    def test_call(self):
+        self.assertEqual(self.fleet.call('box0', 'press_keys', ['1', '2']), False)
+        self.assertEqual(self.fleet.call('box0', '_keypress'), ['0', '0', '1', '2'])
+        # The other box is untouched
+        self.assertEqual(self.fleet.call('box1', '_keypress'), ['0'] * 4)
+
+    def test_errors_are_raised(self):
+        with self.assertRaises(AttributeError):
+            self.fleet.call('box0', 'no_such_method')
+        with self.assertRaises(TypeError):
+            self.fleet.call('box0', 'press_keys', None)
+        # The box carries on
+        self.assertEqual(self.fleet.call('box0', 'press_keys', []), False)
+
+    def test_broadcast(self):
+        self.fleet.broadcast('press_keys', ['7'])
+        self.assertEqual(self.fleet.broadcast('_keypress'), {'box0': ['0', '0', '0', '7'], 'box1': ['0', '0', '0', '7']})
+
+    def test_telemetry(self):
+        wait_for(lambda: len(self.fleet.telemetry()) == 2)
+        stats = self.fleet.telemetry()['box0']
+        self.assertGreater(stats['ticks'], 0)
+        self.assertEqual(stats['errors'], 0)
+        self.assertGreater(stats['latency']['count'], 0)
+        self.assertEqual(self.fleet.status(), {'box0': 'running', 'box1': 'running'})
+
+    def test_stop(self):
+        self.fleet.stop()
+        self.assertEqual(self.fleet.status(), {'box0': 'stopped', 'box1': 'stopped'})
+
+
+class ProcessFleetTest(FleetTest):
+    PROCESSES = True
+
+    def test_unpicklable_result(self):
+        with self.assertRaises(RuntimeError):
+            self.fleet.call('box0', 'i2c_lock.timers')
+
+    def test_timers_run_in_workers(self):
+        self.fleet.stop()
+        # The parent's wheel is running when the workers fork, each needs one of its own
+        default_timers()
+        open_time, BoxLock.OPEN_TIME = BoxLock.OPEN_TIME, 0.1
+        try:
+            self.fleet.start()
+        finally:
+            BoxLock.OPEN_TIME = open_time
+        self.fleet.call('box0', 'i2c_lock.open')
+        self.assertTrue(self.fleet.call('box0', 'i2c_lock.timer.active'))
+        wait_for(lambda: not self.fleet.call('box0', 'i2c_lock.timer.active'), 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, logging, multiprocessing, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'elapsed': elapsed,
+    'children': len(multiprocessing.active_children()),
+    'root_handlers': len(logging.getLogger().handlers),
+}}))
+'''
+
+
+class ImportTimeTest(unittest.TestCase):
+    # Seconds a cold import may take
+    BUDGET = 0.5
+
+    @classmethod
+    def setUpClass(cls):
+        # The package is imported as Project_Theseus_API, link a checkout under another name into a directory by that
+        # name for the child interpreters
+        cls.path_dir = None
+        if os.path.basename(ROOT) == 'Project_Theseus_API':
+            cls.path = os.path.dirname(ROOT)
+            return
+        cls.path_dir = cls.path = tempfile.mkdtemp()
+        try:
+            os.symlink(ROOT, os.path.join(cls.path, 'Project_Theseus_API'), target_is_directory=True)
+        except OSError as e:
+            shutil.rmtree(cls.path_dir, ignore_errors=True)
+            raise unittest.SkipTest('Could not link the checkout as Project_Theseus_API: {}'.format(e))
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.path_dir is not None:
+            shutil.rmtree(cls.path_dir, ignore_errors=True)
+
+    def probe(self, module: str) -> dict:
+        env = dict(os.environ, PYTHONPATH=self.path)
+        out = subprocess.run([sys.executable, '-c', PROBE.format(module=module)], env=env,
+                             stdout=subprocess.PIPE, check=True).stdout
+        return json.loads(out)
+
+    def check(self, module: str):
+        result = self.probe(module)
+        self.assertLess(result['elapsed'], self.BUDGET, '{} took too long to import'.format(module))
+        self.assertEqual(result['children'], 0, '{} started processes on import'.format(module))
+        self.assertEqual(result['root_handlers'], 0, '{} configured logging on import'.format(module))
+
+    def test_i2c(self):
+        self.check('Project_Theseus_API.i2c')
+
+    def test_mockpi_smbus(self):
+        self.check('Project_Theseus_API.mockpi.smbus')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from Project_Theseus_API.i2c.input_scanner import InputScanner, ReceptorEvent
+from Project_Theseus_API.i2c.receptors_i2c import ReceptorControl
+from Project_Theseus_API.mockpi.fake_smbus import theseus_box
+from Project_Theseus_API.unittests.benchmarks import CountingBus
+
+
+class ReceptorInputTest(unittest.TestCase):
+    def setUp(self):
+        self.bus = CountingBus(theseus_box())
+        self.adc = self.bus.bus.devices[0x21]
+        for n in range(ReceptorControl.RECEPTOR_COUNT):
+            self.adc.set_receptor(n, 1000)
+        self.receptors = ReceptorControl(self.bus)
+        self.scanner = InputScanner().add_receptors(self.receptors)
+        self.bus.reset()
+
+    def tearDown(self):
+        if self.receptors.sampler is not None:
+            self.receptors.sampler.stop(1)
+
+    def test_reads_bus(self):
+        self.adc.set_receptor(0, 4000)
+        events = self.scanner.tick(0)
+        self.assertEqual(events, [ReceptorEvent('receptors', 0b100000, None, 0)])
+        self.assertEqual(self.bus.transactions, 1)
+        self.assertEqual(self.scanner.tick(self.scanner.period), [])
+
+    def test_uses_sampler(self):
+        self.adc.set_receptor(0, 4000)
+        # Samples once when it starts and not again for the rest of the test
+        self.receptors.sample(rate=0.01)
+        # Answered from the sampler's first sample
+        self.assertEqual(self.receptors.read_int(), 0b100000)
+        self.bus.reset()
+        self.adc.set_receptor(1, 4000)
+        events = self.scanner.tick(0)
+        # The scanner reports the sampler's reading and leaves the bus alone
+        self.assertEqual(self.bus.transactions, 0)
+        self.assertEqual([e.value for e in events], [0b100000])
+
+    def test_stopped_sampler(self):
+        self.receptors.sample(rate=0.01).stop(5)
+        self.adc.set_receptor(0, 4000)
+        self.bus.reset()
+        self.assertEqual([e.value for e in self.scanner.tick(0)], [0b100000])
+        self.assertEqual(self.bus.transactions, 1)
+
+if __name__ == '__main__':
+    unittest.main()
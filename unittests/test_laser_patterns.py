@@ -0,0 +1,128 @@
+import unittest
+
+from Project_Theseus_API.i2c.laser_i2c import LaserControl
+from Project_Theseus_API.i2c.laser_patterns import ALL, Pattern, PatternPlayer, chase, keyframes, random_masks, sweep
+from Project_Theseus_API.i2c.timers import TimerWheel
+from Project_Theseus_API.mockpi.fake_smbus import theseus_box
+from Project_Theseus_API.unittests.test_timers import ManualClock
+
+
+class PatternTest(unittest.TestCase):
+    def test_keyframes_merged(self):
+        pattern = keyframes([(1, 0b1), (1, 0b1), (2, 0b11), (0.5, 0b1)])
+        self.assertEqual(list(pattern.masks), [0b1, 0b11, 0b1])
+        self.assertEqual(list(pattern.offsets), [0, 2, 4])
+        self.assertEqual(pattern.duration, 4.5)
+        self.assertEqual(len(pattern), 3)
+
+    def test_mask_trimmed(self):
+        self.assertEqual(list(keyframes([(1, 0xFF)]).masks), [ALL])
+
+    def test_frame(self):
+        pattern = keyframes([(1, 0b1), (1, 0b10)])
+        for t, i in ((-1, 0), (0, 0), (0.99, 0), (1, 1), (1.5, 1), (2, 1)):
+            self.assertEqual(pattern.frame(t), i)
+
+    def test_sweep(self):
+        pattern = sweep(0.1)
+        self.assertEqual(len(pattern), ALL + 1)
+        self.assertEqual(bytes(pattern.masks), LaserControl.REVERSED)
+        self.assertAlmostEqual(pattern.duration, 6.4)
+
+    def test_chase(self):
+        self.assertEqual(list(chase(1).masks), [1, 2, 4, 8, 16, 32])
+        self.assertEqual(list(chase(1, width=2).masks), [0b11, 0b110, 0b1100, 0b11000, 0b110000, 0b100001])
+
+    def test_random_seeded(self):
+        first, second = random_masks(0.1, 50, seed=7), random_masks(0.1, 50, seed=7)
+        self.assertEqual(first.masks, second.masks)
+        self.assertEqual(first.offsets, second.offsets)
+        self.assertTrue(all(m <= ALL for m in first.masks))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            keyframes([(-1, 1)])
+        with self.assertRaises(ValueError):
+            keyframes([])
+        with self.assertRaises(ValueError):
+            keyframes([(0, 1)])
+        self.assertEqual(keyframes([(0, 1)], loop=False).duration, 0)
+
+
+class PatternPlayerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = ManualClock()
+        self.timers = TimerWheel(tick=0.25, clock=self.clock)
+        self.bus = theseus_box()
+        self.port = self.bus.devices[0x3a]
+        self.lasers = LaserControl(self.bus)
+        self.player = PatternPlayer(self.lasers, self.timers)
+
+    def advance(self, now: float):
+        self.clock.now = now
+        self.timers.advance()
+
+    def assertShows(self, mask: int):
+        self.assertEqual(self.lasers.mask, mask)
+        self.assertEqual(self.port.latch, LaserControl.PORT[mask])
+
+    def test_play(self):
+        self.player.play(keyframes([(1, 0b1), (1, 0b10)]))
+        self.assertShows(0b1)
+        self.advance(0.75)
+        self.assertShows(0b1)
+        self.advance(1.0)
+        self.assertShows(0b10)
+        self.advance(2.0)
+        self.assertShows(0b1)
+        # Frames the wheel was too late for are skipped
+        self.advance(5.0)
+        self.assertShows(0b10)
+        self.assertEqual(self.player.stats(), {'frames': 4, 'skipped': 2, 'writes': 4})
+
+    def test_stop(self):
+        self.player.play(keyframes([(1, 0b1), (1, 0b10)]))
+        self.player.stop()
+        self.assertFalse(self.player.playing)
+        self.advance(1.0)
+        self.assertShows(0b1)
+
+    def test_not_looping(self):
+        self.player.play(keyframes([(1, 0b1), (1, 0b10)], loop=False))
+        self.advance(1.0)
+        self.advance(2.0)
+        self.assertFalse(self.player.playing)
+        self.assertEqual(len(self.timers), 0)
+        self.assertShows(0b10)
+
+    def test_failed_frame_retried(self):
+        self.player.play(keyframes([(1, 0b1), (1, 0b10)]))
+        self.bus.detach(0x3a)
+        self.advance(1.0)
+        self.assertEqual(self.port.latch, LaserControl.PORT[0b1])
+        self.bus.attach(0x3a, self.port)
+        # Retried a tick later, not at the next frame
+        self.advance(1.25)
+        self.assertShows(0b10)
+        self.assertEqual(self.player.stats()['writes'], 2)
+
+    def test_failed_last_frame_retried(self):
+        self.player.play(keyframes([(1, 0b1), (1, 0b10)], loop=False))
+        self.bus.detach(0x3a)
+        self.advance(1.0)
+        self.advance(2.0)
+        self.assertTrue(self.player.playing)
+        self.bus.attach(0x3a, self.port)
+        self.advance(2.25)
+        self.assertShows(0b10)
+        self.assertFalse(self.player.playing)
+
+    def test_changed_behind_its_back(self):
+        self.player.play(keyframes([(1, 0b1), (1, 0b10)]))
+        self.lasers.mask = 0b100
+        self.advance(2.0)
+        self.assertShows(0b1)
+
+
+if __name__ == '__main__':
+    unittest.main()
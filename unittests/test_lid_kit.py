@@ -0,0 +1,97 @@
+import unittest
+
+from Project_Theseus_API.i2c.lid_kit import ArduinoI2C
+from Project_Theseus_API.mockpi.fake_smbus import LidKitArduino, theseus_box
+
+
+class KeypadTest(unittest.TestCase):
+    def setUp(self):
+        self.bus = theseus_box()
+        self.device = self.bus.devices[0x0d]
+        self.kit = ArduinoI2C(self.bus)
+
+    def test_nothing_pressed(self):
+        self.assertEqual(self.kit.read_keys(), [])
+        self.assertEqual(self.kit.keypad, [])
+
+    def test_frame(self):
+        self.device.press('12#')
+        events = self.kit.read_keys()
+        self.assertEqual([e.key for e in events], ['1', '2', '#'])
+        self.assertEqual([e.seq for e in events], [0, 1, 2])
+        self.assertEqual([e.lost for e in events], [0, 0, 0])
+        # Acked, so the Arduino has nothing left to send
+        self.assertEqual(self.device.keys, b'')
+        self.assertEqual(self.kit.read_keys(), [])
+
+    def test_frame_is_capped(self):
+        self.device.press('7' * 40)
+        first = self.kit.read_keys()
+        second = self.kit.read_keys()
+        self.assertEqual(len(first), ArduinoI2C.MAX_FRAME_KEYS)
+        self.assertEqual(len(second), 40 - ArduinoI2C.MAX_FRAME_KEYS)
+        self.assertEqual([e.seq for e in first + second], list(range(40)))
+
+    def test_seq_wraps(self):
+        for _ in range(9):
+            self.device.press('5' * 30)
+            self.assertEqual(len(self.kit.read_keys()), 30)
+        self.device.press('5')
+        events = self.kit.read_keys()
+        self.assertEqual([e.seq for e in events], [270 & 0xFF])
+        self.assertEqual(events[0].lost, 0)
+        self.assertEqual(self.kit.lost, 0)
+
+    def test_lost_keys(self):
+        self.device.press('abc')
+        self.kit.read_keys()
+        # Six more than the buffer holds, the oldest six are dropped
+        self.device.press('0123456789' * 7)
+        events = self.kit.read_keys()
+        self.assertEqual(events[0].seq, 3 + 6)
+        self.assertEqual(events[0].key, '6')
+        self.assertEqual(events[0].lost, 6)
+        self.assertEqual([e.lost for e in events[1:]], [0] * (len(events) - 1))
+        self.assertEqual(self.kit.lost, 6)
+
+    def test_lost_ack_repeats_nothing(self):
+        self.device.press('ab')
+        write = self.device.write
+        self.device.write = lambda data: None
+        self.assertEqual(self.kit.keypad, ['a', 'b'])
+        self.device.write = write
+        self.device.press('c')
+        # The frame starts with a and b again, only c is new
+        self.assertEqual(self.kit.keypad, ['c'])
+        self.assertEqual(self.kit.repeated, 2)
+        self.assertEqual(self.device.keys, b'')
+
+    def test_ack_keeps_keys_pressed_after_the_frame(self):
+        self.device.press('ab')
+        read = self.device.read
+
+        def read_then_press(n):
+            out = read(n)
+            if n > 1:
+                # Fills the buffer before the ack, a and b are dropped to make room
+                self.device.press('x' * LidKitArduino.BUFLEN)
+            return out
+
+        self.device.read = read_then_press
+        self.assertEqual(self.kit.keypad, ['a', 'b'])
+        # The ack names keys already gone, it must not drop two of the unread ones
+        self.assertEqual(len(self.device.keys), LidKitArduino.BUFLEN)
+        self.device.read = read
+        events = self.kit.read_keys()
+        self.assertEqual(events[0].seq, 2)
+        self.assertEqual(events[0].lost, 0)
+
+    def test_bus_failure(self):
+        self.device.press('1')
+        self.bus.detach(0x0d)
+        self.assertIsNone(self.kit.read_keys())
+        self.assertEqual(self.kit.keypad, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
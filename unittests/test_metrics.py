@@ -0,0 +1,73 @@
+import unittest
+
+from Project_Theseus_API.i2c.metrics import LatencyHistogram
+
+H = LatencyHistogram
+
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_exact_below_sub_count(self):
+        for value in range(H.SUB_COUNT):
+            self.assertEqual(H.index(value), value)
+            self.assertEqual(H.lower_bound(value), value)
+            self.assertEqual(H.upper_bound(value), value + 1)
+
+    def test_buckets_are_contiguous(self):
+        for i in range(H.BUCKETS - 1):
+            self.assertLess(H.lower_bound(i), H.upper_bound(i))
+            self.assertEqual(H.upper_bound(i), H.lower_bound(i + 1))
+            self.assertEqual(H.index(H.lower_bound(i)), i)
+            self.assertEqual(H.index(H.upper_bound(i) - 1), i)
+
+    def test_value_in_its_bucket(self):
+        values = [v for shift in range(47) for v in ((1 << shift) - 1, 1 << shift, 3 << shift >> 1, 12345 << shift)]
+        for value in values:
+            if value >= 1 << 48:
+                continue
+            i = H.index(value)
+            self.assertLessEqual(H.lower_bound(i), value)
+            self.assertLess(value, H.upper_bound(i))
+            # A bucket is never wider than 1 / HALF of the values in it
+            self.assertLessEqual((H.upper_bound(i) - H.lower_bound(i)) * H.HALF, max(H.lower_bound(i), H.HALF))
+
+    def test_huge_values_in_the_last_bucket(self):
+        self.assertEqual(H.index(1 << 60), H.BUCKETS - 1)
+        histogram = H()
+        histogram.record(1 << 60)
+        self.assertEqual(histogram.max, 1 << 60)
+        # Reported as the top of the range the buckets cover
+        self.assertEqual(histogram.percentile(100), H.upper_bound(H.BUCKETS - 1) - 1)
+
+    def test_record(self):
+        histogram = H()
+        for value in (5, 5, 100, 1000):
+            histogram.record(value)
+        self.assertEqual(histogram.count, 4)
+        self.assertEqual(histogram.total, 1110)
+        self.assertEqual(histogram.min, 5)
+        self.assertEqual(histogram.max, 1000)
+        self.assertEqual(histogram.buckets(), [(6, 2), (H.upper_bound(H.index(100)), 1), (1024, 1)])
+
+    def test_percentile(self):
+        histogram = H()
+        for value in range(1, 1001):
+            histogram.record(value)
+        for p in (50, 90, 99, 99.9):
+            exact = p * 10
+            self.assertGreaterEqual(histogram.percentile(p), exact)
+            self.assertLessEqual(histogram.percentile(p), exact * (1 + 1 / H.HALF))
+        self.assertEqual(histogram.percentile(100), 1000)
+        self.assertEqual(histogram.percentile(0), 1)
+
+    def test_empty(self):
+        histogram = H()
+        self.assertEqual(histogram.percentile(50), 0)
+        self.assertEqual(histogram.buckets(), [])
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 0)
+        self.assertEqual(snapshot['min_ns'], 0)
+        self.assertEqual(snapshot['mean_ns'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
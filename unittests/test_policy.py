@@ -0,0 +1,134 @@
+import unittest
+
+from Project_Theseus_API.i2c.i2c_module import I2CModule
+from Project_Theseus_API.i2c.policy import BreakerState, CircuitBreaker, DeviceUnavailable, RetryPolicy
+from Project_Theseus_API.i2c.timers import TimerWheel
+from Project_Theseus_API.mockpi.fake_smbus import theseus_box
+from Project_Theseus_API.unittests.benchmarks import CountingBus
+from Project_Theseus_API.unittests.test_timers import ManualClock
+
+
+class Port(I2CModule):
+    # Probes are far enough apart that none runs during a test
+    policy = RetryPolicy(retries=1, backoff=0, failure_threshold=2, probe_interval=60)
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_delay(self):
+        policy = RetryPolicy(backoff=0.002, max_backoff=0.005, jitter=0.5)
+        for attempt, full in ((0, 0.002), (1, 0.004), (2, 0.005), (10, 0.005)):
+            for _ in range(20):
+                delay = policy.delay(attempt)
+                self.assertLessEqual(delay, full)
+                self.assertGreaterEqual(delay, full / 2)
+
+    def test_retry_until_success(self):
+        bus = CountingBus(theseus_box())
+        device = bus.bus.devices[0x39]
+        read, failures = device.read, [OSError('Nack')]
+
+        def flaky(n):
+            if failures:
+                raise failures.pop()
+            return read(n)
+
+        device.read = flaky
+        self.assertEqual(Port(bus, 0x39).read_byte(), (True, 0xFF))
+        self.assertEqual(bus.transactions, 2)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = ManualClock()
+        self.timers = TimerWheel(tick=0.25, clock=self.clock)
+        self.up = False
+        self.states = []
+        self.breaker = CircuitBreaker(RetryPolicy(failure_threshold=3, probe_interval=1.0), 0x39, self.probe,
+                                      self.timers)
+
+    def probe(self):
+        self.states.append(self.breaker.state)
+        if not self.up:
+            raise OSError('Nack')
+
+    def advance(self, now: float):
+        self.clock.now = now
+        self.timers.advance()
+
+    def trip(self):
+        for _ in range(3):
+            self.breaker.failure(OSError('Nack'))
+
+    def test_opens_after_threshold(self):
+        self.breaker.failure(OSError('Nack'))
+        self.breaker.failure(OSError('Nack'))
+        self.assertTrue(self.breaker.allow())
+        # A success in between starts the count again
+        self.breaker.success()
+        self.breaker.failure(OSError('Nack'))
+        self.breaker.failure(OSError('Nack'))
+        self.assertIs(self.breaker.state, BreakerState.CLOSED)
+        self.breaker.failure(OSError('Nack'))
+        self.assertIs(self.breaker.state, BreakerState.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.snapshot()['trips'], 1)
+
+    def test_half_open_probe(self):
+        recovered = []
+        self.trip()
+        self.breaker.on_recover(lambda: recovered.append(self.breaker.state))
+        self.advance(0.75)
+        self.assertEqual(self.states, [])
+        self.advance(1.0)
+        # Probed half open, still down so open again and probed a second later
+        self.assertEqual(self.states, [BreakerState.HALF_OPEN])
+        self.assertIs(self.breaker.state, BreakerState.OPEN)
+        self.up = True
+        self.advance(2.0)
+        self.assertEqual(self.states, [BreakerState.HALF_OPEN] * 2)
+        self.assertIs(self.breaker.state, BreakerState.CLOSED)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.failures, 0)
+        self.assertEqual(recovered, [BreakerState.CLOSED])
+        # Recovery callbacks run once
+        self.trip()
+        self.advance(3.0)
+        self.assertEqual(recovered, [BreakerState.CLOSED])
+
+    def test_no_probe_while_closed(self):
+        self.trip()
+        self.up = True
+        self.advance(1.0)
+        self.breaker._probe()
+        self.assertEqual(len(self.states), 1)
+
+
+class SharedBreakerTest(unittest.TestCase):
+    def test_drivers_of_a_device_share_its_breaker(self):
+        bus = CountingBus(theseus_box())
+        first, second = Port(bus, 0x39), Port(bus, 0x39)
+        self.assertIs(first.breaker, second.breaker)
+        self.assertIsNot(first.breaker, Port(bus, 0x3a).breaker)
+        self.assertIsNot(first.breaker, Port(CountingBus(theseus_box()), 0x39).breaker)
+
+        bus.bus.detach(0x39)
+        for _ in range(2):
+            self.assertEqual(first.read_byte(), (False, None))
+        self.assertIs(second.breaker.state, BreakerState.OPEN)
+        bus.reset()
+        # The second driver fails fast instead of hammering the device the first one gave up on
+        with self.assertRaises(DeviceUnavailable):
+            second._call('read_byte', 0x39)
+        self.assertEqual(bus.transactions, 0)
+
+    def test_rebinding_moves_to_the_new_bus_breaker(self):
+        old, new = theseus_box(), theseus_box()
+        port = Port(old, 0x39)
+        breaker = port.breaker
+        port.bind(new)
+        self.assertIsNot(port.breaker, breaker)
+        self.assertIs(port.breaker, Port(new, 0x39).breaker)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from Project_Theseus_API.i2c.laser_i2c import LaserControl
+from Project_Theseus_API.i2c.lid_kit import ArduinoI2C, COLOR
+from Project_Theseus_API.i2c.receptors_i2c import ReceptorControl
+from Project_Theseus_API.i2c.recorder import (BusRecorder, BusReplayer, FILE_HEADER, NO_REGISTER, Op, RECORD,
+                                              ReplayMismatch, read_log)
+from Project_Theseus_API.mockpi.fake_smbus import theseus_box
+
+
+def session(bus) -> list:
+    """
+    Drive a few devices the way a game does and return what the drivers saw
+    """
+    lid_kit = ArduinoI2C(bus)
+    lasers = LaserControl(bus)
+    receptors = ReceptorControl(bus)
+    if hasattr(bus, 'devices'):
+        bus.devices[0x0d].press('12#')
+    seen = [lid_kit.keypad]
+    lid_kit.color = COLOR.GREEN
+    lasers.mask = 0b101
+    seen.append(receptors.read_raw())
+    seen.append(receptors.read_raw(2))
+    seen.append(lid_kit.keypad)
+    if hasattr(bus, 'devices'):
+        bus.detach(0x3a)
+    lasers.mask = 0b111
+    seen.append(lasers.write_port(0, force=True))
+    return seen
+
+
+class RecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'session.log')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def record(self, chunk: int = 1 << 20) -> list:
+        with BusRecorder(theseus_box(), self.path, chunk) as bus:
+            return session(bus)
+
+    def test_round_trip(self):
+        recorded = self.record()
+        self.assertEqual(recorded[0], ['1', '2', '#'])
+        replayer = BusReplayer(self.path)
+        self.assertEqual(session(replayer), recorded)
+        self.assertTrue(replayer.done)
+
+    def test_log(self):
+        # Small chunks make the log grow several times
+        self.record(chunk=64)
+        records = list(read_log(self.path))
+        self.assertEqual(os.path.getsize(self.path), FILE_HEADER.size + sum(RECORD.size + len(r.data) for r in records))
+        colour = [r for r in records if r.address == 0x0d and r.op is Op.WRITE_BYTE]
+        self.assertEqual([r.data for r in colour], [bytes((COLOR.GREEN,))])
+        self.assertEqual(colour[0].register, NO_REGISTER)
+        # Reads of the key frame go through i2c_rdwr and keep the bytes read
+        frames = [r for r in records if r.op is Op.RDWR_READ and r.length > 1]
+        self.assertEqual(frames[0].data, bytes((3, 0)) + b'12#')
+        # Writes to the missing lasers failed and still record what was sent
+        failed = [r for r in records if r.status]
+        self.assertTrue(failed)
+        self.assertTrue(all(r.address == 0x3a and r.op is Op.WRITE_BYTE and len(r.data) == 1 for r in failed))
+        self.assertEqual(sorted(r.timestamp for r in records), [r.timestamp for r in records])
+
+    def test_mismatch(self):
+        self.record()
+        replayer = BusReplayer(self.path)
+        ArduinoI2C(replayer)
+        with self.assertRaises(ReplayMismatch):
+            # The recording starts with the lasers' init write turning them all off
+            replayer.write_byte(0x3a, 0)
+        self.assertEqual(replayer.position, 0)
+
+    def test_log_ends(self):
+        self.record()
+        replayer = BusReplayer(self.path)
+        session(replayer)
+        with self.assertRaises(ReplayMismatch):
+            replayer.read_byte(0x39)
+
+    def test_not_a_log(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 32)
+        with self.assertRaises(ValueError):
+            list(read_log(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
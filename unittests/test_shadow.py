@@ -0,0 +1,71 @@
+import unittest
+
+from Project_Theseus_API.i2c.i2c_module import I2CModule
+from Project_Theseus_API.i2c.lid_kit import ArduinoI2C, COLOR
+from Project_Theseus_API.mockpi.fake_smbus import LidKitArduino, theseus_box
+from Project_Theseus_API.unittests.benchmarks import CountingBus
+
+
+class ShadowTest(unittest.TestCase):
+    def setUp(self):
+        self.bus = CountingBus(theseus_box())
+        self.ram = self.bus.bus.devices[0x70].ram
+        self.display = I2CModule(self.bus, 0x70, shadow=True)
+
+    def test_unchanged_writes_skipped(self):
+        self.assertTrue(self.display.write_reg_byte(2, 0x3F))
+        self.assertTrue(self.display.write_reg_byte(2, 0x3F))
+        self.assertTrue(self.display.write_byte(0x81))
+        self.assertTrue(self.display.write_byte(0x81))
+        self.assertEqual(self.bus.transactions, 2)
+        self.assertEqual(self.display.shadow_stats, {'hits': 2, 'misses': 2})
+        self.assertEqual(self.ram[2], 0x3F)
+
+    def test_block_trimmed_to_changes(self):
+        self.display.write_reg_bytes(0, [1, 2, 3, 4, 5, 6])
+        self.bus.reset()
+        self.display.write_reg_bytes(0, [1, 9, 3, 8, 5, 6])
+        # Only registers 1 to 3 go out, 1 and 3 changed and 2 is sent rather than splitting the write
+        self.assertEqual(self.bus.transactions, 1)
+        self.assertEqual(self.bus.bytes, 4)
+        self.assertEqual(list(self.ram[:6]), [1, 9, 3, 8, 5, 6])
+        self.display.write_reg_bytes(0, [1, 9, 3, 8, 5, 6])
+        self.assertEqual(self.bus.transactions, 1)
+
+    def test_resync(self):
+        self.display.write_reg_byte(2, 0x3F)
+        self.display.resync()
+        self.display.write_reg_byte(2, 0x3F)
+        self.assertEqual(self.bus.transactions, 2)
+
+    def test_bus_error_forgets_shadow(self):
+        self.display.write_reg_byte(2, 0x3F)
+        device = self.bus.bus.devices[0x70]
+        self.bus.bus.detach(0x70)
+        self.assertEqual(self.display.read_byte(), (False, None))
+        # The display came back from a reset with its RAM cleared
+        device.ram[:] = bytes(len(device.ram))
+        self.bus.bus.attach(0x70, device)
+        self.assertTrue(self.display.write_reg_byte(2, 0x3F))
+        self.assertEqual(device.ram[2], 0x3F)
+
+    def test_unshadowed(self):
+        display = I2CModule(self.bus, 0x70)
+        display.write_reg_byte(2, 0x3F)
+        display.write_reg_byte(2, 0x3F)
+        self.assertEqual(self.bus.transactions, 2)
+
+
+class LidKitColorTest(unittest.TestCase):
+    def test_color_after_reset(self):
+        bus = theseus_box()
+        lid_kit = ArduinoI2C(bus)
+        lid_kit.color = COLOR.RED
+        # The sketch restarts without a bus error and comes back blank
+        arduino = bus.attach(0x0d, LidKitArduino())
+        lid_kit.color = COLOR.RED
+        self.assertEqual(arduino.color, COLOR.RED)
+
+
+if __name__ == '__main__':
+    unittest.main()
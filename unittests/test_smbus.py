@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import unittest
+from multiprocessing.shared_memory import SharedMemory
+from threading import Thread
+from time import sleep
+
+from Project_Theseus_API.mockpi.smbus import MockBus, SharedMemoryRegisters
+
+
+class SharedMemoryRegistersTest(unittest.TestCase):
+    REGISTERS = 64
+
+    def setUp(self):
+        self.bus = 'test_{}'.format(os.getpid())
+        self.registers = SharedMemoryRegisters(self.bus, self.REGISTERS)
+        self.addCleanup(self.registers.close)
+
+    def test_read_write(self):
+        self.assertEqual(self.registers.read(0x21, 0, 4), [0, 0, 0, 0])
+        self.registers.write(0x21, 2, [1, 2, 3])
+        self.assertEqual(self.registers.read(0x21, 0, 6), [0, 0, 1, 2, 3, 0])
+        # Addresses don't overlap
+        self.assertEqual(self.registers.read(0x20, 0, self.REGISTERS), [0] * self.REGISTERS)
+        self.assertEqual(self.registers.read(0x22, 0, self.REGISTERS), [0] * self.REGISTERS)
+
+    def test_clipped_to_the_registers(self):
+        self.registers.write(0x10, self.REGISTERS - 2, [7, 8, 9, 10])
+        self.assertEqual(self.registers.read(0x10, self.REGISTERS - 2, 8), [7, 8])
+        self.assertEqual(self.registers.read(0x11, 0, 2), [0, 0])
+
+    def test_seq_even_after_write(self):
+        seq = self.registers.seq[0x30]
+        self.registers.write(0x30, 0, [1])
+        self.registers.write(0x30, 0, [2])
+        self.assertEqual(self.registers.seq[0x30], seq + 4)
+
+    def test_read_waits_for_writer(self):
+        self.registers.write(0x30, 0, [1, 1])
+        # A writer in another process is half way through
+        self.registers.seq[0x30] += 1
+        self.registers.regs[0x30 * self.REGISTERS] = 2
+
+        def finish():
+            sleep(0.05)
+            self.registers.regs[0x30 * self.REGISTERS + 1] = 2
+            self.registers.seq[0x30] += 1
+
+        writer = Thread(target=finish)
+        writer.start()
+        self.assertEqual(self.registers.read(0x30, 0, 2), [2, 2])
+        writer.join()
+
+    def test_shared_by_a_second_open(self):
+        other = SharedMemoryRegisters(self.bus, self.REGISTERS)
+        self.assertFalse(other.owner)
+        self.registers.write(0x40, 0, [5])
+        self.assertEqual(other.read(0x40, 0, 1), [5])
+        other.close()
+        # Only the creator unlinks the segment
+        self.assertEqual(self.registers.read(0x40, 0, 1), [5])
+
+
+def write_many(bus, address: int, value: int, n: int):
+    registers = SharedMemoryRegisters(bus, SharedMemoryRegistersTest.REGISTERS)
+    for _ in range(n):
+        registers.write(address, 0, [value] * 8)
+    registers.close()
+
+
+class CrossProcessWriteTest(unittest.TestCase):
+    WRITES = 20000
+
+    def test_writers_in_two_processes(self):
+        bus = 'test_writers_{}'.format(os.getpid())
+        registers = SharedMemoryRegisters(bus, SharedMemoryRegistersTest.REGISTERS)
+        self.addCleanup(registers.close)
+        context = multiprocessing.get_context('fork')
+        writers = [context.Process(target=write_many, args=(bus, 0x3b, value, self.WRITES)) for value in (1, 2)]
+        for writer in writers:
+            writer.start()
+        while any(writer.is_alive() for writer in writers):
+            data = registers.read(0x3b, 0, 8)
+            # Never a mix of two writes
+            self.assertEqual(len(set(data)), 1, data)
+        for writer in writers:
+            writer.join()
+            self.assertEqual(writer.exitcode, 0)
+        self.assertEqual(registers.seq[0x3b], 4 * self.WRITES)
+
+        result = []
+        reader = Thread(target=lambda: result.append(registers.read(0x3b, 0, 8)), daemon=True)
+        reader.start()
+        reader.join(5)
+        self.assertFalse(reader.is_alive(), 'Read spun on a sequence count left odd')
+        self.assertIn(result[0], ([1] * 8, [2] * 8))
+
+
+class StaleSegmentTest(unittest.TestCase):
+    def test_replaced(self):
+        bus = 'test_stale_{}'.format(os.getpid())
+        size = SharedMemoryRegisters.HEADER_SIZE + SharedMemoryRegisters.ADDRESSES * (
+                SharedMemoryRegisters.SEQ_SIZE + MockBus.REGISTERS)
+        dead = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], stdout=subprocess.PIPE,
+                              check=True)
+        # What a crashed run leaves behind: its PID and some registers
+        stale = SharedMemory('theseus_mockbus_{}'.format(bus), create=True, size=size)
+        stale.buf[:4] = int(dead.stdout).to_bytes(4, sys.byteorder)
+        stale.buf[size - 1] = 0xAA
+        stale.close()
+        with self.assertLogs('Project_Theseus_API.mockpi.smbus', 'WARNING'):
+            registers = SharedMemoryRegisters(bus, MockBus.REGISTERS)
+        try:
+            self.assertTrue(registers.owner)
+            self.assertEqual(registers.header[0], os.getpid())
+            self.assertEqual(registers.read(SharedMemoryRegisters.ADDRESSES - 1, 0, MockBus.REGISTERS),
+                             [0] * MockBus.REGISTERS)
+        finally:
+            registers.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
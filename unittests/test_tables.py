@@ -0,0 +1,56 @@
+import unittest
+
+from Project_Theseus_API.i2c.laser_i2c import LaserControl
+from Project_Theseus_API.i2c.switches_i2c import SwitchesI2C
+
+
+def bits(byte: int, n: int = 8) -> list:
+    # Bit i of byte at index i, as bitarray(endian='little') held them
+    return [bool(byte >> i & 1) for i in range(n)]
+
+
+def from_bits(array: list) -> int:
+    return sum(bit << i for i, bit in enumerate(array))
+
+
+def old_port_byte(lasers: int) -> int:
+    # LaserControl._update before the tables: invert the lasers and swap lasers 4 and 5
+    buf = [not on for on in bits(lasers, LaserControl.LASER_COUNT)]
+    buf[4], buf[5] = buf[5], buf[4]
+    return from_bits(buf)
+
+
+def old_state(lasers: int) -> int:
+    # LaserControl.state before the tables: laser 0 as the most significant bit
+    number = 0
+    for on in bits(lasers, LaserControl.LASER_COUNT):
+        number = (number << 1) | on
+    return number
+
+
+def old_decode(byte: int) -> tuple:
+    # SwitchesI2C.decode before the table
+    array = bits(byte)[2:]
+    array = array[5:6] + array[:-1]
+    return tuple(not x for x in array)
+
+
+class TablesTest(unittest.TestCase):
+    def test_port(self):
+        for lasers in range(1 << LaserControl.LASER_COUNT):
+            self.assertEqual(LaserControl.PORT[lasers], old_port_byte(lasers), bin(lasers))
+
+    def test_reversed(self):
+        for lasers in range(1 << LaserControl.LASER_COUNT):
+            self.assertEqual(LaserControl.REVERSED[lasers], old_state(lasers), bin(lasers))
+            self.assertEqual(LaserControl.REVERSED[LaserControl.REVERSED[lasers]], lasers)
+
+    def test_decode(self):
+        self.assertEqual(len(SwitchesI2C.DECODE), 256)
+        for byte in range(256):
+            self.assertEqual(SwitchesI2C.DECODE[byte], old_decode(byte), hex(byte))
+            self.assertEqual(SwitchesI2C.decode(byte), old_decode(byte))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+
+from Project_Theseus_API.i2c.timers import TimerWheel
+
+
+class ManualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TimerWheelTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = ManualClock()
+        # One turn of the wheel is 2 seconds
+        self.wheel = TimerWheel(tick=0.25, slots=8, clock=self.clock)
+        self.calls = []
+
+    def advance(self, now: float) -> int:
+        self.clock.now = now
+        return self.wheel.advance()
+
+    def test_schedule(self):
+        handle = self.wheel.schedule(1.0, self.calls.append, 'a')
+        self.assertTrue(handle.active)
+        self.assertEqual(len(self.wheel), 1)
+        self.assertEqual(self.advance(0.75), 0)
+        self.assertEqual(self.advance(1.0), 1)
+        self.assertEqual(self.calls, ['a'])
+        self.assertFalse(handle.active)
+        self.assertEqual(len(self.wheel), 0)
+        self.assertEqual(self.advance(5.0), 0)
+
+    def test_never_early(self):
+        self.wheel.schedule(0.6, self.calls.append, 'a')
+        self.advance(0.5)
+        self.assertEqual(self.calls, [])
+        self.advance(0.75)
+        self.assertEqual(self.calls, ['a'])
+
+    def test_beyond_one_turn(self):
+        self.wheel.schedule(5.0, self.calls.append, 'a')
+        for now in (1.0, 2.0, 3.0, 4.0, 4.75):
+            self.advance(now)
+        self.assertEqual(self.calls, [])
+        self.advance(5.0)
+        self.assertEqual(self.calls, ['a'])
+
+    def test_order_within_advance(self):
+        self.wheel.schedule(0.5, self.calls.append, 'a')
+        self.wheel.schedule(1.5, self.calls.append, 'b')
+        self.assertEqual(self.advance(1.5), 2)
+        self.assertEqual(self.calls, ['a', 'b'])
+
+    def test_call_every(self):
+        handle = self.wheel.call_every(1.0, self.calls.append, 'a')
+        for now in (1.0, 2.0, 3.0):
+            self.advance(now)
+        self.assertEqual(self.calls, ['a'] * 3)
+        self.assertTrue(handle.active)
+        # Calls missed during a stall are skipped, not run in a burst
+        self.advance(10.5)
+        self.assertEqual(self.calls, ['a'] * 4)
+        self.assertEqual(handle.deadline, 11.0)
+        handle.cancel()
+        self.advance(20.0)
+        self.assertEqual(len(self.calls), 4)
+
+    def test_cancel(self):
+        handle = self.wheel.schedule(1.0, self.calls.append, 'a')
+        handle.cancel()
+        self.assertFalse(handle.active)
+        self.assertEqual(len(self.wheel), 0)
+        self.advance(2.0)
+        self.assertEqual(self.calls, [])
+        # Cancelling twice is harmless
+        handle.cancel()
+
+    def test_reschedule(self):
+        handle = self.wheel.schedule(1.0, self.calls.append, 'a')
+        self.advance(0.5)
+        handle.reschedule(1.0)
+        self.advance(1.0)
+        self.assertEqual(self.calls, [])
+        self.advance(1.5)
+        self.assertEqual(self.calls, ['a'])
+        # A fired timer can be scheduled again
+        handle.reschedule(0.5)
+        self.assertTrue(handle.active)
+        self.advance(2.0)
+        self.assertEqual(self.calls, ['a', 'a'])
+
+    def test_failing_callback(self):
+        def fail():
+            raise ValueError('boom')
+
+        self.wheel.schedule(0.5, fail)
+        self.wheel.schedule(0.5, self.calls.append, 'a')
+        with self.assertLogs('Project_Theseus_API.i2c.timers', 'ERROR'):
+            self.assertEqual(self.advance(0.5), 2)
+        self.assertEqual(self.calls, ['a'])
+
+    def test_clock_going_back(self):
+        self.advance(1.0)
+        self.wheel.schedule(0.5, self.calls.append, 'a')
+        self.assertEqual(self.advance(0.5), 0)
+        self.advance(1.5)
+        self.assertEqual(self.calls, ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()